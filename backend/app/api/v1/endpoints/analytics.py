@@ -0,0 +1,183 @@
+"""
+Analytics API endpoints
+"""
+
+from datetime import date, datetime, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.core.analytics import get_referral_analytics_as_of
+from app.api.v1.endpoints.referrals import apply_referral_filters
+from app.core.auth import AuthenticatedUser, get_current_active_user, get_tenant_read_db, stats_vsa_scope
+from app.core.cache import stats_cache
+from app.core.sketches import RELATIVE_ACCURACY, merge_latency_sketches
+from app.models.analytics import referral_analytics
+from app.models.outcomes import Outcome, OutcomeStatusEnum
+from app.models.referrals import Referral, ProgramCodeEnum, PriorityLevelEnum
+from app.models.users import UserRoleEnum
+from app.schemas.analytics import ReferralAnalyticsResponse, FunnelResponse, LatencyQuantiles, LatencyResponse
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+@router.get("/referrals", response_model=ReferralAnalyticsResponse)
+async def get_referral_analytics(
+    vsa_id: Optional[str] = Query(None, description="VSA ID filter (VA admin only)"),
+    month_from: Optional[date] = Query(None, description="First month to include"),
+    month_to: Optional[date] = Query(None, description="Last month to include"),
+    program_code: Optional[ProgramCodeEnum] = Query(None, description="Filter by program code"),
+    priority_level: Optional[PriorityLevelEnum] = Query(None, description="Filter by priority level"),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_tenant_read_db)
+):
+    """
+    Get pre-aggregated referral analytics
+    
+    Served from the referral_analytics materialized view, which is refreshed
+    in the background; as_of is when that refresh happened.
+    """
+    # VA admins can view any VSA (or all of them), VSA users only their own
+    target_vsa_id = await stats_vsa_scope(current_user, vsa_id)
+    
+    try:
+        query = select(referral_analytics)
+        if target_vsa_id:
+            query = query.where(referral_analytics.c.vsa_id == target_vsa_id)
+        if month_from:
+            query = query.where(referral_analytics.c.month >= month_from.replace(day=1))
+        if month_to:
+            query = query.where(referral_analytics.c.month <= month_to.replace(day=1))
+        if program_code:
+            query = query.where(referral_analytics.c.program_code == program_code)
+        if priority_level:
+            query = query.where(referral_analytics.c.priority_level == priority_level)
+        query = query.order_by(
+            referral_analytics.c.month, referral_analytics.c.vsa_id, referral_analytics.c.program_code
+        )
+        
+        rows = (await db.execute(query)).mappings().all()
+        
+        return ReferralAnalyticsResponse(
+            rows=rows,
+            as_of=await db.run_sync(get_referral_analytics_as_of),
+            vsa_id=target_vsa_id
+        )
+        
+    except Exception as e:
+        logger.error("Failed to get referral analytics", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to get referral analytics")
+
+@router.get("/funnel", response_model=FunnelResponse)
+async def get_referral_funnel(
+    vsa_id: Optional[str] = Query(None, description="VSA ID filter (VA admin only)"),
+    bucket: Literal["week", "month"] = Query("month", description="Time bucket"),
+    issued_from: Optional[datetime] = Query(None, description="Only referrals issued at or after this time"),
+    issued_to: Optional[datetime] = Query(None, description="Only referrals issued before this time"),
+    max_staleness: Optional[int] = Query(None, ge=0, description="Accept a cached all-VSA funnel up to this many seconds old (VA admin only)"),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_tenant_read_db)
+):
+    """
+    Get the referral funnel as a time series
+    
+    For each bucket of issue dates: referrals issued, received (an outcome
+    was recorded), engaged (ENGAGED, WAITLIST or COMPLETED), completed and
+    unreachable. Computed in one aggregate query and cached per
+    (vsa_id, bucket, range) until the next write for the VSA; as_of is when
+    the numbers were computed.
+    """
+    # VA admins can view any VSA (or the whole VA), VSA users only their own
+    target_vsa_id = await stats_vsa_scope(current_user, vsa_id)
+    if current_user.role != UserRoleEnum.VA_ADMIN:
+        max_staleness = None
+    
+    async def compute():
+        period = func.date_trunc(bucket, Referral.issued_at)
+        engaged_statuses = [OutcomeStatusEnum.ENGAGED, OutcomeStatusEnum.WAITLIST, OutcomeStatusEnum.COMPLETED]
+        
+        query = apply_referral_filters(
+            select(
+                period.label("period"),
+                func.count(Referral.referral_token).label("issued"),
+                func.count(Outcome.id).label("received"),
+                func.count(Outcome.id).filter(Outcome.status.in_(engaged_statuses)).label("engaged"),
+                func.count(Outcome.id).filter(Outcome.status == OutcomeStatusEnum.COMPLETED).label("completed"),
+                func.count(Outcome.id).filter(Outcome.status == OutcomeStatusEnum.UNREACHABLE).label("unreachable"),
+            ).outerjoin(Outcome, Outcome.referral_token == Referral.referral_token),
+            vsa_id=target_vsa_id,
+            issued_from=issued_from,
+            issued_to=issued_to,
+        ).group_by(period).order_by(period)
+        
+        return FunnelResponse(
+            periods=(await db.execute(query)).mappings().all(),
+            bucket=bucket,
+            vsa_id=target_vsa_id,
+            issued_from=issued_from,
+            issued_to=issued_to,
+            as_of=datetime.now(timezone.utc)
+        )
+    
+    try:
+        return await stats_cache.get_or_compute(
+            db,
+            "referral_funnel",
+            target_vsa_id,
+            {"bucket": bucket, "issued_from": issued_from, "issued_to": issued_to},
+            compute,
+            max_staleness=max_staleness if not target_vsa_id else None
+        )
+        
+    except Exception as e:
+        logger.error("Failed to get referral funnel", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to get referral funnel")
+
+@router.get("/latency", response_model=LatencyResponse)
+async def get_latency_percentiles(
+    vsa_id: Optional[str] = Query(None, description="VSA ID filter (VA admin only)"),
+    month_from: Optional[date] = Query(None, description="First month to include"),
+    month_to: Optional[date] = Query(None, description="Last month to include"),
+    program_code: Optional[ProgramCodeEnum] = Query(None, description="Filter by program code"),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_tenant_read_db)
+):
+    """
+    Get p50/p90/p99 hours from referral issue to first contact and to close
+    
+    Merges the per (vsa_id, program_code, month) latency sketches in range,
+    so cost depends on the number of groups rather than outcomes. Values are
+    within relative_accuracy of the exact percentiles; months are the UTC
+    month the referral was issued in.
+    """
+    # VA admins can view any VSA (or the whole VA), VSA users only their own
+    target_vsa_id = await stats_vsa_scope(current_user, vsa_id)
+    
+    try:
+        sketches = await db.run_sync(
+            merge_latency_sketches, vsa_id=target_vsa_id, month_from=month_from, month_to=month_to, program_code=program_code
+        )
+        
+        def quantiles(sketch):
+            return LatencyQuantiles(
+                count=sketch.count,
+                p50=sketch.quantile(0.5),
+                p90=sketch.quantile(0.9),
+                p99=sketch.quantile(0.99)
+            )
+        
+        return LatencyResponse(
+            time_to_contact=quantiles(sketches["time_to_contact"]),
+            time_to_close=quantiles(sketches["time_to_close"]),
+            relative_accuracy=RELATIVE_ACCURACY,
+            vsa_id=target_vsa_id,
+            program_code=program_code,
+            month_from=month_from,
+            month_to=month_to
+        )
+        
+    except Exception as e:
+        logger.error("Failed to get latency percentiles", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to get latency percentiles")
@@ -0,0 +1,277 @@
+"""
+Audit log API endpoints
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.config import settings
+from app.core.audit_archive import iter_archived_entries
+from app.core.auth import AuthenticatedUser, require_va_access
+from app.core.replicas import get_read_db
+from app.models.audit_log import AuditActionEnum, AuditLog, AuditResourceEnum
+from app.schemas.audit import AuditLogEntry, AuditLogListResponse
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+# Slices stop widening here, so a busy day after a quiet month isn't sorted in one go
+MAX_SLICE = timedelta(days=1)
+# A streamed slice keeps widening until it holds about this many entries
+STREAM_SLICE_ROWS = 10000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Read timestamps without a zone as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def encode_audit_cursor(entry) -> str:
+    """Opaque keyset cursor pointing just after this entry in (changed_at, id) order"""
+    key = [entry.changed_at.isoformat(), str(entry.id)]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_audit_cursor(cursor: str) -> tuple:
+    """Inverse of encode_audit_cursor; raises ValueError on a malformed cursor"""
+    try:
+        changed_at, entry_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return as_utc(datetime.fromisoformat(changed_at)), str(uuid.UUID(entry_id))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def apply_audit_filters(
+    query,
+    table_name: Optional[AuditResourceEnum] = None,
+    record_id: Optional[str] = None,
+    changed_by: Optional[str] = None,
+    action: Optional[AuditActionEnum] = None,
+    after: Optional[tuple] = None,
+):
+    """
+    Apply the audit log filters to a query, in (changed_at, id) order
+
+    record_id is served by idx_audit_log_table_record, which leads with
+    table_name, so without one every table is searched for the record.
+    after is a decoded cursor; only entries sorting after it are kept.
+    """
+    if record_id:
+        tables = [table_name] if table_name else list(AuditResourceEnum)
+        query = query.where(
+            AuditLog.table_name.in_([table.value for table in tables]),
+            AuditLog.record_id == record_id
+        )
+    elif table_name:
+        query = query.where(AuditLog.table_name == table_name.value)
+    if changed_by:
+        query = query.where(AuditLog.changed_by == changed_by)
+    if action:
+        query = query.where(AuditLog.action == action.value)
+    if after:
+        query = query.where(
+            # The plain bound is what an index can use; the row comparison breaks ties
+            AuditLog.changed_at >= after[0],
+            tuple_(AuditLog.changed_at, AuditLog.id)
+            > tuple_(*after, types=[AuditLog.changed_at.type, AuditLog.id.type])
+        )
+    return query.order_by(AuditLog.changed_at, AuditLog.id)
+
+def audit_entry_matches(
+    entry,
+    table_name: Optional[AuditResourceEnum] = None,
+    record_id: Optional[str] = None,
+    changed_by: Optional[str] = None,
+    action: Optional[AuditActionEnum] = None,
+    after: Optional[tuple] = None,
+) -> bool:
+    """apply_audit_filters for an archived entry"""
+    return (
+        (table_name is None or entry["table_name"] == table_name.value)
+        and (record_id is None or entry["record_id"] == record_id)
+        and (changed_by is None or entry["changed_by"] == changed_by)
+        and (action is None or entry["action"] == action.value)
+        # Same order as the uuid column: lowercase hex compares bytewise
+        and (after is None or (entry["changed_at"], entry["id"]) > after)
+    )
+
+async def _stream(db: AsyncSession, query, limit: Optional[int]) -> AsyncIterator:
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.stream(query.execution_options(yield_per=1000))
+    try:
+        async for row in result.mappings():
+            yield row
+    finally:
+        await result.close()
+
+async def iter_audit_entries(
+    db: AsyncSession,
+    query,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    limit: Optional[int] = None,
+    sliced: bool = True,
+) -> AsyncIterator:
+    """
+    Yield the rows of an audit log query with changed_at in [start, end)
+
+    changed_at only has a BRIN index, which narrows a scan to the block
+    ranges of a time range but can't return rows in order. So the range is
+    read in consecutive slices, each a bounded scan sorted on its own: the
+    first covers audit_query_slice_seconds and each next one doubles while
+    they come back short, up to a day. end None leaves the last slice open.
+    Unsliced queries (record lookups, which have their own index) are one scan.
+    """
+    if not sliced:
+        if start:
+            query = query.where(AuditLog.changed_at >= start)
+        if end:
+            query = query.where(AuditLog.changed_at < end)
+        async for row in _stream(db, query, limit):
+            yield row
+        return
+
+    stop = end or datetime.now(timezone.utc)
+    window = timedelta(seconds=settings.audit_query_slice_seconds)
+    remaining = limit
+    while True:
+        upper = min(start + window, stop)
+        last = upper >= stop
+        query_slice = query.where(AuditLog.changed_at >= start)
+        if end or not last:
+            query_slice = query_slice.where(AuditLog.changed_at < upper)
+
+        count = 0
+        async for row in _stream(db, query_slice, remaining):
+            count += 1
+            yield row
+        if remaining is not None:
+            remaining -= count
+        if last or remaining == 0:
+            return
+        if count < (remaining if limit is not None else STREAM_SLICE_ROWS):
+            window = min(window * 2, MAX_SLICE)
+        start = upper
+
+async def search_audit_log(
+    db: AsyncSession,
+    query,
+    filters: dict,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    limit: Optional[int] = None,
+    sliced: bool = True,
+) -> AsyncIterator:
+    """
+    Yield the matching entries from the archive, then from audit_log
+
+    The archiver moves the oldest entries first, so everything archived
+    sorts before what is left in the table and the two read back to back
+    stay in (changed_at, id) order.
+    """
+    remaining = limit
+    async for entry in iter_archived_entries(db, start, end):
+        if audit_entry_matches(entry, **filters):
+            yield entry
+            if remaining is not None:
+                remaining -= 1
+                if remaining == 0:
+                    return
+    async for row in iter_audit_entries(db, query, start, end, remaining, sliced):
+        yield row
+
+async def stream_audit_entries(rows: AsyncIterator) -> AsyncIterator[bytes]:
+    """Render audit rows as NDJSON, a line per entry, in chunks"""
+    chunk, count = bytearray(), 0
+    try:
+        async for row in rows:
+            chunk += AuditLogEntry.model_validate(dict(row)).model_dump_json().encode() + b"\n"
+            count += 1
+            if len(chunk) >= STREAM_CHUNK_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+        if chunk:
+            yield bytes(chunk)
+        logger.info("Audit log streamed", entries=count)
+    except Exception as e:
+        # Too late for an error status; the client sees the stream cut short
+        logger.error("Failed to stream audit log", error=str(e), entries=count)
+        raise
+
+@router.get("/", response_model=AuditLogListResponse)
+async def list_audit_log(
+    table_name: Optional[AuditResourceEnum] = Query(None, description="Filter by table (or event resource)"),
+    record_id: Optional[str] = Query(None, description="Filter by record (referral token, outcome id, user id...)"),
+    changed_by: Optional[str] = Query(None, description="Filter by user id (or database login)"),
+    action: Optional[AuditActionEnum] = Query(None, description="Filter by action"),
+    changed_from: Optional[datetime] = Query(
+        None, description="Only entries at or after this time; required unless record_id is given"
+    ),
+    changed_to: Optional[datetime] = Query(None, description="Only entries before this time"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    size: int = Query(100, ge=1, le=1000, description="Page size"),
+    format: Literal["json", "ndjson"] = Query(
+        "json", description="ndjson streams every matching entry, one per line, instead of a page"
+    ),
+    current_user: AuthenticatedUser = Depends(require_va_access()),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Search the audit log (VA admin only)
+
+    Entries come oldest first, ordered by (changed_at, id). Pages are
+    keyset-based: pass next_cursor back as cursor, with the same filters.
+    A time range (changed_from) is required except for a single record's
+    history, so a search never scans the whole log. Entries moved to the
+    archive are searched too; a record's history without changed_from
+    reads every archived segment.
+    """
+    try:
+        after = None
+        if cursor:
+            try:
+                after = decode_audit_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        start = as_utc(changed_from)
+        if after and (start is None or after[0] > start):
+            start = after[0]
+        if start is None and not record_id:
+            raise HTTPException(status_code=400, detail="changed_from is required unless record_id is given")
+
+        filters = dict(
+            table_name=table_name, record_id=record_id, changed_by=changed_by, action=action, after=after
+        )
+        query = apply_audit_filters(select(AuditLog.__table__), **filters)
+
+        if format == "ndjson":
+            # db is closed once the response has been sent, not when this returns
+            rows = search_audit_log(db, query, filters, start, as_utc(changed_to), sliced=not record_id)
+            return StreamingResponse(stream_audit_entries(rows), media_type="application/x-ndjson")
+
+        rows = [
+            row async for row in
+            search_audit_log(db, query, filters, start, as_utc(changed_to), limit=size + 1, sliced=not record_id)
+        ]
+        page = [AuditLogEntry.model_validate(dict(row)) for row in rows[:size]]
+        return AuditLogListResponse(
+            entries=page,
+            size=size,
+            next_cursor=encode_audit_cursor(page[-1]) if len(rows) > size else None
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to list audit log", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to list audit log")
@@ -6,15 +6,21 @@ from datetime import datetime, timedelta
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
 import uuid
 
-from app.core.database import get_db
+from app.core.database import get_async_db
+from app.core import repository
+from app.core.audit import audit
+from app.core.replicas import get_read_db
 from app.core.auth import (
-    authenticate_user, create_access_token, get_current_active_user,
-    get_password_hash, require_role, require_va_access
+    AuthenticatedUser, authenticate_user_async, changes_token_claims, create_access_token,
+    get_current_db_user, get_password_hash_async, require_role, require_va_access,
+    revoke_user_tokens, token_claims, user_changed, verify_password_async
 )
+from app.models.audit_log import AuditActionEnum, AuditResourceEnum
 from app.models.users import User, UserRoleEnum
 from app.schemas.auth import (
     Token, UserLogin, UserCreate, UserUpdate, UserResponse, 
@@ -28,12 +34,18 @@ router = APIRouter()
 @router.post("/login", response_model=Token)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Authenticate user and return access token"""
     try:
-        user = authenticate_user(db, form_data.username, form_data.password)
+        # Password checks run on the hashing pool so a burst of logins
+        # doesn't stall other requests
+        user = await authenticate_user_async(db, form_data.username, form_data.password)
         if not user:
+            await audit(
+                AuditActionEnum.USER_LOGIN, AuditResourceEnum.USER, form_data.username,
+                changed_by=form_data.username, new_values={"success": False, "reason": "invalid credentials"}
+            )
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -41,6 +53,10 @@ async def login(
             )
         
         if not user.is_active:
+            await audit(
+                AuditActionEnum.USER_LOGIN, AuditResourceEnum.USER, user.id, user,
+                new_values={"success": False, "reason": "inactive user"}
+            )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Inactive user"
@@ -48,12 +64,13 @@ async def login(
         
         # Update last login
         user.last_login = datetime.utcnow()
-        db.commit()
+        await db.commit()
+        await audit(AuditActionEnum.USER_LOGIN, AuditResourceEnum.USER, user.id, user, new_values={"success": True})
         
         # Create access token
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
         access_token = create_access_token(
-            data={"sub": user.id}, expires_delta=access_token_expires
+            data=token_claims(user), expires_delta=access_token_expires
         )
         
         logger.info("User logged in", user_id=user.id, username=user.username, role=user.role)
@@ -77,23 +94,23 @@ async def login(
 @router.post("/users", response_model=UserResponse)
 async def create_user(
     user_data: UserCreate,
-    current_user: User = Depends(require_va_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_va_access()),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new user (VA admin only)"""
     try:
         # Check if username already exists
-        existing_user = db.query(User).filter(User.username == user_data.username).first()
+        existing_user = await repository.get_user_by_username(db, user_data.username)
         if existing_user:
             raise HTTPException(status_code=400, detail="Username already exists")
         
         # Check if email already exists
-        existing_email = db.query(User).filter(User.email == user_data.email).first()
+        existing_email = await db.scalar(select(User).where(User.email == user_data.email))
         if existing_email:
             raise HTTPException(status_code=400, detail="Email already exists")
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash_async(user_data.password)
         db_user = User(
             id=str(uuid.uuid4()),
             username=user_data.username,
@@ -109,8 +126,8 @@ async def create_user(
         )
         
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         logger.info("User created", 
                    created_by=str(current_user.id), 
@@ -122,7 +139,7 @@ async def create_user(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to create user", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to create user")
 
@@ -132,24 +149,24 @@ async def list_users(
     size: int = 100,
     role: UserRoleEnum = None,
     vsa_id: str = None,
-    current_user: User = Depends(require_va_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_va_access()),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """List users (VA admin only)"""
     try:
-        query = db.query(User)
+        query = select(User)
         
         # Apply filters
         if role:
-            query = query.filter(User.role == role)
+            query = query.where(User.role == role)
         if vsa_id:
-            query = query.filter(User.vsa_id == vsa_id)
+            query = query.where(User.vsa_id == vsa_id)
         
         # Get total count
-        total = query.count()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
         
         # Apply pagination
-        users = query.offset((page - 1) * size).limit(size).all()
+        users = (await db.scalars(query.offset((page - 1) * size).limit(size))).all()
         
         return UserListResponse(
             users=users,
@@ -164,7 +181,7 @@ async def list_users(
 
 @router.get("/users/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_db_user)
 ):
     """Get current user information"""
     return current_user
@@ -172,65 +189,81 @@ async def get_current_user_info(
 @router.put("/users/me", response_model=UserResponse)
 async def update_current_user(
     user_data: UserUpdate,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_db_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user information"""
     try:
         # Update fields
-        for field, value in user_data.dict(exclude_unset=True).items():
+        update_data = user_data.dict(exclude_unset=True)
+        if changes_token_claims(current_user, update_data):
+            revoke_user_tokens(current_user)
+        for field, value in update_data.items():
             setattr(current_user, field, value)
         
         current_user.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(current_user)
+        await db.commit()
+        await db.refresh(current_user)
+        user_changed(current_user)
         
         logger.info("User updated", user_id=current_user.id)
         return current_user
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to update user", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to update user")
 
 @router.post("/users/me/change-password")
 async def change_password(
     password_data: PasswordChange,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_db_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Change current user password"""
     try:
-        from app.core.auth import verify_password
+        user_id, current_hash = current_user.id, current_user.hashed_password
+        # Hand the connection back while bcrypt runs, as authenticate_user_async does
+        db.expunge(current_user)
+        await db.rollback()
         
         # Verify current password
-        if not verify_password(password_data.current_password, current_user.hashed_password):
+        if not await verify_password_async(password_data.current_password, current_hash):
             raise HTTPException(status_code=400, detail="Current password is incorrect")
+        new_hash = await get_password_hash_async(password_data.new_password)
+        
+        # Lock the row only to check nobody changed the password meanwhile and write
+        user = await db.get(User, user_id, with_for_update=True)
+        if user is None or user.hashed_password != current_hash:
+            raise HTTPException(status_code=409, detail="Password was changed by another request")
         
         # Update password
-        current_user.hashed_password = get_password_hash(password_data.new_password)
-        current_user.updated_at = datetime.utcnow()
-        db.commit()
+        # A new password ends every existing session, this one included
+        user.hashed_password = new_hash
+        user.updated_at = datetime.utcnow()
+        revoke_user_tokens(user)
+        await db.commit()
+        user_changed(user)
         
-        logger.info("Password changed", user_id=current_user.id)
+        logger.info("Password changed", user_id=user_id)
         return {"message": "Password changed successfully"}
         
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to change password", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to change password")
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: str,
-    current_user: User = Depends(require_va_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_va_access()),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get user by ID (VA admin only)"""
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -246,22 +279,26 @@ async def get_user(
 async def update_user(
     user_id: str,
     user_data: UserUpdate,
-    current_user: User = Depends(require_va_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_va_access()),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user by ID (VA admin only)"""
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Update fields
-        for field, value in user_data.dict(exclude_unset=True).items():
+        update_data = user_data.dict(exclude_unset=True)
+        if changes_token_claims(user, update_data):
+            revoke_user_tokens(user)
+        for field, value in update_data.items():
             setattr(user, field, value)
         
         user.updated_at = datetime.utcnow()
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        user_changed(user)
         
         logger.info("User updated by admin", 
                    admin_id=current_user.id, 
@@ -272,6 +309,6 @@ async def update_user(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to update user", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to update user")
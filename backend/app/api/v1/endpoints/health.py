@@ -2,15 +2,19 @@
 Health check endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.core.database import get_db, check_db_connection
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.core.auth import AuthenticatedUser, require_va_access
+from app.core.health import health_prober
+from app.core.pool_metrics import pool_metrics
+from app.core.query_profiler import query_profiler
 import structlog
 
 logger = structlog.get_logger()
 router = APIRouter()
 
-@router.get("/")
+@router.get("")
 async def health_check():
     """Basic health check"""
     return {
@@ -20,52 +24,77 @@ async def health_check():
     }
 
 @router.get("/db")
-async def database_health(db: Session = Depends(get_db)):
-    """Database health check"""
-    try:
-        # Test database connection
-        if check_db_connection():
-            return {
-                "status": "healthy",
-                "database": "connected",
-                "message": "Database connection successful"
-            }
-        else:
-            raise HTTPException(status_code=503, detail="Database connection failed")
-    except Exception as e:
-        logger.error("Database health check failed", error=str(e))
-        raise HTTPException(status_code=503, detail=f"Database health check failed: {str(e)}")
+async def database_health():
+    """
+    Database health check
+    
+    Served from the background prober's last result (age_seconds old), so
+    frequent load balancer probes never touch the connection pool.
+    """
+    report = health_prober.report()
+    if report["status"] in ("unknown", "stale"):
+        # Not probed yet, or the prober has stopped
+        raise HTTPException(status_code=503, detail=report["message"])
+    database = report["database"]
+    if database["status"] != "healthy":
+        raise HTTPException(status_code=503, detail=f"Database health check failed: {database['error']}")
+    return {
+        "status": "healthy",
+        "database": "connected",
+        "latency_ms": database["latency_ms"],
+        "age_seconds": report["age_seconds"]
+    }
+
+@router.get("/pool")
+async def pool_health(current_user: AuthenticatedUser = Depends(require_va_access())):
+    """
+    Connection pool state and saturation for this worker (VA admin only)
+    
+    Per pool: current size, checked out, idle and overflow connections;
+    connect, checkout, invalidation and pre-ping failure counts; checkout
+    wait times and timeouts; and connection hold times by route.
+    """
+    return {"pools": {name: metrics.snapshot() for name, metrics in pool_metrics.items()}}
+
+@router.get("/queries")
+async def query_health(
+    limit: int = Query(20, ge=1, le=200, description="Number of statements to return"),
+    order_by: Literal["total_seconds", "count", "slow", "errors", "p99_seconds"] = Query(
+        "total_seconds", description="Heaviest statements first by this measure"
+    ),
+    current_user: AuthenticatedUser = Depends(require_va_access())
+):
+    """
+    Statement fingerprints seen by this worker, heaviest first (VA admin only)
+    
+    Per fingerprint: the normalized SQL (no parameter values), executions,
+    errors, slow executions and how many were explained, and latency.
+    Sampled plans of slow statements are in query_explain_log_path.
+    """
+    return {"queries": query_profiler.top(limit, order_by)}
 
 @router.get("/detailed")
-async def detailed_health(db: Session = Depends(get_db)):
-    """Detailed health check with all system components"""
+async def detailed_health():
+    """
+    Detailed health check with all system components
+    
+    The database round trip, replica lag and pool state from the background
+    prober's last result; age_seconds says how old it is.
+    """
+    report = health_prober.report()
     health_status = {
-        "status": "healthy",
+        "status": "healthy" if report["status"] == "healthy" else "degraded",
         "service": "veteran-referral-portal-api",
         "version": "1.0.0",
+        "age_seconds": report["age_seconds"],
         "components": {}
     }
-    
-    # Check database
-    try:
-        if check_db_connection():
-            health_status["components"]["database"] = {
-                "status": "healthy",
-                "message": "Connected to PostgreSQL"
-            }
-        else:
-            health_status["components"]["database"] = {
-                "status": "unhealthy",
-                "message": "Database connection failed"
-            }
-            health_status["status"] = "degraded"
-    except Exception as e:
-        health_status["components"]["database"] = {
-            "status": "unhealthy",
-            "message": f"Database error: {str(e)}"
+    if report["status"] in ("unknown", "stale"):
+        health_status["message"] = report["message"]
+    if "database" in report:
+        health_status["components"] = {
+            "database": report["database"],
+            "replicas": report["replicas"],
+            "pools": report["pools"]
         }
-        health_status["status"] = "degraded"
-    
-    # Add more component checks here as needed
-    
     return health_status
@@ -5,16 +5,23 @@ Outcomes API endpoints
 from datetime import datetime, timedelta
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, and_, or_, cast, select, String
 import structlog
 import uuid
 
-from app.core.database import get_db
-from app.core.auth import get_current_active_user, require_vsa_access
+from app.core.audit import audit
+from app.core.auth import (
+    AuthenticatedUser, access_denied, get_current_active_user, get_tenant_db, get_tenant_read_db,
+    require_vsa_access, stats_vsa_scope
+)
+from app.core.cache import stats_cache
+from app.core import repository
+from app.core.sketches import apply_latency_changes, outcome_latencies
+from app.models.audit_log import AuditActionEnum, AuditResourceEnum
 from app.models.outcomes import Outcome, OutcomeStatusEnum, ReasonCodeEnum
 from app.models.referrals import Referral
-from app.models.users import User
+from app.models.users import UserRoleEnum
 from app.schemas.outcomes import (
     OutcomeCreate, OutcomeUpdate, OutcomeResponse, OutcomeListResponse,
     OutcomeStatsResponse, OutcomeBulkCreate, OutcomeBulkResponse
@@ -23,24 +30,41 @@ from app.schemas.outcomes import (
 logger = structlog.get_logger()
 router = APIRouter()
 
+def _status(value) -> Optional[str]:
+    return getattr(value, "value", value)
+
+async def audit_status_change(outcome: Outcome, old_status, current_user: AuthenticatedUser):
+    """Record an outcome's status change (creating one changes it from nothing)"""
+    old_status, new_status = _status(old_status), _status(outcome.status)
+    if old_status == new_status:
+        return
+    await audit(
+        AuditActionEnum.STATUS_CHANGE, AuditResourceEnum.OUTCOME, outcome.id, current_user,
+        old_values={"status": old_status} if old_status else None,
+        new_values={"status": new_status, "referral_token": str(outcome.referral_token)}
+    )
+
 @router.post("/", response_model=OutcomeResponse)
 async def create_outcome(
     outcome_data: OutcomeCreate,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_db)
 ):
     """Create a new outcome for a referral"""
     try:
         # Verify the referral exists and belongs to the VSA
-        referral = db.query(Referral).filter(Referral.referral_token == outcome_data.referral_token).first()
+        referral = await db.get(Referral, outcome_data.referral_token)
         if not referral:
             raise HTTPException(status_code=404, detail="Referral not found")
         
         if referral.vsa_id != current_user.vsa_id:
-            raise HTTPException(status_code=403, detail="Access denied - referral belongs to different VSA")
+            await access_denied(
+                current_user, "Access denied - referral belongs to different VSA",
+                AuditResourceEnum.REFERRAL, str(referral.referral_token)
+            )
         
         # Check if outcome already exists for this referral
-        existing_outcome = db.query(Outcome).filter(Outcome.referral_token == outcome_data.referral_token).first()
+        existing_outcome = await repository.get_outcome_for_referral(db, outcome_data.referral_token)
         if existing_outcome:
             raise HTTPException(status_code=400, detail="Outcome already exists for this referral")
         
@@ -58,8 +82,14 @@ async def create_outcome(
         )
         
         db.add(db_outcome)
-        db.commit()
-        db.refresh(db_outcome)
+        await db.run_sync(apply_latency_changes, [(
+            referral, None,
+            outcome_latencies(referral.issued_at, db_outcome.first_contact_at, db_outcome.closed_at)
+        )])
+        await stats_cache.bump(db, db_outcome.vsa_id)
+        await db.commit()
+        await db.refresh(db_outcome)
+        await audit_status_change(db_outcome, None, current_user)
         
         logger.info("Outcome created", 
                    outcome_id=db_outcome.id, 
@@ -72,7 +102,7 @@ async def create_outcome(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to create outcome", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to create outcome")
 
@@ -83,26 +113,28 @@ async def list_outcomes(
     status: Optional[OutcomeStatusEnum] = Query(None, description="Filter by status"),
     reason_code: Optional[ReasonCodeEnum] = Query(None, description="Filter by reason code"),
     referral_token: Optional[str] = Query(None, description="Filter by referral token"),
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_read_db)
 ):
     """List outcomes for the current VSA"""
     try:
-        query = db.query(Outcome).filter(Outcome.vsa_id == current_user.vsa_id)
+        query = select(Outcome).where(Outcome.vsa_id == current_user.vsa_id)
         
         # Apply filters
         if status:
-            query = query.filter(Outcome.status == status)
+            query = query.where(Outcome.status == status)
         if reason_code:
-            query = query.filter(Outcome.reason_code == reason_code)
+            query = query.where(Outcome.reason_code == reason_code)
         if referral_token:
-            query = query.filter(Outcome.referral_token == referral_token)
+            query = query.where(Outcome.referral_token == referral_token)
         
         # Get total count
-        total = query.count()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
         
         # Apply pagination
-        outcomes = query.order_by(Outcome.updated_at.desc()).offset((page - 1) * size).limit(size).all()
+        outcomes = (await db.scalars(
+            query.order_by(Outcome.updated_at.desc()).offset((page - 1) * size).limit(size)
+        )).all()
         
         return OutcomeListResponse(
             outcomes=outcomes,
@@ -118,15 +150,12 @@ async def list_outcomes(
 @router.get("/{outcome_id}", response_model=OutcomeResponse)
 async def get_outcome(
     outcome_id: str,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_read_db)
 ):
     """Get a specific outcome"""
     try:
-        outcome = db.query(Outcome).filter(
-            Outcome.id == outcome_id,
-            Outcome.vsa_id == current_user.vsa_id
-        ).first()
+        outcome = await repository.get_outcome(db, outcome_id, current_user.vsa_id)
         
         if not outcome:
             raise HTTPException(status_code=404, detail="Outcome not found")
@@ -143,19 +172,20 @@ async def get_outcome(
 async def update_outcome(
     outcome_id: str,
     outcome_data: OutcomeUpdate,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_db)
 ):
     """Update an outcome"""
     try:
-        outcome = db.query(Outcome).filter(
-            Outcome.id == outcome_id,
-            Outcome.vsa_id == current_user.vsa_id
-        ).first()
+        outcome = await repository.get_outcome(db, outcome_id, current_user.vsa_id)
         
         if not outcome:
             raise HTTPException(status_code=404, detail="Outcome not found")
         
+        referral = await db.get(Referral, outcome.referral_token)
+        before = outcome_latencies(referral.issued_at, outcome.first_contact_at, outcome.closed_at)
+        old_status = outcome.status
+        
         # Update fields
         update_data = outcome_data.dict(exclude_unset=True)
         for field, value in update_data.items():
@@ -164,8 +194,14 @@ async def update_outcome(
         outcome.updated_by = current_user.id
         outcome.updated_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(outcome)
+        await db.run_sync(apply_latency_changes, [(
+            referral, before,
+            outcome_latencies(referral.issued_at, outcome.first_contact_at, outcome.closed_at)
+        )])
+        await stats_cache.bump(db, outcome.vsa_id)
+        await db.commit()
+        await db.refresh(outcome)
+        await audit_status_change(outcome, old_status, current_user)
         
         logger.info("Outcome updated", 
                    outcome_id=outcome.id, 
@@ -177,26 +213,27 @@ async def update_outcome(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to update outcome", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to update outcome")
 
 @router.post("/bulk", response_model=OutcomeBulkResponse)
 async def create_bulk_outcomes(
     bulk_data: OutcomeBulkCreate,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_db)
 ):
     """Create multiple outcomes in bulk"""
     try:
         created_outcomes = []
+        latency_changes = []
         failed_count = 0
         errors = []
         
         for i, outcome_data in enumerate(bulk_data.outcomes):
             try:
                 # Verify the referral exists and belongs to the VSA
-                referral = db.query(Referral).filter(Referral.referral_token == outcome_data.referral_token).first()
+                referral = await db.get(Referral, outcome_data.referral_token)
                 if not referral:
                     errors.append(f"Row {i+1}: Referral not found")
                     failed_count += 1
@@ -204,11 +241,15 @@ async def create_bulk_outcomes(
                 
                 if referral.vsa_id != current_user.vsa_id:
                     errors.append(f"Row {i+1}: Access denied - referral belongs to different VSA")
+                    await audit(
+                        AuditActionEnum.ACCESS_DENIED, AuditResourceEnum.REFERRAL, str(referral.referral_token),
+                        current_user, new_values={"detail": "Access denied - referral belongs to different VSA"}
+                    )
                     failed_count += 1
                     continue
                 
                 # Check if outcome already exists
-                existing_outcome = db.query(Outcome).filter(Outcome.referral_token == outcome_data.referral_token).first()
+                existing_outcome = await repository.get_outcome_for_referral(db, outcome_data.referral_token)
                 if existing_outcome:
                     errors.append(f"Row {i+1}: Outcome already exists for this referral")
                     failed_count += 1
@@ -227,8 +268,11 @@ async def create_bulk_outcomes(
                     updated_by=current_user.id
                 )
                 
+                # Before the add, so a row that fails here is neither written nor counted
+                latencies = outcome_latencies(referral.issued_at, db_outcome.first_contact_at, db_outcome.closed_at)
                 db.add(db_outcome)
                 created_outcomes.append(db_outcome)
+                latency_changes.append((referral, None, latencies))
                 
             except Exception as e:
                 errors.append(f"Row {i+1}: {str(e)}")
@@ -236,10 +280,13 @@ async def create_bulk_outcomes(
         
         # Commit all successful creations
         if created_outcomes:
-            db.commit()
+            await db.run_sync(apply_latency_changes, latency_changes)
+            await stats_cache.bump(db, current_user.vsa_id)
+            await db.commit()
             # Refresh each outcome individually to avoid UUID issues
             for outcome in created_outcomes:
-                db.refresh(outcome)
+                await db.refresh(outcome)
+                await audit_status_change(outcome, None, current_user)
         
         logger.info("Bulk outcomes created", 
                    created=len(created_outcomes),
@@ -254,80 +301,100 @@ async def create_bulk_outcomes(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to create bulk outcomes", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to create bulk outcomes")
 
 @router.get("/summary/stats", response_model=OutcomeStatsResponse)
 async def get_outcome_stats(
     vsa_id: Optional[str] = Query(None, description="VSA ID filter (VA admin only)"),
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    max_staleness: Optional[int] = Query(None, ge=0, description="Accept cached all-VSA stats up to this many seconds old (VA admin only)"),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_tenant_read_db)
 ):
-    """Get outcome statistics"""
-    try:
-        # VA admins can view any VSA stats, VSA users can only view their own
-        if current_user.role == "VA_ADMIN" and vsa_id:
-            target_vsa_id = vsa_id
-        else:
-            target_vsa_id = current_user.vsa_id
-        
-        query = db.query(Outcome).filter(Outcome.vsa_id == target_vsa_id)
-        
-        # Get counts by status
-        status_stats = db.query(
-            Outcome.status,
-            func.count(Outcome.id)
-        ).filter(Outcome.vsa_id == target_vsa_id).group_by(Outcome.status).all()
-        
-        # Get counts by reason code
-        reason_stats = db.query(
-            Outcome.reason_code,
-            func.count(Outcome.id)
-        ).filter(
-            Outcome.vsa_id == target_vsa_id,
-            Outcome.reason_code.isnot(None)
-        ).group_by(Outcome.reason_code).all()
-        
-        # Get total count
-        total_outcomes = query.count()
+    """
+    Get outcome statistics
+    
+    Every outcome of the VSA is counted, as before; the times need the
+    referral's issue date, so an outcome whose referral is missing or hidden
+    by RLS counts toward the totals but not the times.
+    Results are cached until the next referral or outcome write for the VSA.
+    """
+    # VA admins can view any VSA stats (or all of them), VSA users can only view their own
+    target_vsa_id = await stats_vsa_scope(current_user, vsa_id)
+    if current_user.role != UserRoleEnum.VA_ADMIN:
+        max_staleness = None
+    
+    async def compute():
+        # Everything comes from one pass over the VSA's outcomes joined to
+        # their referrals. The join is outer so every outcome is counted even
+        # when its referral is gone or hidden by RLS; those only drop out of
+        # the timings. Enum columns are compared as text so statuses that
+        # only exist on the Python side never get cast to the database enum.
+        hours_to_contact = func.extract('epoch', Outcome.first_contact_at - Referral.issued_at) / 3600
+        hours_to_close = func.extract('epoch', Outcome.closed_at - Referral.issued_at) / 3600
+        
+        status_columns = [
+            func.count(Outcome.id).filter(cast(Outcome.status, String) == status.value)
+            for status in OutcomeStatusEnum
+        ]
+        reason_columns = [
+            func.count(Outcome.id).filter(cast(Outcome.reason_code, String) == reason.value)
+            for reason in ReasonCodeEnum
+        ]
+        
+        query = select(
+            func.count(Outcome.id),
+            *status_columns,
+            *reason_columns,
+            func.avg(hours_to_contact),
+            func.percentile_cont(0.5).within_group(hours_to_contact),
+            func.percentile_cont(0.9).within_group(hours_to_contact),
+            func.avg(hours_to_close),
+            func.percentile_cont(0.5).within_group(hours_to_close),
+            func.percentile_cont(0.9).within_group(hours_to_close),
+        ).select_from(Outcome).outerjoin(
+            Referral, Outcome.referral_token == Referral.referral_token
+        )
+        if target_vsa_id:
+            query = query.where(Outcome.vsa_id == target_vsa_id)
+        row = (await db.execute(query)).one()
         
-        # Calculate average time to contact (if first_contact_at is available)
-        avg_contact_time = None
-        contact_times = db.query(
-            func.avg(
-                func.extract('epoch', Outcome.first_contact_at - Referral.issued_at) / 3600
-            )
-        ).join(Referral, Outcome.referral_token == Referral.referral_token).filter(
-            Outcome.vsa_id == target_vsa_id,
-            Outcome.first_contact_at.isnot(None)
-        ).scalar()
-        
-        if contact_times:
-            avg_contact_time = float(contact_times)
-        
-        # Calculate average time to close (if closed_at is available)
-        avg_close_time = None
-        close_times = db.query(
-            func.avg(
-                func.extract('epoch', Outcome.closed_at - Referral.issued_at) / 3600
-            )
-        ).join(Referral, Outcome.referral_token == Referral.referral_token).filter(
-            Outcome.vsa_id == target_vsa_id,
-            Outcome.closed_at.isnot(None)
-        ).scalar()
+        values = iter(row)
+        total_outcomes = next(values)
+        status_counts = [next(values) for _ in status_columns]
+        reason_counts = [next(values) for _ in reason_columns]
+        (avg_contact_time, median_contact_time, p90_contact_time,
+         avg_close_time, median_close_time, p90_close_time) = values
         
-        if close_times:
-            avg_close_time = float(close_times)
+        def hours(value):
+            return float(value) if value is not None else None
         
         return OutcomeStatsResponse(
             total_outcomes=total_outcomes,
-            by_status=dict(status_stats),
-            by_reason=dict(reason_stats),
-            avg_time_to_contact=avg_contact_time,
-            avg_time_to_close=avg_close_time,
+            by_status={
+                status.value: count
+                for status, count in zip(OutcomeStatusEnum, status_counts) if count
+            },
+            by_reason={
+                reason.value: count
+                for reason, count in zip(ReasonCodeEnum, reason_counts) if count
+            },
+            avg_time_to_contact=hours(avg_contact_time),
+            median_time_to_contact=hours(median_contact_time),
+            p90_time_to_contact=hours(p90_contact_time),
+            avg_time_to_close=hours(avg_close_time),
+            median_time_to_close=hours(median_close_time),
+            p90_time_to_close=hours(p90_close_time),
             vsa_id=target_vsa_id
         )
+    
+    try:
+        return await stats_cache.get_or_compute(
+            db,
+            "outcome_stats", target_vsa_id, {}, compute,
+            max_staleness=max_staleness if not target_vsa_id else None
+        )
         
     except Exception as e:
         logger.error("Failed to get outcome stats", error=str(e))
@@ -336,21 +403,24 @@ async def get_outcome_stats(
 @router.get("/referral/{referral_token}", response_model=OutcomeResponse)
 async def get_outcome_by_referral(
     referral_token: str,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_read_db)
 ):
     """Get outcome for a specific referral"""
     try:
         # Verify the referral exists and belongs to the VSA
-        referral = db.query(Referral).filter(Referral.referral_token == referral_token).first()
+        referral = await repository.get_referral(db, referral_token)
         if not referral:
             raise HTTPException(status_code=404, detail="Referral not found")
         
         if referral.vsa_id != current_user.vsa_id:
-            raise HTTPException(status_code=403, detail="Access denied - referral belongs to different VSA")
+            await access_denied(
+                current_user, "Access denied - referral belongs to different VSA",
+                AuditResourceEnum.REFERRAL, str(referral.referral_token)
+            )
         
         # Get the outcome
-        outcome = db.query(Outcome).filter(Outcome.referral_token == referral_token).first()
+        outcome = await repository.get_outcome_for_referral(db, referral_token)
         if not outcome:
             raise HTTPException(status_code=404, detail="Outcome not found for this referral")
         
@@ -365,27 +435,27 @@ async def get_outcome_by_referral(
 @router.delete("/{outcome_id}")
 async def delete_outcome(
     outcome_id: str,
-    current_user: User = Depends(require_vsa_access()),
-    db: Session = Depends(get_db)
+    current_user: AuthenticatedUser = Depends(require_vsa_access()),
+    db: AsyncSession = Depends(get_tenant_db)
 ):
     """Delete an outcome (soft delete by marking as OTHER status)"""
     try:
-        outcome = db.query(Outcome).filter(
-            Outcome.id == outcome_id,
-            Outcome.vsa_id == current_user.vsa_id
-        ).first()
+        outcome = await repository.get_outcome(db, outcome_id, current_user.vsa_id)
         
         if not outcome:
             raise HTTPException(status_code=404, detail="Outcome not found")
         
         # Soft delete by changing status to OTHER
+        old_status = outcome.status
         outcome.status = OutcomeStatusEnum.OTHER
         outcome.reason_code = ReasonCodeEnum.OTHER_NONPII
         outcome.notes = f"Deleted by {current_user.username} on {datetime.utcnow().isoformat()}"
         outcome.updated_by = current_user.id
         outcome.updated_at = datetime.utcnow()
         
-        db.commit()
+        await stats_cache.bump(db, outcome.vsa_id)
+        await db.commit()
+        await audit_status_change(outcome, old_status, current_user)
         
         logger.info("Outcome soft deleted", 
                    outcome_id=outcome.id,
@@ -396,6 +466,6 @@ async def delete_outcome(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to delete outcome", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to delete outcome")
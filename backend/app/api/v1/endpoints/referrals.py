@@ -2,51 +2,100 @@
 Referrals API endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, literal_column, select, tuple_, type_coerce, Date, Integer
+from typing import List, Literal, Optional
+import base64
 import csv
 import io
+import json
 import structlog
-from datetime import datetime
+import time
+from datetime import date, datetime
 import uuid
 from uuid import UUID
 
-from app.core.database import get_db
-from app.models.referrals import Referral, ProgramCodeEnum, ReferralTypeEnum, PriorityLevelEnum
+from app.core.audit import audit
+from app.core.auth import AuthenticatedUser, get_current_active_user, get_tenant_read_db, stats_vsa_scope
+from app.core.cache import stats_cache
+from app.core import repository
+from app.core.database import get_async_db
+from app.core.metrics import request_metrics
+from app.core.replicas import get_read_db
+from app.models.audit_log import AuditActionEnum, AuditResourceEnum
+from app.models.referrals import (
+    Referral, ProgramCodeEnum, ReferralTypeEnum, PriorityLevelEnum,
+    CrisisTypeEnum, UrgencyIndicatorEnum
+)
+from app.models.rollups import ReferralMonthlyRollup
 from app.schemas.referrals import (
     ReferralCreate, ReferralResponse, ReferralListResponse, 
-    ReferralImportRequest, ReferralImportResponse
+    ReferralImportRequest, ReferralImportResponse,
+    OverdueReferralResponse, OverdueReferralListResponse
 )
 from app.core.pii_detector import detect_pii
 
 logger = structlog.get_logger()
 router = APIRouter()
 
+def apply_referral_filters(
+    query,
+    vsa_id: Optional[str] = None,
+    issued_from: Optional[datetime] = None,
+    issued_to: Optional[datetime] = None,
+    program_code: Optional[ProgramCodeEnum] = None,
+    priority_level: Optional[PriorityLevelEnum] = None,
+    crisis_type: Optional[CrisisTypeEnum] = None,
+    urgency_indicator: Optional[UrgencyIndicatorEnum] = None,
+):
+    """
+    Apply the common referral filters to a query
+    
+    vsa_id + issued_at range is served by idx_referrals_vsa_date; the
+    remaining equality filters have single-column indexes of their own.
+    The issued_at range is half-open: [issued_from, issued_to).
+    """
+    if vsa_id:
+        query = query.filter(Referral.vsa_id == vsa_id)
+    if issued_from:
+        query = query.filter(Referral.issued_at >= issued_from)
+    if issued_to:
+        query = query.filter(Referral.issued_at < issued_to)
+    if program_code:
+        query = query.filter(Referral.program_code == program_code)
+    if priority_level:
+        query = query.filter(Referral.priority_level == priority_level)
+    if crisis_type:
+        query = query.filter(Referral.crisis_type == crisis_type)
+    if urgency_indicator:
+        query = query.filter(Referral.urgency_indicator == urgency_indicator)
+    return query
+
 @router.post("/", response_model=ReferralResponse)
 async def create_referral(
     referral: ReferralCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new referral"""
     try:
         # Check if referral token already exists
-        existing = db.query(Referral).filter(Referral.referral_token == referral.referral_token).first()
+        existing = await db.get(Referral, referral.referral_token)
         if existing:
             raise HTTPException(status_code=400, detail="Referral token already exists")
         
         # Create new referral
         db_referral = Referral(**referral.dict())
         db.add(db_referral)
-        db.commit()
-        db.refresh(db_referral)
+        await stats_cache.bump(db, db_referral.vsa_id)
+        await db.commit()
+        await db.refresh(db_referral)
         
         logger.info("Referral created", referral_token=referral.referral_token, vsa_id=referral.vsa_id)
         return db_referral
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("Failed to create referral", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to create referral")
 
@@ -54,25 +103,35 @@ async def create_referral(
 async def list_referrals(
     vsa_id: str = None,
     program_code: ProgramCodeEnum = None,
-    page: int = 1,
-    size: int = 100,
-    db: Session = Depends(get_db)
+    issued_from: Optional[datetime] = Query(None, description="Only referrals issued at or after this time"),
+    issued_to: Optional[datetime] = Query(None, description="Only referrals issued before this time"),
+    priority_level: Optional[PriorityLevelEnum] = Query(None, description="Filter by priority level"),
+    crisis_type: Optional[CrisisTypeEnum] = Query(None, description="Filter by crisis type"),
+    urgency_indicator: Optional[UrgencyIndicatorEnum] = Query(None, description="Filter by urgency indicator"),
+    page: int = Query(1, ge=1, description="Page number"),
+    size: int = Query(100, ge=1, le=1000, description="Page size"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """List referrals with optional filtering"""
+    """List referrals with optional filtering, ordered by issue time"""
     try:
-        query = db.query(Referral)
-        
-        # Apply filters
-        if vsa_id:
-            query = query.filter(Referral.vsa_id == vsa_id)
-        if program_code:
-            query = query.filter(Referral.program_code == program_code)
+        query = apply_referral_filters(
+            select(Referral),
+            vsa_id=vsa_id,
+            issued_from=issued_from,
+            issued_to=issued_to,
+            program_code=program_code,
+            priority_level=priority_level,
+            crisis_type=crisis_type,
+            urgency_indicator=urgency_indicator,
+        )
         
         # Get total count
-        total = query.count()
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
         
-        # Apply pagination
-        referrals = query.offset((page - 1) * size).limit(size).all()
+        # Apply a deterministic order so pages don't overlap or skip rows
+        referrals = (await db.scalars(query.order_by(
+            Referral.issued_at, Referral.referral_token
+        ).offset((page - 1) * size).limit(size))).all()
         
         return ReferralListResponse(
             referrals=referrals,
@@ -85,14 +144,115 @@ async def list_referrals(
         logger.error("Failed to list referrals", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to list referrals")
 
+# Overdue queue sort key; matches the idx_referrals_overdue expression indexes.
+# The default is inlined rather than bound so the expression stays identical
+# to the indexed one under prepared statements.
+OVERDUE_URGENCY = func.coalesce(
+    Referral.urgency_indicator, literal_column(f"'{UrgencyIndicatorEnum.STANDARD.value}'")
+)
+
+def encode_overdue_cursor(referral: Referral) -> str:
+    """Opaque keyset cursor pointing just after this referral in the overdue queue"""
+    key = [
+        (referral.urgency_indicator or UrgencyIndicatorEnum.STANDARD).value,
+        referral.expected_contact_date.isoformat(),
+        str(referral.referral_token),
+    ]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_overdue_cursor(cursor: str) -> tuple:
+    """Inverse of encode_overdue_cursor; raises ValueError on a malformed cursor"""
+    try:
+        urgency, expected_contact_date, referral_token = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return UrgencyIndicatorEnum(urgency).value, date.fromisoformat(expected_contact_date), referral_token
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def apply_overdue_filters(
+    query,
+    vsa_id: Optional[str] = None,
+    urgency_indicator: Optional[UrgencyIndicatorEnum] = None,
+    after: Optional[tuple] = None,
+):
+    """
+    Restrict a referral query to the overdue-contact queue, in queue order
+    
+    after is a decoded cursor; only referrals sorting after it are kept.
+    """
+    query = query.filter(
+        Referral.contacted_at.is_(None),
+        Referral.expected_contact_date.isnot(None),
+        Referral.expected_contact_date < func.current_date()
+    )
+    if vsa_id:
+        query = query.filter(Referral.vsa_id == vsa_id)
+    if urgency_indicator:
+        query = query.filter(OVERDUE_URGENCY == urgency_indicator.value)
+    if after:
+        query = query.filter(
+            tuple_(OVERDUE_URGENCY, Referral.expected_contact_date, Referral.referral_token)
+            > tuple_(*after, types=[Referral.urgency_indicator.type, Date(), Referral.referral_token.type])
+        )
+    return query.order_by(OVERDUE_URGENCY, Referral.expected_contact_date, Referral.referral_token)
+
+@router.get("/overdue", response_model=OverdueReferralListResponse)
+async def list_overdue_referrals(
+    vsa_id: str = None,
+    urgency_indicator: Optional[UrgencyIndicatorEnum] = Query(None, description="Filter by urgency indicator"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    size: int = Query(100, ge=1, le=1000, description="Page size"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    List referrals past their expected contact date with no contact yet
+    
+    Ordered by urgency (most urgent first; unset counts as STANDARD), then by
+    how overdue they are. Pages are keyset-based: pass next_cursor back as
+    cursor. Served from partial indexes that only hold uncontacted referrals.
+    """
+    try:
+        after = None
+        if cursor:
+            try:
+                after = decode_overdue_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        lateness = type_coerce(func.current_date() - Referral.expected_contact_date, Integer)
+        rows = (await db.execute(apply_overdue_filters(
+            select(Referral, lateness.label("days_overdue")),
+            vsa_id=vsa_id,
+            urgency_indicator=urgency_indicator,
+            after=after,
+        ).limit(size + 1))).all()
+        
+        page = rows[:size]
+        return OverdueReferralListResponse(
+            referrals=[
+                OverdueReferralResponse(
+                    **ReferralResponse.model_validate(referral).model_dump(),
+                    days_overdue=days_overdue
+                )
+                for referral, days_overdue in page
+            ],
+            size=size,
+            next_cursor=encode_overdue_cursor(page[-1][0]) if len(rows) > size else None
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Failed to list overdue referrals", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to list overdue referrals")
+
 @router.get("/{referral_token}", response_model=ReferralResponse)
 async def get_referral(
     referral_token: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Get a specific referral by token"""
     try:
-        referral = db.query(Referral).filter(Referral.referral_token == referral_token).first()
+        referral = await repository.get_referral(db, referral_token)
         if not referral:
             raise HTTPException(status_code=404, detail="Referral not found")
         
@@ -109,9 +269,10 @@ async def import_referrals_csv(
     file: UploadFile = File(...),
     vsa_id: str = Form(...),
     import_notes: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Import referrals from CSV file"""
+    started = time.perf_counter()
     try:
         # Validate file type
         if not file.filename.endswith('.csv'):
@@ -140,6 +301,7 @@ async def import_referrals_csv(
         # Process each row
         successful_imports = 0
         failed_imports = 0
+        imported_vsa_ids = set()
         errors = []
         
         for index, row in enumerate(rows):
@@ -160,7 +322,7 @@ async def import_referrals_csv(
                     continue
                 
                 referral_data = {
-                    'referral_token': UUID(row['referral_token']),
+                    'referral_token': str(UUID(row['referral_token'])),
                     'issued_at': issued_at,
                     'vsa_id': str(row['vsa_id']),
                     'program_code': row['program_code'],
@@ -174,7 +336,7 @@ async def import_referrals_csv(
                 }
                 
                 # Check if referral already exists
-                existing = db.query(Referral).filter(Referral.referral_token == UUID(row['referral_token'])).first()
+                existing = await db.get(Referral, UUID(row['referral_token']))
                 if existing:
                     errors.append(f"Row {index + 1}: Referral token {row['referral_token']} already exists")
                     failed_imports += 1
@@ -183,6 +345,7 @@ async def import_referrals_csv(
                 # Create referral
                 db_referral = Referral(**referral_data)
                 db.add(db_referral)
+                imported_vsa_ids.add(db_referral.vsa_id)
                 successful_imports += 1
                 
             except Exception as e:
@@ -191,12 +354,27 @@ async def import_referrals_csv(
         
         # Commit all successful imports
         if successful_imports > 0:
-            db.commit()
+            await stats_cache.bump(db, *imported_vsa_ids)
+            await db.commit()
+        
+        request_metrics.record_import(
+            "csv", successful_imports, failed_imports, time.perf_counter() - started
+        )
         
         # Create import response
         import_id = str(uuid.uuid4())
         timestamp = datetime.utcnow()
         
+        await audit(
+            AuditActionEnum.CSV_IMPORT, AuditResourceEnum.REFERRAL, import_id, vsa_id=vsa_id,
+            new_values={
+                "filename": file.filename,
+                "total_rows": len(rows),
+                "successful": successful_imports,
+                "failed": failed_imports,
+            }
+        )
+        
         logger.info("CSV import completed", 
                    import_id=import_id, 
                    vsa_id=vsa_id, 
@@ -215,44 +393,147 @@ async def import_referrals_csv(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error("CSV import failed", error=str(e))
         raise HTTPException(status_code=500, detail=f"CSV import failed: {str(e)}")
 
 @router.get("/summary/stats")
 async def get_referral_stats(
     vsa_id: str = None,
-    db: Session = Depends(get_db)
+    issued_from: Optional[datetime] = Query(None, description="Only referrals issued at or after this time"),
+    issued_to: Optional[datetime] = Query(None, description="Only referrals issued before this time"),
+    bucket: Optional[Literal["day", "week", "month"]] = Query(None, description="Also break counts down by issue date"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get referral statistics"""
-    try:
-        query = db.query(Referral)
+    """
+    Get referral statistics
+    
+    Total, by-program, by-priority, by-crisis-type and (optionally) by-period
+    counts are computed in a single GROUPING SETS query over the filtered rows.
+    Results are cached until the next referral or outcome write for the VSA.
+    """
+    async def compute():
+        breakdowns = [
+            ("by_program", Referral.program_code),
+            ("by_priority", Referral.priority_level),
+            ("by_crisis_type", Referral.crisis_type),
+        ]
+        if bucket:
+            breakdowns.append(("by_period", func.date_trunc(bucket, Referral.issued_at)))
+        columns = [column for _, column in breakdowns]
         
-        if vsa_id:
-            query = query.filter(Referral.vsa_id == vsa_id)
+        query = apply_referral_filters(
+            select(*columns, func.grouping(*columns), func.count(Referral.referral_token)),
+            vsa_id=vsa_id,
+            issued_from=issued_from,
+            issued_to=issued_to,
+        ).group_by(func.grouping_sets(tuple_(), *columns))
         
-        # Get counts by program code
-        program_stats = db.query(
-            Referral.program_code,
-            func.count(Referral.referral_token)
-        ).group_by(Referral.program_code).all()
+        # grouping() sets one bit per column left out of the row's grouping set
+        # (first column = highest bit): all bits set is the grand total, and
+        # clearing a single bit identifies which breakdown the row belongs to
+        total_mask = (1 << len(columns)) - 1
+        breakdown_masks = {
+            total_mask ^ (1 << (len(columns) - 1 - position)): position
+            for position in range(len(columns))
+        }
         
-        # Get counts by priority level
-        priority_stats = db.query(
-            Referral.priority_level,
-            func.count(Referral.referral_token)
-        ).group_by(Referral.priority_level).all()
+        stats = {"total_referrals": 0}
+        stats.update({name: {} for name, _ in breakdowns})
         
-        # Get total count
-        total_referrals = query.count()
+        for *keys, grouping_mask, count in (await db.execute(query)).all():
+            if grouping_mask == total_mask:
+                stats["total_referrals"] = count
+                continue
+            position = breakdown_masks[grouping_mask]
+            key = keys[position]
+            if key is None:
+                key = "UNSPECIFIED"
+            elif isinstance(key, datetime):
+                key = key.isoformat()
+            else:
+                key = key.value
+            stats[breakdowns[position][0]][key] = count
         
         return {
-            "total_referrals": total_referrals,
-            "by_program": dict(program_stats),
-            "by_priority": dict(priority_stats),
-            "vsa_id": vsa_id
+            **stats,
+            "vsa_id": vsa_id,
+            "issued_from": issued_from,
+            "issued_to": issued_to,
+            "bucket": bucket
         }
+    
+    try:
+        return await stats_cache.get_or_compute(
+            db,
+            "referral_stats",
+            vsa_id or None,
+            {"issued_from": issued_from, "issued_to": issued_to, "bucket": bucket},
+            compute
+        )
         
     except Exception as e:
         logger.error("Failed to get referral stats", error=str(e))
         raise HTTPException(status_code=500, detail="Failed to get referral stats")
+
+@router.get("/summary/monthly")
+async def get_referral_monthly_stats(
+    vsa_id: Optional[str] = Query(None, description="VSA ID filter (VA admin only)"),
+    month_from: Optional[date] = Query(None, description="First month to include (any day in the month)"),
+    month_to: Optional[date] = Query(None, description="Last month to include (any day in the month)"),
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_tenant_read_db)
+):
+    """
+    Get referral and outcome counts from the monthly rollup
+    
+    Reads referral_rollup_monthly, which the database keeps current on every
+    write, so cost is proportional to the number of groups in range rather
+    than the number of referrals. Months are calendar months in UTC.
+    """
+    # VA admins can view any VSA (or all of them), VSA users only their own
+    vsa_id = await stats_vsa_scope(current_user, vsa_id)
+    
+    try:
+        query = select(ReferralMonthlyRollup)
+        if vsa_id:
+            query = query.filter(ReferralMonthlyRollup.vsa_id == vsa_id)
+        if month_from:
+            query = query.filter(ReferralMonthlyRollup.month >= month_from.replace(day=1))
+        if month_to:
+            query = query.filter(ReferralMonthlyRollup.month <= month_to.replace(day=1))
+        
+        statuses = ["received", "engaged", "waitlist", "completed", "unreachable", "declined"]
+        stats = {
+            "total_referrals": 0,
+            "by_program": {},
+            "by_priority": {},
+            "by_month": {},
+            "by_status": dict.fromkeys(statuses, 0),
+        }
+        contacted = 0
+        hours_to_contact = 0
+        
+        for group in (await db.scalars(query)).all():
+            month = group.month.isoformat()
+            stats["total_referrals"] += group.total_referrals
+            stats["by_program"][group.program_code.value] = stats["by_program"].get(group.program_code.value, 0) + group.total_referrals
+            stats["by_priority"][group.priority_level.value] = stats["by_priority"].get(group.priority_level.value, 0) + group.total_referrals
+            stats["by_month"][month] = stats["by_month"].get(month, 0) + group.total_referrals
+            for status in statuses:
+                stats["by_status"][status] += getattr(group, f"{status}_count")
+            contacted += group.contacted_count
+            hours_to_contact += group.hours_to_contact_sum
+        
+        return {
+            **stats,
+            "by_status": {status.upper(): count for status, count in stats["by_status"].items() if count},
+            "avg_time_to_contact": float(hours_to_contact / contacted) if contacted else None,
+            "vsa_id": vsa_id,
+            "month_from": month_from,
+            "month_to": month_to
+        }
+        
+    except Exception as e:
+        logger.error("Failed to get monthly referral stats", error=str(e))
+        raise HTTPException(status_code=500, detail="Failed to get monthly referral stats")
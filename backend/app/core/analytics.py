@@ -0,0 +1,53 @@
+"""
+Referral analytics materialized view maintenance
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+import structlog
+
+from app.config import settings
+from app.core.database import engine
+from app.models.analytics import materialized_view_refreshes
+
+logger = structlog.get_logger()
+
+def refresh_referral_analytics(db_engine: Optional[Engine] = None, min_age_seconds: Optional[float] = None) -> bool:
+    """
+    Refresh referral_analytics concurrently if no other worker is doing so
+    
+    Only one worker refreshes at a time (transaction-scoped advisory lock),
+    and a refresh is skipped when another worker completed one within
+    min_age_seconds, so N workers don't refresh N times per interval.
+    Returns True if this call refreshed the view.
+    """
+    db_engine = db_engine or engine
+    if min_age_seconds is None:
+        min_age_seconds = settings.analytics_refresh_interval_seconds * 0.9
+    
+    with db_engine.connect() as connection:
+        with connection.begin():
+            if not connection.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext('refresh_referral_analytics'))")
+            ).scalar():
+                logger.info("Referral analytics refresh already running elsewhere")
+                return False
+            
+            as_of = get_referral_analytics_as_of(connection)
+            if as_of and datetime.now(timezone.utc) - as_of < timedelta(seconds=min_age_seconds):
+                return False
+            
+            refreshed_at = connection.execute(text("SELECT refresh_referral_analytics(true)")).scalar()
+    
+    logger.info("Referral analytics refreshed", as_of=refreshed_at.isoformat())
+    return True
+
+def get_referral_analytics_as_of(connection) -> Optional[datetime]:
+    """When referral_analytics was last refreshed, or None if never recorded"""
+    return connection.execute(
+        select(materialized_view_refreshes.c.refreshed_at)
+        .where(materialized_view_refreshes.c.view_name == "referral_analytics")
+    ).scalar()
@@ -0,0 +1,231 @@
+"""
+Application audit events
+
+Logins, CSV imports, outcome status changes and access denials are
+recorded in audit_log (see database/audit.sql) without putting an INSERT
+on the request path: handlers pass events to audit_writer, which queues
+them in memory, and a background task writes them in multi-row batches
+every audit_flush_interval_ms or as soon as audit_batch_size are queued.
+
+The queue is bounded. When it is full (the database is slow or down)
+record() waits up to audit_enqueue_timeout_seconds for room and then
+writes the event itself: callers slow down instead of memory growing or
+events being lost. A batch that still can't be written after
+audit_flush_retries is logged in full, the structured log being the copy
+of last resort. The app lifespan drains the queue on shutdown.
+
+Outside the app (scripts, tests) no writer is running and events are
+written directly.
+"""
+
+import asyncio
+import ipaddress
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import insert
+import structlog
+
+from app.config import settings
+from app.core.database import async_engine
+from app.core.request_context import current_request
+from app.models.audit_log import AuditActionEnum, AuditLog, AuditResourceEnum
+
+logger = structlog.get_logger()
+
+# changed_by of events without an authenticated user (e.g. CSV imports)
+ANONYMOUS = "anonymous"
+
+def _client(context) -> tuple:
+    """IP address and user agent of the request being served"""
+    if context is None:
+        return None, None
+    ip_address = None
+    client = context.scope.get("client")
+    if client:
+        try:
+            ip_address = str(ipaddress.ip_address(client[0]))
+        except ValueError:  # e.g. "testclient"
+            pass
+    user_agent = dict(context.scope.get("headers", ())).get(b"user-agent")
+    return ip_address, user_agent.decode("latin-1") if user_agent else None
+
+def audit_event(
+    action: AuditActionEnum,
+    resource: AuditResourceEnum,
+    record_id,
+    user=None,
+    changed_by: Optional[str] = None,
+    vsa_id: Optional[str] = None,
+    old_values: Optional[dict] = None,
+    new_values: Optional[dict] = None,
+) -> dict:
+    """An audit_log row for an event happening now, stamped with the current request"""
+    context = current_request.get()
+    ip_address, user_agent = _client(context)
+    if user is not None:
+        changed_by = changed_by or user.id
+        vsa_id = vsa_id or user.vsa_id
+    return {
+        "id": str(uuid.uuid4()),
+        "changed_at": datetime.now(timezone.utc),
+        "table_name": resource.value,
+        "record_id": str(record_id)[:100],
+        "action": action.value,
+        "old_values": old_values,
+        "new_values": new_values,
+        "changed_by": (changed_by or ANONYMOUS)[:100],
+        "vsa_id": vsa_id,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "request_id": context.request_id if context is not None else None,
+    }
+
+class AuditWriter:
+    """Queues audit events and writes them in batches from a background task"""
+
+    def __init__(self, engine=None):
+        self.engine = engine if engine is not None else async_engine
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batch_ready = asyncio.Event()
+        self._batch: List[dict] = []
+        self._stopping = False
+        self.written = 0
+        self.batches = 0
+        self.direct = 0  # written by the caller: queue full, or no writer running
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """Start the background writer; call from the running event loop"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.audit_queue_size)
+        self._batch_ready = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="audit-writer")
+        logger.info("Audit writer started", queue_size=settings.audit_queue_size)
+
+    async def stop(self) -> None:
+        """Write out everything queued, then stop the background writer"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        try:
+            await asyncio.wait_for(self._queue.join(), settings.audit_drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.error("Audit queue not drained in time", pending=self.pending)
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+        unwritten = self._batch
+        while not self._queue.empty():
+            unwritten.append(self._queue.get_nowait())
+        if unwritten:
+            self._drop(unwritten, "shutdown")
+        self._task, self._queue, self._batch = None, None, []
+        logger.info("Audit writer stopped", written=self.written, dropped=self.dropped)
+
+    async def record(self, event: dict) -> None:
+        """Queue an event for writing; never raises"""
+        if not settings.audit_events_enabled:
+            return
+        if self._queue is None:
+            await self._write_direct(event)
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Backpressure: wait for the writer to make room, then do its job
+            try:
+                await asyncio.wait_for(self._queue.put(event), settings.audit_enqueue_timeout_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("Audit queue full, writing event directly", pending=self.pending)
+                await self._write_direct(event)
+                return
+        if self._queue.qsize() >= settings.audit_batch_size:
+            self._batch_ready.set()
+
+    async def _run(self) -> None:
+        while True:
+            self._batch = [await self._queue.get()]
+            if self._queue.qsize() + 1 < settings.audit_batch_size and not self._stopping:
+                # Give the batch until the flush interval to fill up
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), settings.audit_flush_interval_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            while len(self._batch) < settings.audit_batch_size and not self._queue.empty():
+                self._batch.append(self._queue.get_nowait())
+            if self._queue.qsize() < settings.audit_batch_size:
+                self._batch_ready.clear()
+
+            # Left in self._batch while writing, so stop() can log it if cancelled
+            await self._flush(self._batch)
+            for _ in self._batch:
+                self._queue.task_done()
+            self._batch = []
+
+    async def _flush(self, batch: List[dict]) -> None:
+        if not await self._write(batch, settings.audit_flush_retries):
+            self._drop(batch, "write failed")
+
+    async def _write_direct(self, event: dict) -> None:
+        if await self._write([event], 0):
+            self.direct += 1
+        else:
+            self._drop([event], "write failed")
+
+    async def _write(self, batch: List[dict], retries: int) -> bool:
+        """Insert a batch in one multi-row statement, retrying with backoff"""
+        for attempt in range(retries + 1):
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.execute(insert(AuditLog.__table__), batch)
+                self.written += len(batch)
+                self.batches += 1
+                return True
+            except Exception as e:
+                logger.warning("Audit write failed", events=len(batch), attempt=attempt + 1, error=str(e))
+                if attempt < retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        return False
+
+    def _drop(self, events: List[dict], reason: str) -> None:
+        self.dropped += len(events)
+        for event in events:
+            logger.error(
+                "Audit event not written", reason=reason,
+                **{**event, "changed_at": event["changed_at"].isoformat()}
+            )
+
+# Application-wide writer, started and stopped by the app lifespan
+audit_writer = AuditWriter()
+
+async def audit(
+    action: AuditActionEnum,
+    resource: AuditResourceEnum,
+    record_id,
+    user=None,
+    **fields
+) -> None:
+    """Record an application event (see audit_event for the fields)"""
+    await audit_writer.record(audit_event(action, resource, record_id, user, **fields))
+
+def render_audit_metrics() -> str:
+    """Audit writer metrics in the Prometheus text exposition format"""
+    lines = [
+        "# TYPE vrp_audit_queue_depth gauge",
+        f"vrp_audit_queue_depth {audit_writer.pending}",
+    ]
+    for counter in ("written", "batches", "direct", "dropped"):
+        name = f"vrp_audit_{counter}_total" if counter == "batches" else f"vrp_audit_events_{counter}_total"
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {getattr(audit_writer, counter)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,466 @@
+"""
+Write-once archive of the audit log
+
+audit_log is an ordinary table; this job moves entries older than
+audit_archive_after_days out of it into append-only segment files, on
+local disk or S3-compatible storage (audit_archive_location). A segment
+holds up to audit_archive_segment_entries entries of one UTC day, in
+(changed_at, id) order:
+
+    block 0 .. block n-1   gzip members, NDJSON, audit_archive_block_entries each
+    footer                 JSON index: per block offset, length, entries,
+                           first/last changed_at and chain hash
+    trailer                footer offset (8 bytes, big-endian) + b"VRPAUDIT"
+
+so a time-range read fetches the footer and only the blocks it needs, and
+`head -c <footer offset> segment | zcat` recovers the NDJSON with no
+tooling. Every entry extends a SHA-256 hash chain that runs across
+segments; each segment's final hash is recorded in the
+audit_archive_segments manifest (database/audit_archive.sql), which the
+next segment continues from. Editing, dropping or reordering entries, or
+removing a segment, breaks the chain; `verify` checks it.
+
+A segment is written, then recorded in the manifest and its entries
+deleted from audit_log in one transaction, so a failure leaves the entries
+in the table and at worst an unreferenced file, which verify reports.
+GET /v1/audit reads the archive and the table as one log.
+
+Run as a job:  python -m app.core.audit_archive archive
+Verify:        python -m app.core.audit_archive verify [--storage-only]
+"""
+
+import argparse
+import asyncio
+import functools
+import gzip
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, time, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.config import settings
+from app.core.database import engine
+from app.models.audit_log import AuditArchiveSegment, AuditLog
+
+logger = structlog.get_logger()
+
+SEGMENT_FORMAT = 1
+SEGMENT_MAGIC = b"VRPAUDIT"
+TRAILER = struct.Struct(">Q8s")
+GENESIS_HASH = "0" * 64
+
+class ArchiveIntegrityError(Exception):
+    """A segment doesn't match its index, its hash chain or the manifest"""
+
+class LocalArchiveStorage:
+    """Segments as read-only files in a directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def write(self, name: str, data: bytes) -> None:
+        """Store a new segment; never replaces an existing one"""
+        os.makedirs(self.root, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temporary, 0o444)
+            os.link(temporary, self._path(name))  # fails if the name is taken
+        finally:
+            os.unlink(temporary)
+
+    def read(self, name: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        with open(self._path(name), "rb") as f:
+            f.seek(offset)
+            return f.read() if length is None else f.read(length)
+
+    def names(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if name.endswith(".seg"))
+
+class S3ArchiveStorage:
+    """Segments as objects under an s3://bucket/prefix, optionally under Object Lock"""
+
+    def __init__(self, location: str):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("boto3 is required for an s3:// audit_archive_location")
+        self.bucket, _, prefix = location[len("s3://"):].partition("/")
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client(
+            "s3",
+            region_name=settings.aws_region,
+            endpoint_url=settings.audit_archive_s3_endpoint_url,
+            aws_access_key_id=settings.aws_access_key_id,
+            aws_secret_access_key=settings.aws_secret_access_key,
+        )
+
+    def write(self, name: str, data: bytes) -> None:
+        """Store a new segment; never replaces an existing one"""
+        extra = {}
+        if settings.audit_archive_object_lock_days > 0:
+            extra["ObjectLockMode"] = "COMPLIANCE"
+            extra["ObjectLockRetainUntilDate"] = (
+                datetime.now(timezone.utc) + timedelta(days=settings.audit_archive_object_lock_days)
+            )
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.prefix + name, Body=data, IfNoneMatch="*",
+            ContentType="application/octet-stream", **extra
+        )
+
+    def read(self, name: str, offset: int = 0, length: Optional[int] = None) -> bytes:
+        end = "" if length is None else offset + length - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + name, Range=f"bytes={offset}-{end}")
+        return response["Body"].read()
+
+    def names(self) -> List[str]:
+        names = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            names += [item["Key"][len(self.prefix):] for item in page.get("Contents", [])]
+        return sorted(name for name in names if name.endswith(".seg"))
+
+@functools.lru_cache(maxsize=4)
+def _storage(location: str):
+    if location.startswith("s3://"):
+        return S3ArchiveStorage(location)
+    return LocalArchiveStorage(location)
+
+def archive_storage(location: Optional[str] = None):
+    """Storage for audit_archive_location (or the given location)"""
+    return _storage(location or settings.audit_archive_location)
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:  # SQLite hands back naive UTC
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _timestamp(value: datetime) -> str:
+    return _utc(value).isoformat()
+
+def entry_line(row) -> bytes:
+    """The NDJSON line (without newline) an audit_log row is archived as"""
+    entry = {column.name: row[column.name] for column in AuditLog.__table__.columns}
+    entry["id"] = str(entry["id"])
+    entry["changed_at"] = _timestamp(entry["changed_at"])
+    if entry["ip_address"] is not None:
+        entry["ip_address"] = str(entry["ip_address"])
+    return json.dumps(entry, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+def parse_entry(line: bytes) -> dict:
+    """An archived line back as an audit_log row"""
+    entry = json.loads(line)
+    entry["changed_at"] = datetime.fromisoformat(entry["changed_at"])
+    return entry
+
+def _chain(previous: str, lines: List[bytes]) -> str:
+    digest = bytes.fromhex(previous)
+    for line in lines:
+        digest = hashlib.sha256(digest + line).digest()
+    return digest.hex()
+
+def build_segment(rows: List, previous_hash: str, block_entries: Optional[int] = None) -> tuple:
+    """Encode rows (in archive order) as a segment continuing previous_hash; returns (data, footer, footer offset)"""
+    block_entries = block_entries or settings.audit_archive_block_entries
+    data, blocks, chain = bytearray(), [], previous_hash
+    for start in range(0, len(rows), block_entries):
+        block_rows = rows[start:start + block_entries]
+        lines = [entry_line(row) for row in block_rows]
+        chain = _chain(chain, lines)
+        compressed = gzip.compress(b"".join(line + b"\n" for line in lines), mtime=0)
+        blocks.append({
+            "offset": len(data),
+            "length": len(compressed),
+            "entries": len(lines),
+            "first_changed_at": _timestamp(block_rows[0]["changed_at"]),
+            "last_changed_at": _timestamp(block_rows[-1]["changed_at"]),
+            "hash": chain,
+        })
+        data += compressed
+    footer = {
+        "format": SEGMENT_FORMAT,
+        "entries": len(rows),
+        "first_changed_at": blocks[0]["first_changed_at"],
+        "last_changed_at": blocks[-1]["last_changed_at"],
+        "previous_hash": previous_hash,
+        "hash": chain,
+        "blocks": blocks,
+    }
+    footer_offset = len(data)
+    data += json.dumps(footer, separators=(",", ":")).encode()
+    data += TRAILER.pack(footer_offset, SEGMENT_MAGIC)
+    return bytes(data), footer, footer_offset
+
+def parse_footer(data: bytes) -> tuple:
+    """(footer, footer offset) of a whole segment"""
+    if len(data) < TRAILER.size:
+        raise ArchiveIntegrityError("segment too short")
+    footer_offset, magic = TRAILER.unpack(data[-TRAILER.size:])
+    if magic != SEGMENT_MAGIC or footer_offset > len(data) - TRAILER.size:
+        raise ArchiveIntegrityError("not an audit archive segment")
+    try:
+        return json.loads(data[footer_offset:-TRAILER.size]), footer_offset
+    except ValueError as e:
+        raise ArchiveIntegrityError(f"unreadable footer: {e}")
+
+def read_footer(storage, segment: AuditArchiveSegment) -> dict:
+    """The index of a segment in the manifest, checked against it"""
+    footer = json.loads(storage.read(
+        segment.name, segment.footer_offset, segment.size_bytes - TRAILER.size - segment.footer_offset
+    ))
+    if footer["hash"] != segment.hash or footer["previous_hash"] != segment.previous_hash:
+        raise ArchiveIntegrityError(f"{segment.name}: footer doesn't match the manifest")
+    return footer
+
+def _block_lines(name: str, compressed: bytes, block: dict, previous_hash: str) -> List[bytes]:
+    try:
+        lines = gzip.decompress(compressed).splitlines()
+    except (OSError, EOFError, zlib.error) as e:
+        raise ArchiveIntegrityError(f"{name}: block at {block['offset']} unreadable: {e}")
+    if len(lines) != block["entries"] or _chain(previous_hash, lines) != block["hash"]:
+        raise ArchiveIntegrityError(f"{name}: block at {block['offset']} fails its hash chain")
+    return lines
+
+def read_block(storage, name: str, block: dict, previous_hash: str) -> List[dict]:
+    """The entries of one block, checked against its chain hash"""
+    compressed = storage.read(name, block["offset"], block["length"])
+    return [parse_entry(line) for line in _block_lines(name, compressed, block, previous_hash)]
+
+def verify_segment(name: str, data: bytes, previous_hash: Optional[str] = None) -> dict:
+    """
+    Check a whole segment against its own index and hash chain
+
+    previous_hash, when given, is the hash the segment must continue from.
+    Returns the footer; raises ArchiveIntegrityError on the first problem.
+    """
+    footer, footer_offset = parse_footer(data)
+    if previous_hash is not None and footer["previous_hash"] != previous_hash:
+        raise ArchiveIntegrityError(f"{name}: doesn't continue the previous segment's hash chain")
+    offset, chain, last_key, entries = 0, footer["previous_hash"], None, 0
+    for block in footer["blocks"]:
+        if block["offset"] != offset:
+            raise ArchiveIntegrityError(f"{name}: block index has a gap or overlap at {offset}")
+        lines = _block_lines(name, data[offset:offset + block["length"]], block, chain)
+        parsed = [parse_entry(line) for line in lines]
+        keys = [(entry["changed_at"], entry["id"]) for entry in parsed]
+        if keys != sorted(keys) or (last_key and keys[0] <= last_key):
+            raise ArchiveIntegrityError(f"{name}: entries out of order in block at {offset}")
+        if (_timestamp(keys[0][0]), _timestamp(keys[-1][0])) != (block["first_changed_at"], block["last_changed_at"]):
+            raise ArchiveIntegrityError(f"{name}: block at {offset} time range doesn't match its index")
+        offset, chain, last_key = offset + block["length"], block["hash"], keys[-1]
+        entries += len(lines)
+    if offset != footer_offset or chain != footer["hash"] or entries != footer["entries"]:
+        raise ArchiveIntegrityError(f"{name}: footer doesn't match the blocks")
+    return footer
+
+def segment_name(sequence: int, first_changed_at: datetime) -> str:
+    return f"audit-{sequence:010d}-{_utc(first_changed_at):%Y%m%dT%H%M%S}Z-{uuid.uuid4().hex[:8]}.seg"
+
+def _next_day(value: datetime) -> datetime:
+    value = _utc(value)
+    return datetime.combine(value.date() + timedelta(days=1), time.min, tzinfo=timezone.utc)
+
+def _archive_segment(db_engine: Engine, storage, cutoff: datetime) -> Optional[str]:
+    """Archive the oldest day's entries (up to a segment) before cutoff; None when there are none"""
+    with db_engine.connect() as connection:
+        with connection.begin():
+            if connection.dialect.name == "postgresql" and not connection.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext('archive_audit_log'))")
+            ).scalar():
+                logger.info("Audit log archiving already running elsewhere")
+                return None
+
+            head = connection.execute(
+                select(AuditArchiveSegment.__table__).order_by(AuditArchiveSegment.sequence.desc()).limit(1)
+            ).first()
+            # Everything before the last archived entry is gone from the table
+            start = head.last_changed_at if head else connection.execute(
+                select(func.min(AuditLog.changed_at)).where(AuditLog.changed_at < cutoff)
+            ).scalar()
+            if start is None:
+                return None
+            start = _utc(start)
+
+            # Segments don't span UTC days, and each query stays a bounded range scan
+            rows = []
+            while not rows and start < cutoff:
+                end = min(_next_day(start), cutoff)
+                rows = connection.execute(
+                    select(AuditLog.__table__)
+                    .where(AuditLog.changed_at >= start, AuditLog.changed_at < end)
+                    .order_by(AuditLog.changed_at, AuditLog.id)
+                    .limit(settings.audit_archive_segment_entries)
+                ).mappings().all()
+                start = end
+            if not rows:
+                return None
+
+            sequence = head.sequence + 1 if head else 1
+            data, footer, footer_offset = build_segment(rows, head.hash if head else GENESIS_HASH)
+            name = segment_name(sequence, rows[0]["changed_at"])
+            storage.write(name, data)
+
+            connection.execute(insert(AuditArchiveSegment.__table__).values(
+                sequence=sequence,
+                name=name,
+                first_changed_at=rows[0]["changed_at"],
+                last_changed_at=rows[-1]["changed_at"],
+                entries=len(rows),
+                size_bytes=len(data),
+                footer_offset=footer_offset,
+                previous_hash=footer["previous_hash"],
+                hash=footer["hash"],
+            ))
+            deleted = 0
+            block_entries = settings.audit_archive_block_entries
+            for first in range(0, len(rows), block_entries):
+                block_rows = rows[first:first + block_entries]
+                deleted += connection.execute(delete(AuditLog.__table__).where(
+                    AuditLog.changed_at >= block_rows[0]["changed_at"],
+                    AuditLog.changed_at <= block_rows[-1]["changed_at"],
+                    AuditLog.id.in_([row["id"] for row in block_rows])
+                )).rowcount
+            if deleted != len(rows):
+                raise ArchiveIntegrityError(f"{name}: archived {len(rows)} entries but deleted {deleted}")
+
+    logger.info("Audit log segment archived", segment=name, entries=len(rows))
+    return name
+
+def archive_audit_log(db_engine: Optional[Engine] = None, storage=None, now: Optional[datetime] = None) -> List[str]:
+    """Move entries older than audit_archive_after_days into new segments; returns their names"""
+    if settings.audit_archive_after_days <= 0:
+        return []
+    db_engine = db_engine or engine
+    storage = storage or archive_storage()
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=settings.audit_archive_after_days)
+
+    names = []
+    while len(names) < settings.audit_archive_max_segments_per_run:
+        name = _archive_segment(db_engine, storage, cutoff)
+        if name is None:
+            break
+        names.append(name)
+    return names
+
+async def iter_archived_entries(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    storage=None,
+) -> AsyncIterator[dict]:
+    """
+    Yield archived entries with changed_at in [start, end), in (changed_at, id) order
+
+    Only the segments and blocks overlapping the range are read, each
+    checked against its chain hash. They all precede what is left in
+    audit_log. No start reads from the first segment.
+    """
+    query = select(AuditArchiveSegment).order_by(AuditArchiveSegment.sequence)
+    if start:
+        query = query.where(AuditArchiveSegment.last_changed_at >= start)
+    if end:
+        query = query.where(AuditArchiveSegment.first_changed_at < end)
+    segments = (await db.scalars(query)).all()
+    if not segments:
+        return
+    storage = storage or archive_storage()
+
+    for segment in segments:
+        footer = await asyncio.to_thread(read_footer, storage, segment)
+        previous_hash = footer["previous_hash"]
+        for block in footer["blocks"]:
+            if (start is None or datetime.fromisoformat(block["last_changed_at"]) >= start) and (
+                end is None or datetime.fromisoformat(block["first_changed_at"]) < end
+            ):
+                for entry in await asyncio.to_thread(read_block, storage, segment.name, block, previous_hash):
+                    if (start is None or entry["changed_at"] >= start) and (end is None or entry["changed_at"] < end):
+                        yield entry
+            previous_hash = block["hash"]
+
+def verify_archive(storage, segments: Optional[List] = None) -> Dict[str, List[str]]:
+    """
+    Verify every segment and the hash chain between them
+
+    segments is the manifest, in order; without it the segments in storage
+    are checked in name (= archive) order. Returns the names verified and a
+    list of problems (empty when the archive is intact).
+    """
+    names = storage.names()
+    problems, verified = [], []
+    if segments is None:
+        expected = [(name, None) for name in names]
+    else:
+        expected = [(segment.name, segment) for segment in segments]
+        listed = set(names)
+        problems += [f"{segment.name}: in the manifest but missing from storage" for segment in segments
+                     if segment.name not in listed]
+        known = {segment.name for segment in segments}
+        problems += [f"{name}: in storage but not in the manifest (left by a failed run?)"
+                     for name in names if name not in known]
+
+    previous_hash = GENESIS_HASH if segments is not None else None
+    for name, segment in expected:
+        if segment is not None and name not in names:
+            previous_hash = segment.hash
+            continue
+        try:
+            footer = verify_segment(name, storage.read(name), previous_hash)
+            if segment is not None and (
+                footer["hash"], footer["entries"], footer["previous_hash"]
+            ) != (segment.hash, segment.entries, segment.previous_hash):
+                raise ArchiveIntegrityError(f"{name}: doesn't match its manifest entry")
+            verified.append(name)
+            previous_hash = footer["hash"]
+        except ArchiveIntegrityError as e:
+            problems.append(str(e))
+            previous_hash = segment.hash if segment is not None else None
+    return {"verified": verified, "problems": problems}
+
+def main(argv=None) -> int:
+    """Archive job and verification entry point"""
+    parser = argparse.ArgumentParser(description="Audit log archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("archive", help="Archive entries older than audit_archive_after_days")
+    verify = commands.add_parser("verify", help="Verify segments and their hash chain")
+    verify.add_argument("--location", help="Archive location (default: audit_archive_location)")
+    verify.add_argument("--storage-only", action="store_true", help="Don't check against the manifest")
+    args = parser.parse_args(argv)
+
+    if args.command == "archive":
+        names = archive_audit_log()
+        print(f"archived {len(names)} segment(s)" + "".join(f"\n  {name}" for name in names))
+        return 0
+
+    storage = archive_storage(args.location)
+    segments = None
+    if not args.storage_only:
+        with engine.connect() as connection:
+            segments = connection.execute(
+                select(AuditArchiveSegment.__table__).order_by(AuditArchiveSegment.sequence)
+            ).all()
+    report = verify_archive(storage, segments)
+    print(f"verified {len(report['verified'])} segment(s)")
+    for problem in report["problems"]:
+        print(f"FAIL {problem}")
+    return 1 if report["problems"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,16 +2,30 @@
 Authentication and authorization core functionality
 """
 
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional, Union
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import structlog
 
-from app.core.database import get_db
+from app.core.cache import TTLCache
+from app.core import repository
+from app.core.audit import audit
+from app.core.database import get_async_db
+from app.core.replicas import get_read_db
+from app.core.request_context import current_route
+from app.core.revocations import token_revocations
+from app.core.rls import set_rls_context
+from app.models.audit_log import AuditActionEnum, AuditResourceEnum
 from app.models.users import User, UserRoleEnum
 from app.config import settings
 
@@ -23,6 +37,98 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="v1/auth/login")
 
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """
+    Snapshot of the user behind a verified token
+    
+    This is what the auth dependencies return; it carries what authorization
+    needs without a database round trip. Load the User row when the full
+    record is required (see get_current_db_user).
+    
+    token_version is the version claimed by the token (None for tokens
+    issued without one, which only deactivation revokes).
+    """
+    id: str
+    username: str
+    role: UserRoleEnum
+    vsa_id: Optional[str]
+    is_active: bool
+    token_version: Optional[int] = None
+    
+    @classmethod
+    def from_user(cls, user: User, token_version: Optional[int] = None) -> "AuthenticatedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            vsa_id=user.vsa_id,
+            is_active=user.is_active,
+            token_version=token_version
+        )
+    
+    @classmethod
+    def from_claims(cls, payload: dict) -> "AuthenticatedUser":
+        """Snapshot from a token issued with token_claims(); raises on missing claims"""
+        return cls(
+            id=payload["sub"],
+            username=payload["username"],
+            role=UserRoleEnum(payload["role"]),
+            vsa_id=payload.get("vsa_id"),
+            is_active=True,
+            token_version=payload["token_version"]
+        )
+    
+    @property
+    def is_va_admin(self) -> bool:
+        """Check if user is a VA admin"""
+        return self.role == UserRoleEnum.VA_ADMIN
+
+# sha256(verified token) -> (AuthenticatedUser, the user's token_version it
+# was checked at); entries never outlive the token. Other workers' changes
+# reach a cached entry through token_revocations, which bumps that version
+# or marks the user inactive.
+_token_cache = TTLCache(
+    max_entries=settings.auth_cache_max_entries,
+    ttl_seconds=settings.auth_cache_ttl_seconds
+)
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def invalidate_user_cache(user_id: str) -> int:
+    """Drop this worker's cached snapshots for a user after their record changes"""
+    return _token_cache.invalidate_where(lambda key, entry: entry[0].id == user_id)
+
+# Changing any of these must end the user's existing sessions, since tokens
+# carry them as claims
+TOKEN_CLAIM_FIELDS = ("role", "vsa_id", "is_active")
+
+def changes_token_claims(user: User, changes: dict) -> bool:
+    """Whether applying changes to user would alter what its tokens claim"""
+    return any(
+        field in changes and changes[field] != getattr(user, field)
+        for field in TOKEN_CLAIM_FIELDS
+    )
+
+def revoke_user_tokens(user: User) -> None:
+    """Revoke every token issued to user so far; takes effect on commit"""
+    user.token_version = (user.token_version or 0) + 1
+
+def user_changed(user: User) -> None:
+    """Apply a committed change to user to this worker's auth state"""
+    invalidate_user_cache(user.id)
+    token_revocations.record(user.id, user.token_version, user.is_active)
+
+# bcrypt is deliberately slow (~250ms of CPU). Async code hashes on this pool
+# so logins never stall the event loop, and at most password_hash_workers
+# hashes run at once; further requests queue here instead of piling onto the
+# CPU. bcrypt releases the GIL, so threads hash in parallel.
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -31,6 +137,16 @@ def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the password hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the password hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -43,6 +159,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
+def token_claims(user: User) -> dict:
+    """Access token claims for user"""
+    claims = {"sub": user.id}
+    if settings.auth_token_claims:
+        claims.update(
+            username=user.username,
+            role=user.role.value,
+            vsa_id=user.vsa_id,
+            token_version=user.token_version or 0
+        )
+    return claims
+
 def verify_token(token: str) -> Optional[dict]:
     """Verify and decode a JWT token"""
     try:
@@ -53,15 +181,34 @@ def verify_token(token: str) -> Optional[dict]:
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user"""
+    db: AsyncSession = Depends(get_async_db)
+) -> AuthenticatedUser:
+    """
+    Get the current authenticated user
+    
+    Tokens carrying role claims are authorized from the claims alone, checked
+    against the in-memory revocation set. Older tokens, or any token while
+    the revocation set is out of date, fall back to loading the user.
+    
+    Snapshots are cached per token while the revocation set is current; a
+    user deactivated or changed since (in any worker) is checked again, so
+    a cached snapshot is at most auth_revocation_refresh_seconds out of date.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    revocations_current = token_revocations.is_current(3 * settings.auth_revocation_refresh_seconds)
+    cache_key = _token_key(token)
+    cached = _token_cache.get(cache_key)
+    if cached is not None:
+        current_user, checked_version = cached
+        if revocations_current and not token_revocations.is_revoked(current_user.id, checked_version):
+            return current_user
+        _token_cache.invalidate(cache_key)
+    
     try:
         payload = verify_token(token)
         if payload is None:
@@ -74,58 +221,143 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
-        raise credentials_exception
+    # Claims are only trusted while the revocation set is being kept current
+    if settings.auth_token_claims and revocations_current and "role" in payload:
+        try:
+            current_user = AuthenticatedUser.from_claims(payload)
+        except (KeyError, ValueError):
+            raise credentials_exception
+        if token_revocations.is_revoked(current_user.id, current_user.token_version):
+            raise credentials_exception
+        checked_version = current_user.token_version
+    else:
+        user = await repository.get_user(db, user_id)
+        if user is None:
+            raise credentials_exception
+        token_version = payload.get("token_version")
+        if token_version is not None and token_version < (user.token_version or 0):
+            raise credentials_exception
+        current_user = AuthenticatedUser.from_user(user, token_version)
+        checked_version = user.token_version or 0
     
-    return user
+    if revocations_current:
+        ttl = settings.auth_cache_ttl_seconds
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        _token_cache.set(cache_key, (current_user, checked_version), ttl)
+    return current_user
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-) -> User:
+    current_user: AuthenticatedUser = Depends(get_current_user)
+) -> AuthenticatedUser:
     """Get the current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_db_user(
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Load the full User row for the current active user"""
+    user = await repository.get_user(db, current_user.id)
+    if user is None:
+        invalidate_user_cache(current_user.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+async def get_tenant_db(
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+) -> AsyncSession:
+    """Session whose transactions run under the current user's row-level security context"""
+    await set_rls_context(db, current_user)
+    return db
+
+async def get_tenant_read_db(
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+) -> AsyncSession:
+    """Read-only counterpart of get_tenant_db (may be served by a replica)"""
+    await set_rls_context(db, current_user)
+    return db
+
 def authenticate_user(db: Session, username: str, password: str) -> Optional[User]:
     """Authenticate a user with username and password"""
-    user = db.query(User).filter(User.username == username).first()
+    user = repository.get_user_by_username_sync(db, username)
     if not user:
         return None
     if not verify_password(password, user.hashed_password):
         return None
     return user
 
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> Optional[User]:
+    """Authenticate a user without blocking the event loop"""
+    user = await repository.get_user_by_username(db, username)
+    if not user:
+        return None
+    
+    # Hand the connection back while bcrypt runs so a burst of logins waiting
+    # on the hashing pool can't exhaust the database pool
+    db.expunge(user)
+    await db.rollback()
+    
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    db.add(user)
+    return user
+
+async def access_denied(
+    current_user: AuthenticatedUser,
+    detail: str,
+    resource: AuditResourceEnum = AuditResourceEnum.SYSTEM,
+    record_id: Optional[str] = None
+):
+    """Audit an authorization failure and raise the 403 (record_id defaults to the route)"""
+    await audit(
+        AuditActionEnum.ACCESS_DENIED, resource, record_id or current_route(), current_user,
+        new_values={"detail": detail, "role": current_user.role.value}
+    )
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
 def require_role(required_role: UserRoleEnum):
     """Decorator to require a specific user role"""
-    def role_checker(current_user: User = Depends(get_current_active_user)):
+    async def role_checker(current_user: AuthenticatedUser = Depends(get_current_active_user)):
         if current_user.role != required_role:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Insufficient permissions"
-            )
+            await access_denied(current_user, "Insufficient permissions")
         return current_user
     return role_checker
 
 def require_vsa_access():
     """Decorator to require VSA access (VSA_ADMIN or VSA_USER)"""
-    def vsa_checker(current_user: User = Depends(get_current_active_user)):
+    async def vsa_checker(current_user: AuthenticatedUser = Depends(get_current_active_user)):
         if current_user.role not in [UserRoleEnum.VSA_ADMIN, UserRoleEnum.VSA_USER]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="VSA access required"
-            )
+            await access_denied(current_user, "VSA access required")
         return current_user
     return vsa_checker
 
 def require_va_access():
     """Decorator to require VA access (VA_ADMIN)"""
-    def va_checker(current_user: User = Depends(get_current_active_user)):
+    async def va_checker(current_user: AuthenticatedUser = Depends(get_current_active_user)):
         if current_user.role != UserRoleEnum.VA_ADMIN:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="VA admin access required"
-            )
+            await access_denied(current_user, "VA admin access required")
         return current_user
     return va_checker
+
+async def stats_vsa_scope(current_user: AuthenticatedUser, vsa_id: Optional[str]) -> Optional[str]:
+    """
+    The VSA a stats or analytics request covers
+
+    VA admins get the requested VSA, or None for every VSA; anyone else
+    their own. A non-admin account without a VSA is refused rather than
+    unfiltered, which would show it every VSA.
+    """
+    if current_user.role == UserRoleEnum.VA_ADMIN:
+        return vsa_id
+    if not current_user.vsa_id:
+        await access_denied(current_user, "No VSA assigned to this account")
+    return current_user.vsa_id
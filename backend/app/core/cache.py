@@ -0,0 +1,170 @@
+"""
+In-process caching utilities
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.stats_versions import StatsVersion
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Bounded, thread-safe cache whose entries expire after a TTL
+
+    Least recently used entries are evicted once max_entries is reached.
+    Entries live in this process only; every API worker has its own copy.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= time.monotonic():
+                if entry is not _MISSING:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Cache a value for ttl_seconds (defaults to the cache TTL)"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any], ttl_seconds: Optional[float] = None) -> Any:
+        """Return the cached value, computing and caching it on a miss"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl_seconds)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which predicate(key, value) is true"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class StatsCache:
+    """
+    Cache for aggregate results, invalidated by writes
+
+    Write paths call bump() with the VSAs they touched, in the write
+    transaction, which advances each VSA's counter in stats_versions
+    (database/stats_versions.sql). Each cached result remembers the version
+    it was computed against, read from the session that computes it, and is
+    ignored once that version moves on, whichever worker made the write.
+    Results spanning all VSAs (vsa_id None) follow the sum of the counters;
+    callers that can tolerate some lag may pass max_staleness to accept such
+    a result anyway while it is young enough.
+
+    A replica that hasn't replayed a write yet returns the old version along
+    with the old numbers, so its results are only ever cached under the
+    version they reflect. The TTL bounds how long writes made outside the
+    API (direct SQL, scripts) go unnoticed.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self._entries = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    async def version(self, db: AsyncSession, vsa_id: Optional[str]) -> int:
+        """Current version for a VSA, or the sum over all VSAs for None"""
+        if vsa_id is None:
+            query = select(func.coalesce(func.sum(StatsVersion.version), 0))
+        else:
+            query = select(StatsVersion.version).where(StatsVersion.vsa_id == vsa_id)
+        return int(await db.scalar(query) or 0)
+
+    async def bump(self, db: AsyncSession, *vsa_ids: str) -> None:
+        """
+        Invalidate cached results for these VSAs and for all-VSA views once
+        the caller's transaction commits
+
+        Call it last before the commit. Pending changes are flushed first,
+        so the version rows are the transaction's last locks, taken in a
+        fixed order and held only until the commit; concurrent writers
+        can't deadlock on them.
+        """
+        await db.flush()
+        for vsa_id in sorted(set(vsa_ids)):
+            await db.execute(text("""
+                INSERT INTO stats_versions (vsa_id, version) VALUES (:vsa_id, 1)
+                ON CONFLICT (vsa_id) DO UPDATE SET version = stats_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+            """), {"vsa_id": vsa_id})
+
+    def _lookup(self, key: Hashable, version: int, max_staleness: Optional[float]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        entry_version, computed_at, value = entry
+        if entry_version == version:
+            return value
+        if max_staleness is not None and time.monotonic() - computed_at <= max_staleness:
+            return value
+        return _MISSING
+
+    async def get_or_compute(self, db: AsyncSession, endpoint: str, vsa_id: Optional[str], filters: dict,
+                             compute: Callable[[], Awaitable[Any]], max_staleness: Optional[float] = None) -> Any:
+        """
+        Return the cached result for (endpoint, vsa_id, filters) if still
+        current, otherwise compute it with db and cache it
+        """
+        key = (endpoint, vsa_id, tuple(sorted(filters.items())))
+        # Read the version before computing so a write that lands meanwhile
+        # leaves the new entry already stale
+        version = await self.version(db, vsa_id)
+
+        value = self._lookup(key, version, max_staleness)
+        if value is _MISSING:
+            value = await compute()
+            self._entries.set(key, (version, time.monotonic(), value))
+        return value
+
+    def clear(self) -> None:
+        """Drop all cached results"""
+        self._entries.clear()
+
+# Dashboard stats and analytics results
+stats_cache = StatsCache(
+    max_entries=settings.analytics_cache_max_entries,
+    ttl_seconds=settings.analytics_cache_ttl_seconds
+)
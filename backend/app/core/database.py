@@ -2,11 +2,16 @@
 Database connection and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import QueuePool
 from app.config import settings
+from app.core.metrics import count_queries
+from app.core.pool_metrics import TimedAsyncQueuePool, TimedQueuePool, instrument_engine
+from app.core.query_profiler import profile_engine
+from app.core.rls import RLS_CONNECT_ARGS, enable_rls_context
 import structlog
 
 logger = structlog.get_logger()
@@ -14,7 +19,7 @@ logger = structlog.get_logger()
 # Create database engine with connection pooling
 engine = create_engine(
     settings.database_url,
-    poolclass=QueuePool,
+    poolclass=TimedQueuePool,
     pool_size=settings.database_pool_size,
     max_overflow=settings.database_max_overflow,
     pool_pre_ping=True,  # Verify connections before use
@@ -25,13 +30,42 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def async_database_url(url: str) -> str:
+    """The same database, addressed through the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+# Async engine for the API. The sync engine above stays for scripts, jobs and
+# code not yet ported; each has its own pool.
+async_engine = create_async_engine(
+    async_database_url(settings.database_url),
+    poolclass=TimedAsyncQueuePool,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    connect_args=RLS_CONNECT_ARGS,
+    echo=settings.debug
+)
+
+instrument_engine("primary", engine)
+instrument_engine("primary_async", async_engine)
+profile_engine(engine)
+profile_engine(async_engine)
+count_queries(engine)
+count_queries(async_engine)
+enable_rls_context(engine)
+enable_rls_context(async_engine)
+
+# Objects stay usable after commit; there is no implicit IO to reload them
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for all models
 Base = declarative_base()
 
 def get_db() -> Session:
     """
-    Dependency to get database session
-    Use this in FastAPI endpoints
+    Dependency to get a sync database session
+    Endpoints should prefer get_async_db; this is for code not yet ported
     """
     db = SessionLocal()
     try:
@@ -43,6 +77,19 @@ def get_db() -> Session:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncSession:
+    """
+    Dependency to get an async database session
+    Use this in FastAPI endpoints
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error("Database session error", error=str(e))
+            await db.rollback()
+            raise
+
 def init_db():
     """Initialize database tables"""
     try:
@@ -53,10 +100,13 @@ def init_db():
         raise
 
 def check_db_connection():
-    """Check if database connection is working"""
+    """
+    Check if database connection is working
+    For scripts; the API's health endpoints serve app.core.health's cached probe
+    """
     try:
         with engine.connect() as connection:
-            result = connection.execute("SELECT 1")
+            connection.execute(text("SELECT 1"))
             logger.info("Database connection successful")
             return True
     except Exception as e:
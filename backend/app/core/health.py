@@ -0,0 +1,105 @@
+"""
+Background health prober
+
+Load balancers probe the health endpoints every few seconds from every
+target. Checking the database on each of those requests would put the
+probes in the same pool queue as real traffic, so instead the scheduler
+runs one probe per worker every health_probe_interval_seconds and the
+endpoints serve its last result, with the result's age, without any IO.
+
+A probe measures a round trip to the primary, reads the state of every
+instrumented pool and picks up the replica lag the read router already
+tracks. A result older than three intervals means the prober itself has
+stopped and is reported as stale.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+import structlog
+
+from app.config import settings
+from app.core.database import async_engine
+from app.core.pool_metrics import pool_metrics
+from app.core.replicas import ReplicaRouter, read_router
+
+logger = structlog.get_logger()
+
+class HealthProber:
+    """Probes the database on an interval and keeps the latest result"""
+
+    def __init__(self, engine: AsyncEngine, router: ReplicaRouter,
+                 interval_seconds: float = 5, timeout_seconds: float = 2):
+        self.engine = engine
+        self.router = router
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self._result: Optional[dict] = None
+        self._checked_at: Optional[float] = None  # monotonic
+
+    async def _round_trip(self) -> None:
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _database(self) -> dict:
+        started = time.perf_counter()
+        try:
+            # Includes any wait for a pooled connection, as a request would see
+            await asyncio.wait_for(self._round_trip(), self.timeout_seconds)
+        except Exception as e:
+            # TimeoutError has no message of its own
+            error = str(e) or type(e).__name__
+            logger.warning("Database health probe failed", error=error)
+            return {"status": "unhealthy", "error": error}
+        return {"status": "healthy", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def _replicas(self) -> dict:
+        now = time.monotonic()
+        return {
+            replica.name: {
+                "status": "healthy" if self.router.is_available(replica) else "unhealthy",
+                "lag_seconds": replica.lag_seconds if replica.lag_seconds != float("inf") else None,
+                "checked_seconds_ago": round(now - replica.checked_at, 1) if replica.checked_at else None,
+            }
+            for replica in self.router.replicas
+        }
+
+    async def probe(self) -> dict:
+        """Check every component now and cache the result"""
+        database = await self._database()
+        replicas = self._replicas()
+        pools = {
+            name: {**metrics.pool_status(), "checkout_timeouts": metrics.checkout_timeouts}
+            for name, metrics in pool_metrics.items()
+        }
+        if database["status"] != "healthy":
+            status = "unhealthy"
+        elif any(replica["status"] != "healthy" for replica in replicas.values()):
+            status = "degraded"  # reads fall back to the primary
+        else:
+            status = "healthy"
+
+        self._result = {"status": status, "database": database, "replicas": replicas, "pools": pools}
+        self._checked_at = time.monotonic()
+        return self._result
+
+    def report(self) -> dict:
+        """The last probe's result and its age in seconds"""
+        if self._checked_at is None:
+            return {"status": "unknown", "message": "No health probe has completed yet", "age_seconds": None}
+        age = time.monotonic() - self._checked_at
+        report = {**self._result, "age_seconds": round(age, 3)}
+        if age > 3 * self.interval_seconds:
+            report["status"] = "stale"
+            report["message"] = "Health probe result is stale"
+        return report
+
+health_prober = HealthProber(
+    async_engine,
+    read_router,
+    interval_seconds=settings.health_probe_interval_seconds,
+    timeout_seconds=settings.health_probe_timeout_seconds
+)
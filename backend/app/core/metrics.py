@@ -0,0 +1,270 @@
+"""
+Request metrics and cross-worker aggregation for /metrics
+
+The request middleware reports every request into request_metrics:
+
+- latency per route template, method and status,
+- requests in flight,
+- request and response body sizes, and
+- database statements run per request (counted by count_queries() on
+  every engine, attributed through request_context).
+
+Imports report the rows they processed, so rate(vrp_import_rows_total[1m])
+gives import rows per second across the fleet.
+
+Every uvicorn worker has its own memory, so a scrape would otherwise see
+only the worker that happened to answer it. When metrics_multiprocess_dir
+is set, each worker writes its full exposition to <dir>/<pid>-<start>.prom
+every metrics_flush_seconds (and on shutdown), and /metrics returns the sum
+of all the files, its own written fresh. The process start time in the name
+tells a worker that has exited from a new one that was given its pid. A
+scrape folds the counters and histograms of exited workers into
+<dir>/dead.prom and removes their files, so totals never go backwards, even
+across restarts and deploys sharing the directory; their gauges (in flight,
+pool sizes, queue depth) are dropped.
+"""
+
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+import structlog
+
+from app.config import settings
+from app.core.pool_metrics import Histogram, _histogram_lines, _label
+from app.core.request_context import current_request
+
+logger = structlog.get_logger()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+IMPORT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+class RequestMetrics:
+    """Per-route request metrics and import throughput for this worker"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.latency: Dict[Tuple[str, str, str], Histogram] = {}  # (method, route, status)
+        self.request_size: Dict[Tuple[str, str], Histogram] = {}  # (method, route)
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.import_rows: Dict[Tuple[str, str], int] = {}  # (source, result)
+        self.import_duration: Dict[str, Histogram] = {}  # source
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _observe(histograms: dict, key, buckets, value: float) -> None:
+        """Caller holds the lock"""
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method: str, route: str, status: int, seconds: float,
+                 request_bytes: int, response_bytes: int, queries: int) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._observe(self.latency, (method, route, str(status)), LATENCY_BUCKETS, seconds)
+            self._observe(self.request_size, (method, route), SIZE_BUCKETS, request_bytes)
+            self._observe(self.response_size, (method, route), SIZE_BUCKETS, response_bytes)
+            self._observe(self.queries, (method, route), QUERY_BUCKETS, queries)
+
+    def record_import(self, source: str, imported: int, failed: int, seconds: float) -> None:
+        """Count the rows one import processed; rows per second come from rate() over the counter"""
+        with self._lock:
+            for result, rows in (("imported", imported), ("failed", failed)):
+                self.import_rows[(source, result)] = self.import_rows.get((source, result), 0) + rows
+            self._observe(self.import_duration, source, IMPORT_BUCKETS, seconds)
+
+request_metrics = RequestMetrics()
+
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    request = current_request.get()
+    if request is not None:
+        request.queries += 1
+
+def count_queries(engine) -> None:
+    """Count this engine's statements against the current request (sync or async engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+def render_request_metrics() -> str:
+    """Request and import metrics in the Prometheus text exposition format"""
+    def labels(*pairs) -> str:
+        return ",".join(f'{name}="{_label(value)}"' for name, value in pairs)
+
+    with request_metrics._lock:
+        lines = [
+            "# TYPE vrp_http_requests_in_flight gauge",
+            f"vrp_http_requests_in_flight {request_metrics.in_flight}",
+            "# TYPE vrp_http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in sorted(request_metrics.latency.items()):
+            lines += _histogram_lines(
+                "vrp_http_request_duration_seconds",
+                labels(("method", method), ("route", route), ("status", status)),
+                histogram
+            )
+        for name, histograms in (
+            ("vrp_http_request_size_bytes", request_metrics.request_size),
+            ("vrp_http_response_size_bytes", request_metrics.response_size),
+            ("vrp_http_request_db_queries", request_metrics.queries),
+        ):
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), histogram in sorted(histograms.items()):
+                lines += _histogram_lines(name, labels(("method", method), ("route", route)), histogram)
+
+        lines.append("# TYPE vrp_import_rows_total counter")
+        for (source, result), rows in sorted(request_metrics.import_rows.items()):
+            lines.append(f"vrp_import_rows_total{{{labels(('source', source), ('result', result))}}} {rows}")
+        lines.append("# TYPE vrp_import_duration_seconds histogram")
+        for source, histogram in sorted(request_metrics.import_duration.items()):
+            lines += _histogram_lines("vrp_import_duration_seconds", labels(("source", source)), histogram)
+    return "\n".join(lines) + "\n"
+
+# Aggregation across worker processes
+
+DEAD_SNAPSHOT = "dead.prom"
+_FOLDED = "# folded "
+_fallback_starts: Dict[int, int] = {}
+
+def _start_time(pid: int) -> Optional[str]:
+    """When pid started, in clock ticks since boot, or None without /proc"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces; the fields after it don't
+            return f.read().rpartition(")")[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+def _worker_key() -> str:
+    pid = os.getpid()
+    start = _start_time(pid) or str(_fallback_starts.setdefault(pid, time.time_ns()))
+    return f"{pid}-{start}"
+
+def _snapshot_path(directory: str) -> str:
+    return os.path.join(directory, f"{_worker_key()}.prom")
+
+def _write_atomically(directory: str, path: str, content: str) -> None:
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def write_metrics_snapshot(exposition: str, directory: Optional[str] = None) -> None:
+    """Replace this worker's snapshot file; readers never see a partial one"""
+    directory = directory or settings.metrics_multiprocess_dir
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _write_atomically(directory, _snapshot_path(directory), exposition)
+
+def _alive(pid: int, start: str) -> bool:
+    current = _start_time(pid)
+    if current is not None:
+        return current == start
+    # No /proc: a reused pid can't be told apart
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _format(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def merge_expositions(expositions: List[Tuple[str, bool]]) -> str:
+    """
+    Sum (exposition, worker alive) pairs series by series
+
+    Every metric here is a counter, a histogram or a gauge whose fleet-wide
+    value is the sum over workers, so adding samples with identical names
+    and labels is enough. Gauges of exited workers are left out.
+    """
+    families: Dict[str, Dict[str, float]] = {}  # "# TYPE" line -> series -> value
+    for exposition, alive in expositions:
+        series = None
+        for line in exposition.splitlines():
+            if line.startswith("# TYPE "):
+                gauge = line.endswith(" gauge")
+                series = families.setdefault(line, {})
+            elif line and not line.startswith("#") and series is not None:
+                if gauge and not alive:
+                    continue
+                name, _, value = line.rpartition(" ")
+                try:
+                    series[name] = series.get(name, 0.0) + float(value)
+                except ValueError:
+                    logger.warning("Skipping malformed metrics line", line=line)
+
+    lines = []
+    for type_line, series in families.items():
+        lines.append(type_line)
+        lines += [f"{name} {_format(value)}" for name, value in series.items()]
+    return "\n".join(lines) + "\n"
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def aggregate_metrics(exposition: str, directory: Optional[str] = None) -> str:
+    """
+    This worker's exposition summed with every other worker's snapshot
+
+    Exited workers' snapshots are folded into dead.prom, which lists the
+    files it took in; a scrape interrupted before removing them removes
+    them next time rather than counting them twice. Scrapes in different
+    workers take turns on a lock file. Without metrics_multiprocess_dir the
+    worker's own metrics are returned as they are.
+    """
+    directory = directory or settings.metrics_multiprocess_dir
+    if not directory:
+        return exposition
+    write_metrics_snapshot(exposition, directory)
+
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead_path = os.path.join(directory, DEAD_SNAPSHOT)
+        dead = _read(dead_path) or ""
+        folded = {line[len(_FOLDED):] for line in dead.splitlines() if line.startswith(_FOLDED)}
+
+        alive, exited = [], []
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            pid, _, start = entry.name[:-len(".prom")].partition("-")
+            if not entry.name.endswith(".prom") or not (pid.isdigit() and start.isdigit()):
+                continue
+            if entry.name in folded:
+                os.unlink(entry.path)
+                continue
+            content = _read(entry.path)
+            if content is not None:
+                (alive if _alive(int(pid), start) else exited).append((entry.name, content))
+
+        if exited:
+            dead = "".join(f"{_FOLDED}{name}\n" for name, _ in exited) + merge_expositions(
+                [(dead, False)] + [(content, False) for _, content in exited]
+            )
+            _write_atomically(directory, dead_path, dead)
+            for name, _ in exited:
+                os.unlink(os.path.join(directory, name))
+
+    return merge_expositions([(dead, False)] + [(content, True) for _, content in alive])
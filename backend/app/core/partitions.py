@@ -0,0 +1,81 @@
+"""
+Monthly partition maintenance for referrals and audit_log
+
+database/partitioning.sql partitions both tables by UTC month. This job
+keeps partition_months_ahead months of partitions created ahead of the
+data, and archives months past their retention period: the partition is
+detached into the archive schema (with referencing outcomes moved
+alongside) rather than deleted row by row. Retention of 0 months keeps
+everything.
+
+Run as a job:  python -m app.core.partitions
+"""
+
+import sys
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+import structlog
+
+from app.config import settings
+from app.core.database import engine
+
+logger = structlog.get_logger()
+
+def retention_months() -> Dict[str, int]:
+    """Months of history to keep per partitioned table (0 = forever)"""
+    return {
+        "referrals": settings.referral_retention_months,
+        "audit_log": settings.audit_log_retention_months,
+    }
+
+def maintain_partitions(db_engine: Optional[Engine] = None) -> Dict[str, Dict]:
+    """
+    Create upcoming partitions and archive expired ones, if no other worker is doing so
+
+    Returns, per table, the number of partitions created and the archived
+    tables. Tables that aren't partitioned are skipped.
+    """
+    db_engine = db_engine or engine
+    report: Dict[str, Dict] = {}
+
+    with db_engine.connect() as connection:
+        with connection.begin():
+            if not connection.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext('maintain_partitions'))")
+            ).scalar():
+                logger.info("Partition maintenance already running elsewhere")
+                return report
+
+            for table, keep_months in retention_months().items():
+                created = connection.execute(text("""
+                    SELECT create_monthly_partitions(
+                        CAST(:table AS regclass),
+                        (now() AT TIME ZONE 'UTC')::date,
+                        ((now() AT TIME ZONE 'UTC') + make_interval(months => :months_ahead))::date
+                    )
+                """), {"table": table, "months_ahead": settings.partition_months_ahead}).scalar()
+
+                archived: List[str] = []
+                if keep_months > 0:
+                    archived = connection.execute(
+                        text("SELECT archive_expired_partitions(CAST(:table AS regclass), :keep_months)"),
+                        {"table": table, "keep_months": keep_months}
+                    ).scalars().all()
+
+                report[table] = {"created": created, "archived": archived}
+                if created or archived:
+                    logger.info("Partitions maintained", table=table, created=created, archived=archived)
+
+    return report
+
+def main(argv=None) -> int:
+    """Maintenance job entry point"""
+    report = maintain_partitions()
+    for table, result in report.items():
+        print(f"{table}: created={result['created']} archived={', '.join(result['archived']) or '-'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Connection pool instrumentation
+
+Each engine's pool reports through SQLAlchemy pool events (connect,
+checkout, checkin, invalidate) into a PoolMetrics:
+
+- checkout wait: time spent waiting for a free connection, and checkouts
+  that gave up after the pool timeout,
+- hold time per route: from checkout to checkin, attributed to the request
+  that checked the connection out (see request_context). Holds longer than
+  database_pool_hold_warn_seconds are logged with the route and request id,
+- connects, invalidations and pre-ping failures,
+- current size, checked out, idle and overflow counts.
+
+Waiting happens inside the pool before any event fires, so engines use the
+Timed* pool classes below to measure it.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+import structlog
+
+from app.config import settings
+from app.core.request_context import current_request
+
+logger = structlog.get_logger()
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HOLD_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] is observations <= buckets[i], the last is +Inf"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def cumulative(self) -> List[int]:
+        """Counts of observations <= each bucket bound, ending with the total"""
+        totals, running = [], 0
+        for count in self.counts:
+            running += count
+            totals.append(running)
+        return totals
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile (max for the +Inf bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in zip(self.buckets, self.cumulative()):
+            if total >= rank:
+                return bound
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_seconds": self.sum / self.count if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p99_seconds": self.quantile(0.99),
+            "max_seconds": self.max if self.count else None,
+        }
+
+class PoolMetrics:
+    """Counters and timings for one engine's connection pool"""
+
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.pre_ping_failures = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait = Histogram(WAIT_BUCKETS)
+        self.hold_by_route: Dict[str, Histogram] = {}
+        self.long_holds_by_route: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.checkout_wait.observe(seconds)
+            if timed_out:
+                self.checkout_timeouts += 1
+        if timed_out:
+            context = current_request.get()
+            logger.warning(
+                "Timed out waiting for a database connection",
+                pool=self.name,
+                waited_seconds=round(seconds, 3),
+                route=context.route if context else None,
+                request_id=context.request_id if context else None
+            )
+
+    def record_hold(self, route: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.hold_by_route.get(route)
+            if histogram is None:
+                histogram = self.hold_by_route[route] = Histogram(HOLD_BUCKETS)
+            histogram.observe(seconds)
+            if seconds > settings.database_pool_hold_warn_seconds:
+                self.long_holds_by_route[route] = self.long_holds_by_route.get(route, 0) + 1
+
+    # Pool event handlers
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.checkouts += 1
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        connection_record.info["checked_out_by"] = current_request.get()
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.checkins += 1
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        context = connection_record.info.pop("checked_out_by", None)
+        if checked_out_at is None:
+            return
+
+        held = time.perf_counter() - checked_out_at
+        route = context.route if context is not None else "background"
+        self.record_hold(route, held)
+        if held > settings.database_pool_hold_warn_seconds:
+            logger.warning(
+                "Database connection held too long",
+                pool=self.name,
+                held_seconds=round(held, 3),
+                route=route,
+                request_id=context.request_id if context else None
+            )
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+            # The pool raises DisconnectionError for connections that fail
+            # pre-ping; disconnects seen by statements carry the driver's error
+            if isinstance(exception, exc.DisconnectionError):
+                self.pre_ping_failures += 1
+
+    def pool_status(self) -> dict:
+        """Live counts from the pool itself"""
+        pool = self.engine.pool
+        if not isinstance(pool, QueuePool):
+            return {"size": None, "checked_out": None, "idle": None, "overflow": None}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        }
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                **self.pool_status(),
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "pre_ping_failures": self.pre_ping_failures,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait": self.checkout_wait.summary(),
+                "hold_by_route": {
+                    route: {**histogram.summary(), "long_holds": self.long_holds_by_route.get(route, 0)}
+                    for route, histogram in sorted(self.hold_by_route.items())
+                },
+            }
+
+class _TimedCheckout:
+    """Pool mixin that reports how long each checkout waited for a connection"""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - started)
+        return record
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool; event listeners carry over, this doesn't
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+# Pool name -> metrics, for the health and metrics endpoints
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+def instrument_engine(name: str, engine) -> PoolMetrics:
+    """Start collecting metrics for an engine's pool (sync or async engine)"""
+    engine = getattr(engine, "sync_engine", engine)
+    metrics = PoolMetrics(name, engine)
+    pool = engine.pool
+    event.listen(pool, "connect", metrics.on_connect)
+    event.listen(pool, "checkout", metrics.on_checkout)
+    event.listen(pool, "checkin", metrics.on_checkin)
+    event.listen(pool, "invalidate", metrics.on_invalidate)
+    if isinstance(pool, _TimedCheckout):
+        pool.metrics = metrics
+    pool_metrics[name] = metrics
+    return metrics
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines = [
+        f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        for bound, total in zip(histogram.buckets, histogram.cumulative())
+    ]
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+def render_pool_metrics() -> str:
+    """All pools' metrics in the Prometheus text exposition format"""
+    gauges = ("size", "checked_out", "idle", "overflow")
+    counters = ("connects", "checkouts", "checkins", "invalidations", "pre_ping_failures", "checkout_timeouts")
+
+    lines = []
+    for gauge in gauges:
+        lines.append(f"# TYPE vrp_db_pool_{gauge} gauge")
+        for name, metrics in pool_metrics.items():
+            value = metrics.pool_status()[gauge]
+            if value is not None:
+                lines.append(f'vrp_db_pool_{gauge}{{pool="{_label(name)}"}} {value}')
+    for counter in counters:
+        lines.append(f"# TYPE vrp_db_pool_{counter}_total counter")
+        for name, metrics in pool_metrics.items():
+            lines.append(f'vrp_db_pool_{counter}_total{{pool="{_label(name)}"}} {getattr(metrics, counter)}')
+
+    lines.append("# TYPE vrp_db_pool_checkout_wait_seconds histogram")
+    for name, metrics in pool_metrics.items():
+        with metrics._lock:
+            lines += _histogram_lines("vrp_db_pool_checkout_wait_seconds", f'pool="{_label(name)}"', metrics.checkout_wait)
+
+    lines.append("# TYPE vrp_db_pool_hold_seconds histogram")
+    for name, metrics in pool_metrics.items():
+        with metrics._lock:
+            for route, histogram in sorted(metrics.hold_by_route.items()):
+                labels = f'pool="{_label(name)}",route="{_label(route)}"'
+                lines += _histogram_lines("vrp_db_pool_hold_seconds", labels, histogram)
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,280 @@
+"""
+Query profiling
+
+Engines registered with profile_engine() report every statement through
+SQLAlchemy's before/after_cursor_execute events:
+
+- statements are reduced to a fingerprint (literals, bind parameters and IN
+  lists collapsed), so "the same query" with different values is counted
+  together; per fingerprint we keep a count, errors, slow count and a
+  latency histogram,
+- statements slower than query_slow_threshold_ms are sampled at
+  query_explain_sample_rate and re-run under EXPLAIN (ANALYZE, BUFFERS) on
+  the same connection and transaction, so session settings and row-level
+  security match the original. The plan is appended as a JSON line to a
+  rotating file, tagged with the route and request id (see request_context).
+
+Bind parameter values are never recorded; they may hold veteran PII.
+
+The re-run happens inside a savepoint that is always rolled back, under a
+statement timeout, and only for plain SELECTs reading from a table
+(a bare "SELECT some_function()" may have side effects outside the
+transaction). Explains are also capped at query_explain_max_per_minute per
+worker, so a burst of slow queries cannot double the load.
+"""
+
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+import structlog
+
+from app.config import settings
+from app.core.pool_metrics import Histogram, _histogram_lines, _label
+from app.core.request_context import current_request
+
+logger = structlog.get_logger()
+
+QUERY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+OTHER_FINGERPRINT = "other"
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROWS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+_SPACE = re.compile(r"\s+")
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|INTO)\b", re.I)
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """(id, normalized text) of a statement; equal for statements differing only in values"""
+    normalized = _COMMENTS.sub(" ", statement)
+    normalized = _STRINGS.sub("?", normalized)
+    normalized = _PLACEHOLDERS.sub("?", normalized)
+    normalized = _NUMBERS.sub("?", normalized)
+    normalized = _SPACE.sub(" ", normalized).strip()
+    normalized = _LISTS.sub("(?)", normalized)
+    normalized = _ROWS.sub(r"\1, ...", normalized)
+    digest = hashlib.blake2b(normalized.encode(), digest_size=6).hexdigest()
+    return digest, normalized
+
+def explainable(normalized: str) -> bool:
+    """Whether re-running a statement under EXPLAIN ANALYZE can't change anything"""
+    upper = normalized.upper()
+    return upper.startswith(("SELECT ", "WITH ")) and " FROM " in upper and not _WRITES.search(normalized)
+
+class QueryStats:
+    """Counters and latency for one fingerprint"""
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.errors = 0
+        self.slow = 0
+        self.explained = 0
+        self.latency = Histogram(QUERY_BUCKETS)
+
+    def summary(self) -> dict:
+        return {
+            "statement": self.statement,
+            "count": self.count,
+            "errors": self.errors,
+            "slow": self.slow,
+            "explained": self.explained,
+            "total_seconds": self.latency.sum,
+            **self.latency.summary(),
+        }
+
+class QueryProfiler:
+    """Per-fingerprint statement statistics and sampled slow-query plans for this worker"""
+
+    def __init__(self):
+        self.stats: Dict[str, QueryStats] = {}
+        self._explained_at = deque()
+        self._lock = threading.Lock()
+        self._plan_log: Optional[logging.Logger] = None
+
+    def _stats_for(self, statement: str) -> Tuple[str, QueryStats]:
+        """Caller holds the lock"""
+        fingerprint_id, normalized = fingerprint(statement)
+        stats = self.stats.get(fingerprint_id)
+        if stats is None:
+            if len(self.stats) >= settings.query_max_fingerprints:
+                # Bound memory (and metric labels) if something generates endless distinct SQL
+                fingerprint_id = OTHER_FINGERPRINT
+                stats = self.stats.get(fingerprint_id)
+                if stats is None:
+                    stats = self.stats[fingerprint_id] = QueryStats("(fingerprints over query_max_fingerprints)")
+            else:
+                stats = self.stats[fingerprint_id] = QueryStats(normalized[:2000])
+        return fingerprint_id, stats
+
+    def record(self, statement: str, seconds: float) -> Tuple[str, bool]:
+        """Count an executed statement; returns its fingerprint id and whether it was slow"""
+        slow = seconds * 1000 >= settings.query_slow_threshold_ms
+        with self._lock:
+            fingerprint_id, stats = self._stats_for(statement)
+            stats.count += 1
+            stats.latency.observe(seconds)
+            if slow:
+                stats.slow += 1
+        return fingerprint_id, slow
+
+    def record_error(self, statement: str) -> None:
+        with self._lock:
+            self._stats_for(statement)[1].errors += 1
+
+    def should_explain(self) -> bool:
+        """Sample a slow statement for EXPLAIN, within the per-minute cap"""
+        if random.random() >= settings.query_explain_sample_rate:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._explained_at and now - self._explained_at[0] > 60:
+                self._explained_at.popleft()
+            if len(self._explained_at) >= settings.query_explain_max_per_minute:
+                return False
+            self._explained_at.append(now)
+        return True
+
+    # Event handlers
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        # The statement as the application wrote it: listeners added later may
+        # still rewrite it (see rls)
+        conn.info["query_started_at"] = (time.perf_counter(), statement)
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info.pop("query_started_at", None)
+        if started is None:
+            return
+        started, statement = started
+        seconds = time.perf_counter() - started
+        fingerprint_id, slow = self.record(statement, seconds)
+        if not slow or executemany or conn.dialect.name != "postgresql":
+            return
+        if context is not None and context.execution_options.get("stream_results"):
+            return  # results still being streamed from the original statement
+        if not explainable(fingerprint(statement)[1]) or not self.should_explain():
+            return
+        self.explain(conn, statement, parameters, fingerprint_id, seconds)
+
+    def handle_error(self, exception_context) -> None:
+        connection = exception_context.connection
+        if connection is not None:
+            connection.info.pop("query_started_at", None)
+        if exception_context.statement:
+            self.record_error(exception_context.statement)
+
+    def explain(self, conn, statement, parameters, fingerprint_id: str, seconds: float) -> None:
+        """Re-run a statement under EXPLAIN ANALYZE and log its plan; never disturbs the caller's transaction"""
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT vrp_explain")
+            try:
+                cursor.execute(f"SET LOCAL statement_timeout = {int(settings.query_explain_timeout_seconds * 1000)}")
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+                plan = cursor.fetchone()[0]
+            finally:
+                # Also undoes SET LOCAL and anything the re-run changed
+                cursor.execute("ROLLBACK TO SAVEPOINT vrp_explain")
+                cursor.execute("RELEASE SAVEPOINT vrp_explain")
+        except Exception as e:
+            logger.warning("Could not explain slow query", fingerprint=fingerprint_id, error=str(e))
+            return
+        finally:
+            cursor.close()
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        context = current_request.get()
+        with self._lock:
+            stats = self.stats.get(fingerprint_id)
+            if stats is not None:
+                stats.explained += 1
+        self.write_plan({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "route": context.route if context else "background",
+            "request_id": context.request_id if context else None,
+            "fingerprint": fingerprint_id,
+            "duration_ms": round(seconds * 1000, 3),
+            "statement": fingerprint(statement)[1],
+            "plan": plan,
+        })
+
+    def write_plan(self, entry: dict) -> None:
+        if self._plan_log is None:
+            with self._lock:
+                if self._plan_log is None:
+                    self._plan_log = _open_plan_log(settings.query_explain_log_path)
+        self._plan_log.info(json.dumps(entry, default=str))
+
+    def top(self, limit: int = 20, order_by: str = "total_seconds") -> List[dict]:
+        """The heaviest fingerprints, by total time, count, slow count or p99"""
+        with self._lock:
+            summaries = [
+                {"fingerprint": fingerprint_id, **stats.summary()}
+                for fingerprint_id, stats in self.stats.items()
+            ]
+        summaries.sort(key=lambda summary: summary.get(order_by) or 0, reverse=True)
+        return summaries[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+
+def _open_plan_log(path: str) -> logging.Logger:
+    """A dedicated logger writing bare JSON lines to a size-rotated file"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=settings.query_explain_log_max_bytes,
+        backupCount=settings.query_explain_log_backups,
+        encoding="utf-8",
+        delay=True
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    plan_log = logging.getLogger(f"vrp.slow_queries.{path}")
+    plan_log.handlers[:] = [handler]
+    plan_log.setLevel(logging.INFO)
+    plan_log.propagate = False
+    return plan_log
+
+query_profiler = QueryProfiler()
+
+def profile_engine(engine) -> None:
+    """Record this engine's statements in query_profiler (sync or async engine)"""
+    if not settings.query_profiling_enabled:
+        return
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", query_profiler.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", query_profiler.after_cursor_execute)
+    event.listen(engine, "handle_error", query_profiler.handle_error)
+
+def render_query_metrics() -> str:
+    """Per-fingerprint statement metrics in the Prometheus text exposition format"""
+    with query_profiler._lock:
+        items = sorted(query_profiler.stats.items())
+        lines = ["# TYPE vrp_db_query_seconds histogram"]
+        for fingerprint_id, stats in items:
+            lines += _histogram_lines("vrp_db_query_seconds", f'fingerprint="{_label(fingerprint_id)}"', stats.latency)
+        for counter in ("errors", "slow", "explained"):
+            lines.append(f"# TYPE vrp_db_query_{counter}_total counter")
+            for fingerprint_id, stats in items:
+                lines.append(f'vrp_db_query_{counter}_total{{fingerprint="{_label(fingerprint_id)}"}} {getattr(stats, counter)}')
+    return "\n".join(lines) + "\n"
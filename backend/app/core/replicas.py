@@ -0,0 +1,230 @@
+"""
+Read replica routing
+
+Read-only endpoints take their session from get_read_db, which spreads
+them across the replicas in database_replica_urls and falls back to the
+primary when:
+
+- no replica is configured, or none is healthy,
+- a replica's replication lag exceeds database_replica_max_lag_seconds
+  (checked every database_replica_check_seconds by the scheduler), or
+- the client wrote recently: every successful write sets a short-lived
+  cookie that pins the client's reads to the primary so it sees its own
+  changes ("read your writes").
+
+Replicas can be any database the async engine can reach, so routing can be
+exercised locally with two Postgres databases or two SQLite files.
+"""
+
+import itertools
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+import structlog
+
+from app.config import settings
+from app.core.database import AsyncSessionLocal, async_database_url, async_engine
+from app.core.metrics import count_queries
+from app.core.pool_metrics import TimedAsyncQueuePool, instrument_engine
+from app.core.query_profiler import profile_engine
+from app.core.rls import RLS_CONNECT_ARGS, enable_rls_context
+
+logger = structlog.get_logger()
+
+READ_PRIMARY_COOKIE = "vrp_read_primary_until"
+
+# Replication lag is measured against the primary's WAL position rather than
+# the replica's own view: a replica whose WAL receiver has stalled has replayed
+# everything it received and would otherwise look caught up. Each check
+# samples the primary's position first; a replica is as far behind as the
+# newest sample it has replayed past. No running WAL receiver (the primary is
+# unreachable, or replication was stopped) makes a replica unavailable. The
+# receiver's status is only visible to superusers and pg_read_all_stats
+# members; for other logins a running receiver is enough.
+_PRIMARY_WAL_SQL = text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")
+_REPLICA_WAL_SQL = text("""
+    SELECT pg_is_in_recovery(),
+           pg_last_wal_replay_lsn() - '0/0'::pg_lsn,
+           EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status IS NULL OR status = 'streaming')
+""")
+# Lag beyond this is reported as unknown (infinite)
+_WAL_HISTORY_SECONDS = 600
+
+@dataclass
+class Replica:
+    """A read replica and what routing knows about it"""
+    name: str
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker = field(init=False)
+    lag_seconds: float = math.inf  # unknown until the first check
+    checked_at: Optional[float] = None
+    in_flight: int = 0
+
+    def __post_init__(self):
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+
+class ReplicaRouter:
+    """Chooses where a read-only session should go"""
+
+    def __init__(self, replicas: List[Replica], strategy: str = "least_connections",
+                 max_lag_seconds: float = 5, check_interval_seconds: float = 2,
+                 primary: Optional[AsyncEngine] = None):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.replicas = replicas
+        self.primary = primary
+        self._primary_wal: Deque[Tuple[float, int]] = deque()  # (monotonic, primary WAL position)
+        self.strategy = strategy
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self._round_robin = itertools.count()
+
+    def is_available(self, replica: Replica) -> bool:
+        """Lag was checked recently and is within the limit"""
+        return (
+            replica.checked_at is not None
+            and time.monotonic() - replica.checked_at <= 3 * self.check_interval_seconds
+            and replica.lag_seconds <= self.max_lag_seconds
+        )
+
+    def choose(self) -> Optional[Replica]:
+        """Pick a replica for the next read, or None to use the primary"""
+        available = [replica for replica in self.replicas if self.is_available(replica)]
+        if not available:
+            return None
+        if self.strategy == "round_robin":
+            return available[next(self._round_robin) % len(available)]
+        return min(available, key=lambda replica: replica.in_flight)
+
+    async def _sample_primary_wal(self) -> None:
+        """Record the primary's current WAL position"""
+        now = time.monotonic()
+        while self._primary_wal and now - self._primary_wal[0][0] > _WAL_HISTORY_SECONDS:
+            self._primary_wal.popleft()
+        if self.primary is None:
+            return
+        try:
+            async with self.primary.connect() as connection:
+                self._primary_wal.append((now, int(await connection.scalar(_PRIMARY_WAL_SQL))))
+        except Exception as e:
+            logger.warning("Primary WAL position check failed", error=str(e))
+
+    def _lag_behind_primary(self, replayed: int) -> float:
+        """Seconds since the newest primary sample the replica has replayed past, inf if none"""
+        for sampled_at, position in reversed(self._primary_wal):
+            if replayed >= position:
+                return time.monotonic() - sampled_at
+        return math.inf
+
+    async def _postgres_lag(self, connection) -> float:
+        in_recovery, replayed, receiving = (await connection.execute(_REPLICA_WAL_SQL)).one()
+        if not in_recovery:
+            return 0.0  # not a standby, e.g. a second database used for testing
+        if not receiving:
+            return math.inf
+        return self._lag_behind_primary(int(replayed))
+
+    async def check_lag(self) -> None:
+        """Measure every replica's replication lag; unreachable replicas are marked unavailable"""
+        if any(replica.engine.dialect.name == "postgresql" for replica in self.replicas):
+            await self._sample_primary_wal()
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    if connection.dialect.name == "postgresql":
+                        lag = await self._postgres_lag(connection)
+                    else:
+                        await connection.execute(text("SELECT 1"))
+                        lag = 0.0
+            except Exception as e:
+                logger.warning("Replica lag check failed", replica=replica.name, error=str(e))
+                lag = math.inf
+
+            if lag > self.max_lag_seconds and replica.lag_seconds <= self.max_lag_seconds:
+                logger.warning("Replica lagging, reads moved to primary", replica=replica.name, lag_seconds=lag)
+            replica.lag_seconds = lag
+            replica.checked_at = time.monotonic()
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+def _create_replica(url: str) -> Replica:
+    parsed = make_url(url)
+    # SQLite has no pool sizing; everything else shares the primary's settings
+    options = {} if parsed.get_backend_name() == "sqlite" else dict(
+        poolclass=TimedAsyncQueuePool,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+    if parsed.get_backend_name() == "postgresql":
+        url = async_database_url(url)
+        options["connect_args"] = RLS_CONNECT_ARGS
+    replica = Replica(
+        name=parsed.render_as_string(hide_password=True),
+        engine=create_async_engine(url, **options)
+    )
+    instrument_engine(f"replica:{replica.name}", replica.engine)
+    profile_engine(replica.engine)
+    count_queries(replica.engine)
+    enable_rls_context(replica.engine)
+    return replica
+
+read_router = ReplicaRouter(
+    [_create_replica(url) for url in settings.database_replica_urls],
+    strategy=settings.database_replica_strategy,
+    max_lag_seconds=settings.database_replica_max_lag_seconds,
+    check_interval_seconds=settings.database_replica_check_seconds,
+    primary=async_engine
+)
+
+def reads_pinned_to_primary(request: Request) -> bool:
+    """Whether the client wrote recently enough that it must read from the primary"""
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def pin_reads_to_primary(response: Response) -> None:
+    """Send the client's reads to the primary for read_your_writes_seconds"""
+    response.set_cookie(
+        READ_PRIMARY_COOKIE,
+        str(int(time.time()) + settings.read_your_writes_seconds),
+        max_age=settings.read_your_writes_seconds,
+        httponly=True,
+        samesite="lax"
+    )
+
+async def get_read_db(request: Request) -> AsyncSession:
+    """
+    Dependency to get a session for read-only endpoints
+    Served by a replica when one is available, otherwise by the primary
+    """
+    replica = None if reads_pinned_to_primary(request) else read_router.choose()
+    if replica is None:
+        factory = AsyncSessionLocal
+    else:
+        factory = replica.sessionmaker
+        replica.in_flight += 1
+
+    try:
+        async with factory() as db:
+            db.info["replica"] = replica.name if replica else None
+            try:
+                yield db
+            except Exception as e:
+                logger.error("Database session error", error=str(e))
+                await db.rollback()
+                raise
+    finally:
+        if replica is not None:
+            replica.in_flight -= 1
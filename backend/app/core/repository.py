@@ -0,0 +1,62 @@
+"""
+Hot lookups
+
+Referral by token, outcome by id (scoped to a VSA) or by referral, and user
+by id or username run on nearly every request. Building them inline with
+select(...).where(...) constructs a new statement each call, and SQLAlchemy
+then walks it to compute its compiled-cache key. The statements here are
+built once with bound parameters: their cache key is memoized on the
+object, so each call goes straight to the cached compiled SQL, and the SQL
+string is identical every time, which is what asyncpg's prepared statement
+cache keys on.
+
+benchmarks/lookup_overhead.py compares per-call overhead with the inline
+form.
+"""
+
+from typing import Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.outcomes import Outcome
+from app.models.referrals import Referral
+from app.models.users import User
+
+REFERRAL_BY_TOKEN = select(Referral).where(Referral.referral_token == bindparam("referral_token"))
+
+OUTCOME_BY_ID = select(Outcome).where(
+    Outcome.id == bindparam("outcome_id"),
+    Outcome.vsa_id == bindparam("vsa_id")
+)
+
+OUTCOME_BY_REFERRAL = select(Outcome).where(Outcome.referral_token == bindparam("referral_token"))
+
+USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+
+async def get_referral(db: AsyncSession, referral_token) -> Optional[Referral]:
+    """Referral by token"""
+    return await db.scalar(REFERRAL_BY_TOKEN, {"referral_token": referral_token})
+
+async def get_outcome(db: AsyncSession, outcome_id: str, vsa_id: Optional[str]) -> Optional[Outcome]:
+    """Outcome by id, only if it belongs to vsa_id"""
+    return await db.scalar(OUTCOME_BY_ID, {"outcome_id": outcome_id, "vsa_id": vsa_id})
+
+async def get_outcome_for_referral(db: AsyncSession, referral_token) -> Optional[Outcome]:
+    """The outcome recorded for a referral, if any"""
+    return await db.scalar(OUTCOME_BY_REFERRAL, {"referral_token": referral_token})
+
+async def get_user(db: AsyncSession, user_id: str) -> Optional[User]:
+    """User by id"""
+    return await db.scalar(USER_BY_ID, {"user_id": user_id})
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    """User by username"""
+    return await db.scalar(USER_BY_USERNAME, {"username": username})
+
+def get_user_by_username_sync(db: Session, username: str) -> Optional[User]:
+    """get_user_by_username for synchronous sessions"""
+    return db.scalar(USER_BY_USERNAME, {"username": username})
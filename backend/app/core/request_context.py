@@ -0,0 +1,55 @@
+"""
+Per-request context
+
+The request middleware sets current_request for the duration of each
+request. Code far from the endpoint (pool events, query hooks, logging)
+can then attribute its work to a request id and route without having the
+request passed down. Context variables follow the request into dependency
+threads and tasks it starts; outside a request (scheduler jobs, scripts)
+current_request is None.
+"""
+
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+@dataclass
+class RequestContext:
+    """The request being served"""
+    method: str
+    scope: dict = field(repr=False)
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    queries: int = 0  # statements executed on its behalf (see metrics.count_queries)
+
+    @property
+    def route(self) -> str:
+        """
+        Route template, e.g. "GET /v1/referrals/{referral_token}"
+
+        Resolved lazily: the router records the matched route in the scope
+        after the middleware has set the context. Templates rather than raw
+        paths keep the number of distinct labels bounded.
+        """
+        route = self.scope.get("route")
+        if route is None:
+            return f"{self.method} unmatched"
+        # route.path may be relative to the routers it was included through;
+        # the segments of the request path it didn't match are their prefixes
+        depth = route.path.count("/")
+        path = self.scope.get("path", "")
+        prefix = path.rsplit("/", depth)[0] if depth else path
+        return f"{self.method} {prefix}{route.path}"
+
+current_request: ContextVar[Optional[RequestContext]] = ContextVar("current_request", default=None)
+
+def current_route(default: str = "background") -> str:
+    """Route of the current request, or default outside a request"""
+    context = current_request.get()
+    return context.route if context is not None else default
+
+def current_request_id() -> Optional[str]:
+    context = current_request.get()
+    return context.request_id if context is not None else None
@@ -0,0 +1,122 @@
+"""
+Access token revocation
+
+Tokens issued in claims mode carry the user's role, vsa_id and
+token_version, so requests are authorized without reading the users table.
+What the claims can't say is that the user has since been deactivated or
+had their tokens revoked; this module keeps that in memory.
+
+Every user change that should end existing sessions (deactivation, a new
+role or VSA, a password change) increments users.token_version. A token is
+revoked when its version is older than the user's current one, or when the
+user is inactive. Each worker reloads the users that have ever been revoked
+on a short interval (auth_revocation_refresh_seconds) and applies changes
+it commits itself immediately.
+
+The same set guards the per-worker cache of verified tokens in both modes:
+a cached snapshot is dropped once its user's version moves on or the user
+is deactivated, so a change made through one worker reaches the others
+within a refresh interval rather than after auth_cache_ttl_seconds.
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.engine import Engine
+import structlog
+
+from app.core.database import engine
+from app.models.users import User
+
+logger = structlog.get_logger()
+
+class RevocationEntry(NamedTuple):
+    token_version: int
+    is_active: bool
+
+class TokenRevocations:
+    """Thread-safe map of user id -> current token version and active flag"""
+
+    def __init__(self):
+        self._entries: Dict[str, RevocationEntry] = {}
+        # Changes recorded locally, kept until a reload that started after them
+        self._recorded: Dict[str, Tuple[float, RevocationEntry]] = {}
+        self._lock = threading.Lock()
+        self.loaded_at: Optional[float] = None
+
+    def is_revoked(self, user_id: str, token_version: Optional[int]) -> bool:
+        """
+        Whether a token for user_id issued at token_version is no longer valid
+
+        Pass None for tokens that predate versioning; only deactivation
+        revokes those.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        if not entry.is_active:
+            return True
+        return token_version is not None and token_version < entry.token_version
+
+    def is_current(self, max_age_seconds: float) -> bool:
+        """Whether a reload completed within the last max_age_seconds"""
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at <= max_age_seconds
+
+    def record(self, user_id: str, token_version: int, is_active: bool) -> None:
+        """Apply a committed user change without waiting for the next reload"""
+        entry = RevocationEntry(token_version or 0, bool(is_active))
+        with self._lock:
+            self._recorded[user_id] = (time.monotonic(), entry)
+            self._entries[user_id] = entry
+
+    def replace(self, rows: Iterable[Tuple[str, int, bool]], started_at: float) -> int:
+        """
+        Swap in a full reload of (user_id, token_version, is_active) rows
+
+        Local changes recorded after the reload query started win over the
+        rows it returned, which may predate them.
+        """
+        entries = {user_id: RevocationEntry(version or 0, bool(active)) for user_id, version, active in rows}
+        with self._lock:
+            for user_id, (recorded_at, entry) in list(self._recorded.items()):
+                if recorded_at >= started_at:
+                    entries[user_id] = entry
+                else:
+                    del self._recorded[user_id]
+            self._entries = entries
+            self.loaded_at = time.monotonic()
+        return len(entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._recorded.clear()
+            self.loaded_at = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Per-process revocation state, reloaded by the scheduler
+token_revocations = TokenRevocations()
+
+def refresh_token_revocations(db_engine: Optional[Engine] = None) -> int:
+    """
+    Reload revocation state for users whose tokens may have been revoked
+
+    Users still on token_version 0 and active have never had a token
+    revoked and are left out, so the set stays small. Returns the number
+    of users loaded.
+    """
+    db_engine = db_engine or engine
+    started_at = time.monotonic()
+    with db_engine.connect() as connection:
+        rows = connection.execute(
+            select(User.id, User.token_version, User.is_active)
+            .where(or_(User.token_version > 0, User.is_active.isnot(True)))
+        ).all()
+
+    loaded = token_revocations.replace(rows, started_at)
+    logger.debug("Token revocations refreshed", users=loaded)
+    return loaded
@@ -0,0 +1,152 @@
+"""
+Row-level security context
+
+database/schema.sql isolates VSAs with row-level security policies keyed on
+the app.vsa_id, app.user_id and app.user_role settings (app.user_id is also
+what the audit trigger records as changed_by). set_rls_context() marks a
+session with the current user; each transaction the session then begins
+starts with SET LOCAL of those settings, so they last exactly that
+transaction and never carry over to the next user of a pooled connection.
+
+The SET LOCALs ride along with something the transaction sends anyway
+instead of costing a round trip of their own:
+
+- asyncpg: appended to the BEGIN, which goes out over the simple query
+  protocol where one message may hold several statements,
+- psycopg2: prepended to the transaction's first statement (psycopg2
+  interpolates parameters client-side, so the same holds).
+
+Policies don't apply to the tables' owner, which is what the app usually
+connects as. With rls_roles_enabled each transaction also switches to the
+non-owner vrp_vsa_access or vrp_va_access role from database/rls.sql, so
+the policies are enforced regardless of the login. Without roles the
+settings only matter when the login isn't the owner.
+
+The endpoints' own vsa_id filters stay: they are what lets VSA queries use
+the vsa_id indexes under the policies' OR (see database/rls.sql).
+"""
+
+from typing import Optional
+
+import asyncpg
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+RLS_CONTEXT_KEY = "rls_context"
+VSA_ROLE = "vrp_vsa_access"
+VA_ADMIN_ROLE = "vrp_va_access"
+
+def _literal(value) -> str:
+    """A SQL string literal (standard_conforming_strings is on since PostgreSQL 9.1)"""
+    value = str(value)
+    if "\x00" in value:
+        raise ValueError("NUL in RLS context value")
+    return "'" + value.replace("'", "''") + "'"
+
+def rls_settings(user) -> dict:
+    """The app.* settings the policies read, for an AuthenticatedUser"""
+    role = getattr(user.role, "value", user.role)
+    return {
+        "app.vsa_id": user.vsa_id or "",
+        "app.user_id": user.id,
+        "app.user_role": role,
+    }
+
+def rls_role(user) -> Optional[str]:
+    """Database role for the user's transactions, if rls_roles_enabled"""
+    if not settings.rls_roles_enabled:
+        return None
+    return VA_ADMIN_ROLE if user.is_va_admin else VSA_ROLE
+
+def rls_context_sql(user) -> str:
+    """SET LOCAL statements establishing the user's context in a transaction"""
+    statements = []
+    role = rls_role(user)
+    if role:
+        statements.append(f"SET LOCAL ROLE {role}")
+    statements += [f"SET LOCAL {name} = {_literal(value)}" for name, value in rls_settings(user).items()]
+    return "; ".join(statements) + ";"
+
+async def set_rls_context(db: AsyncSession, user) -> None:
+    """Run the session's transactions, from the next one on, as user"""
+    if not settings.rls_context_enabled:
+        return
+    db.info[RLS_CONTEXT_KEY] = rls_context_sql(user)
+    if db.in_transaction() and db.get_bind().dialect.name == "postgresql":
+        # Already begun (e.g. the auth dependency loaded the user through this
+        # session): too late to piggyback, so this costs one round trip
+        values = rls_settings(user)
+        role = rls_role(user)
+        await db.execute(
+            text(
+                "SELECT set_config('app.vsa_id', :vsa_id, true), set_config('app.user_id', :user_id, true), "
+                "set_config('app.user_role', :user_role, true)"
+                + (", set_config('role', :role, true)" if role else "")
+            ),
+            {
+                "vsa_id": values["app.vsa_id"],
+                "user_id": values["app.user_id"],
+                "user_role": values["app.user_role"],
+                **({"role": role} if role else {}),
+            }
+        )
+
+class RLSConnection(asyncpg.Connection):
+    """asyncpg connection that sends a pending RLS context with its next BEGIN"""
+
+    __slots__ = ("pending_rls_context",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_rls_context = None
+
+    async def execute(self, query: str, *args, timeout: Optional[float] = None) -> str:
+        if self.pending_rls_context and not args and query.startswith("BEGIN"):
+            query = f"{query} {self.pending_rls_context}"
+            self.pending_rls_context = None
+        return await super().execute(query, *args, timeout=timeout)
+
+# asyncpg engines pass these to create_async_engine
+RLS_CONNECT_ARGS = {"connection_class": RLSConnection}
+
+@event.listens_for(Session, "after_begin")
+def _send_rls_context(session, transaction, connection) -> None:
+    context = session.info.get(RLS_CONTEXT_KEY)
+    if context is None or connection.dialect.name != "postgresql":
+        return
+    # The DBAPI hasn't sent BEGIN yet: both drivers start lazily on the first statement
+    driver_connection = connection.connection.driver_connection
+    if isinstance(driver_connection, RLSConnection):
+        driver_connection.pending_rls_context = context
+    else:
+        connection.info[RLS_CONTEXT_KEY] = context
+
+def _prepend_rls_context(conn, cursor, statement, parameters, context, executemany):
+    pending = conn.info.pop(RLS_CONTEXT_KEY, None)
+    if pending is None:
+        return statement, parameters
+    if context is not None and context.execution_options.get("stream_results"):
+        # A named (server-side) cursor can only DECLARE one statement
+        cursor.connection.cursor().execute(pending)
+        return statement, parameters
+    if parameters is not None:
+        pending = pending.replace("%", "%%")
+    return f"{pending} {statement}", parameters
+
+def _clear_rls_context(dbapi_connection, connection_record) -> None:
+    # A transaction that never ran a statement mustn't hand its context to the next checkout
+    connection_record.info.pop(RLS_CONTEXT_KEY, None)
+    if isinstance(connection_record.driver_connection, RLSConnection):
+        connection_record.driver_connection.pending_rls_context = None
+
+def enable_rls_context(engine) -> None:
+    """Let sessions on this engine (sync or async) carry an RLS context"""
+    engine = getattr(engine, "sync_engine", engine)
+    if engine.dialect.name != "postgresql":
+        return
+    if engine.dialect.driver == "psycopg2":
+        event.listen(engine, "before_cursor_execute", _prepend_rls_context, retval=True)
+    event.listen(engine.pool, "checkin", _clear_rls_context)
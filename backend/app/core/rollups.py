@@ -0,0 +1,135 @@
+"""
+Referral rollup reconciliation
+
+referral_rollup_monthly is kept current by database triggers (see
+database/referral_rollups.sql). This module checks it against a full
+recompute from the base tables and can repair any groups that drifted.
+
+Run as a job:  python -m app.core.rollups [--repair]
+"""
+
+import argparse
+import sys
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+ROLLUP_KEY = ["vsa_id", "month", "program_code", "priority_level"]
+
+ROLLUP_COUNTERS = [
+    "total_referrals",
+    "received_count",
+    "engaged_count",
+    "waitlist_count",
+    "completed_count",
+    "unreachable_count",
+    "declined_count",
+    "contacted_count",
+    "hours_to_contact_sum",
+]
+
+# Groups can be absent on either side (a rollup row whose counters dropped
+# back to zero, or history that was never backfilled), so compare with
+# missing counters treated as zero. Months before retained_from have been
+# archived out of the base tables and only the rollup still has them.
+_MISMATCHED_GROUPS = """
+    FROM referral_rollup_monthly rollup
+    FULL OUTER JOIN referral_rollup_recomputed actual USING ({key})
+    WHERE ({rollup_counters}) IS DISTINCT FROM ({actual_counters})
+      AND (CAST(:retained_from AS date) IS NULL OR month >= :retained_from)
+""".format(
+    key=", ".join(ROLLUP_KEY),
+    rollup_counters=", ".join(f"COALESCE(rollup.{c}, 0)" for c in ROLLUP_COUNTERS),
+    actual_counters=", ".join(f"COALESCE(actual.{c}, 0)" for c in ROLLUP_COUNTERS),
+)
+
+def retained_from() -> Optional[date]:
+    """First month still in the base tables under referral_retention_months, or None if all are kept"""
+    if settings.referral_retention_months <= 0:
+        return None
+    now = datetime.now(timezone.utc)
+    months = now.year * 12 + now.month - 1 - settings.referral_retention_months
+    return date(months // 12, months % 12 + 1, 1)
+
+def find_rollup_mismatches(db: Session, limit: int = 100) -> List[Dict]:
+    """Return groups whose rollup counters differ from a full recompute"""
+    rows = db.execute(text(f"""
+        SELECT {", ".join(ROLLUP_KEY)},
+               {", ".join(f"rollup.{c} AS rollup_{c}, actual.{c} AS actual_{c}" for c in ROLLUP_COUNTERS)}
+        {_MISMATCHED_GROUPS}
+        ORDER BY month, vsa_id, program_code, priority_level
+        LIMIT :limit
+    """), {"limit": limit, "retained_from": retained_from()}).mappings().all()
+    return [dict(row) for row in rows]
+
+def repair_rollup(db: Session) -> int:
+    """
+    Overwrite drifted groups with recomputed values
+
+    Referral and outcome writes are blocked while the repair runs so no
+    trigger delta can land between the recompute and the overwrite.
+    Returns the number of groups rewritten; the caller commits.
+    """
+    db.execute(text("LOCK TABLE referrals, outcomes IN SHARE MODE"))
+    result = db.execute(text(f"""
+        INSERT INTO referral_rollup_monthly AS rollup ({", ".join(ROLLUP_KEY + ROLLUP_COUNTERS)})
+        SELECT {", ".join(ROLLUP_KEY)},
+               {", ".join(f"COALESCE(actual.{c}, 0)" for c in ROLLUP_COUNTERS)}
+        {_MISMATCHED_GROUPS}
+        ORDER BY {", ".join(ROLLUP_KEY)}
+        ON CONFLICT ({", ".join(ROLLUP_KEY)}) DO UPDATE SET
+            {", ".join(f"{c} = EXCLUDED.{c}" for c in ROLLUP_COUNTERS)},
+            updated_at = NOW()
+    """), {"retained_from": retained_from()})
+    return result.rowcount
+
+def reconcile_referral_rollup(db: Session, repair: bool = False, limit: int = 100) -> Dict:
+    """Check the rollup against a full recompute, optionally repairing drift"""
+    mismatches = find_rollup_mismatches(db, limit=limit)
+    report = {
+        "consistent": not mismatches,
+        "mismatched_groups": mismatches,
+        "repaired_groups": 0,
+    }
+
+    if mismatches:
+        logger.warning("Referral rollup drift detected", mismatched_groups=len(mismatches))
+        if repair:
+            report["repaired_groups"] = repair_rollup(db)
+            db.commit()
+            logger.info("Referral rollup repaired", repaired_groups=report["repaired_groups"])
+    else:
+        logger.info("Referral rollup consistent")
+
+    return report
+
+def main(argv=None) -> int:
+    """Reconciliation job entry point"""
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconcile referral_rollup_monthly against a full recompute")
+    parser.add_argument("--repair", action="store_true", help="Rewrite drifted groups with recomputed values")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum mismatched groups to report")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        report = reconcile_referral_rollup(db, repair=args.repair, limit=args.limit)
+    finally:
+        db.close()
+
+    for group in report["mismatched_groups"]:
+        print(group)
+    print(f"consistent={report['consistent']} mismatched={len(report['mismatched_groups'])} repaired={report['repaired_groups']}")
+
+    return 0 if report["consistent"] or report["repaired_groups"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+In-process scheduler for periodic background jobs
+
+Jobs are plain synchronous callables (typically short database
+maintenance tasks), each run in a worker thread so it never blocks the
+event loop, or coroutine functions, which are awaited on the loop. Every
+API worker process runs its own scheduler, so jobs that must run once
+cluster-wide need their own guard (e.g. an advisory lock).
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import Callable, Dict
+import structlog
+
+logger = structlog.get_logger()
+
+@dataclass
+class ScheduledJob:
+    """A job run every `interval_seconds`"""
+    name: str
+    func: Callable[[], object]
+    interval_seconds: float
+    run_at_startup: bool = False
+
+class Scheduler:
+    """Runs registered jobs on fixed intervals inside the event loop"""
+    
+    def __init__(self):
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+    
+    def add_job(
+        self,
+        name: str,
+        func: Callable[[], object],
+        interval_seconds: float,
+        run_at_startup: bool = False
+    ) -> None:
+        """Register (or replace) a job; must be called before start()"""
+        self._jobs[name] = ScheduledJob(name, func, interval_seconds, run_at_startup)
+    
+    def start(self) -> None:
+        """Start one task per registered job"""
+        for job in self._jobs.values():
+            if job.name not in self._tasks:
+                self._tasks[job.name] = asyncio.create_task(self._run(job), name=f"scheduler:{job.name}")
+        logger.info("Scheduler started", jobs=list(self._jobs))
+    
+    async def stop(self) -> None:
+        """Cancel all job tasks and wait for them to finish"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        logger.info("Scheduler stopped")
+    
+    async def _run(self, job: ScheduledJob) -> None:
+        if not job.run_at_startup:
+            await asyncio.sleep(job.interval_seconds)
+        while True:
+            try:
+                if asyncio.iscoroutinefunction(job.func):
+                    await job.func()
+                else:
+                    await asyncio.to_thread(job.func)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A failing job must not kill the loop; try again next interval
+                logger.error("Scheduled job failed", job=job.name, error=str(e))
+            await asyncio.sleep(job.interval_seconds)
+
+# Application-wide scheduler, started and stopped by the app lifespan
+scheduler = Scheduler()
@@ -0,0 +1,298 @@
+"""
+Mergeable latency sketches
+
+Hours from referral issue to first contact and to close are summarised per
+(vsa_id, program_code, month) in outcome_latency_sketches so percentiles over
+any range can be answered by merging O(groups) sketches instead of scanning
+every outcome.
+
+The sketch is a DDSketch-style log-bucketed histogram: every quantile it
+returns is within RELATIVE_ACCURACY of the true value. Unlike t-digest or KLL
+it also supports exact removal, which outcome updates need (the old latency
+is taken out before the new one goes in).
+
+Rebuild from the base tables:  python -m app.core.sketches --rebuild
+"""
+
+import argparse
+import math
+import struct
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import structlog
+
+from app.models.sketches import OutcomeLatencySketch
+
+logger = structlog.get_logger()
+
+RELATIVE_ACCURACY = 0.01
+
+# Latencies below this many hours (about 4 seconds, or negative because of
+# clock skew) are all counted as zero
+MIN_INDEXED_HOURS = 1e-3
+
+LATENCY_METRICS = ("time_to_contact", "time_to_close")
+
+_SERIAL_VERSION = 1
+_HEADER = struct.Struct("<BdQ")
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class LatencySketch:
+    """Log-bucketed quantile sketch with bounded relative error"""
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def _index(self, value: float) -> Optional[int]:
+        if value < MIN_INDEXED_HOURS:
+            return None
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index: int) -> float:
+        # Midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add count occurrences of value (a negative count removes them)"""
+        index = self._index(value)
+        if index is None:
+            self.zero_count = max(self.zero_count + count, 0)
+            return
+        remaining = self.bins.get(index, 0) + count
+        if remaining > 0:
+            self.bins[index] = remaining
+        else:
+            self.bins.pop(index, None)
+
+    def remove(self, value: float) -> None:
+        """Remove one previously added occurrence of value"""
+        self.add(value, -1)
+
+    def merge(self, other: "LatencySketch") -> None:
+        """Fold another sketch with the same accuracy into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q (0-1), or None if the sketch is empty"""
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1")
+        total = self.count
+        if not total:
+            return None
+
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.bins))
+
+    def to_bytes(self) -> bytes:
+        """Compact encoding: header, then delta-encoded bin indexes and counts as varints"""
+        buffer = bytearray(_HEADER.pack(_SERIAL_VERSION, self.relative_accuracy, self.zero_count))
+        _write_varint(buffer, len(self.bins))
+        previous = None
+        for index in sorted(self.bins):
+            if previous is None:
+                # Zigzag so small negative indexes stay short
+                _write_varint(buffer, (index << 1) ^ (index >> 63))
+            else:
+                _write_varint(buffer, index - previous)
+            _write_varint(buffer, self.bins[index])
+            previous = index
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "LatencySketch":
+        version, relative_accuracy, zero_count = _HEADER.unpack_from(data)
+        if version != _SERIAL_VERSION:
+            raise ValueError(f"Unsupported sketch encoding version {version}")
+        sketch = cls(relative_accuracy)
+        sketch.zero_count = zero_count
+
+        offset = _HEADER.size
+        num_bins, offset = _read_varint(data, offset)
+        index = None
+        for _ in range(num_bins):
+            step, offset = _read_varint(data, offset)
+            index = (step >> 1) ^ -(step & 1) if index is None else index + step
+            sketch.bins[index], offset = _read_varint(data, offset)
+        return sketch
+
+def outcome_latencies(issued_at: datetime, first_contact_at: Optional[datetime],
+                      closed_at: Optional[datetime]) -> Dict[str, Optional[float]]:
+    """
+    Hours from issue to first contact and to close (None when not reached)
+    Timestamps without a zone (as clients may send them) are taken as UTC
+    """
+    def utc(moment):
+        return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+    def hours(moment):
+        if moment is None:
+            return None
+        return (utc(moment) - utc(issued_at)).total_seconds() / 3600
+
+    return {
+        "time_to_contact": hours(first_contact_at),
+        "time_to_close": hours(closed_at),
+    }
+
+def sketch_month(issued_at: datetime) -> date:
+    """UTC calendar month a referral's latencies are recorded under"""
+    return issued_at.astimezone(timezone.utc).date().replace(day=1)
+
+def apply_latency_changes(db: Session, changes: Iterable[Tuple]) -> None:
+    """
+    Record outcome latency changes in the stored sketches
+
+    Each change is (referral, before, after), where before/after are the
+    outcome_latencies() of the outcome prior to and after the write (None
+    for a new outcome). Runs in the caller's transaction, so the sketches
+    commit or roll back together with the outcome itself.
+    """
+    deltas = defaultdict(list)
+    for referral, before, after in changes:
+        before = before or {}
+        for metric in LATENCY_METRICS:
+            old, new = before.get(metric), after.get(metric)
+            if old == new:
+                continue
+            key = (referral.vsa_id, referral.program_code, sketch_month(referral.issued_at), metric)
+            if old is not None:
+                deltas[key].append((old, -1))
+            if new is not None:
+                deltas[key].append((new, 1))
+
+    # Lock groups in a fixed order so concurrent writers can't deadlock
+    for key in sorted(deltas, key=lambda k: (k[0], k[1].value, k[2], k[3])):
+        vsa_id, program_code, month, metric = key
+        db.execute(
+            insert(OutcomeLatencySketch)
+            .values(vsa_id=vsa_id, program_code=program_code, month=month, metric=metric,
+                    count=0, sketch=LatencySketch().to_bytes())
+            .on_conflict_do_nothing()
+        )
+        row = db.query(OutcomeLatencySketch).filter(
+            OutcomeLatencySketch.vsa_id == vsa_id,
+            OutcomeLatencySketch.program_code == program_code,
+            OutcomeLatencySketch.month == month,
+            OutcomeLatencySketch.metric == metric
+        ).with_for_update().one()
+
+        sketch = LatencySketch.from_bytes(row.sketch)
+        for value, count in deltas[key]:
+            sketch.add(value, count)
+        row.sketch = sketch.to_bytes()
+        row.count = sketch.count
+
+def merge_latency_sketches(db: Session, vsa_id: Optional[str] = None, month_from: Optional[date] = None,
+                           month_to: Optional[date] = None, program_code=None) -> Dict[str, LatencySketch]:
+    """Merge the stored sketches in range into one sketch per metric"""
+    query = db.query(OutcomeLatencySketch.metric, OutcomeLatencySketch.sketch).filter(OutcomeLatencySketch.count > 0)
+    if vsa_id:
+        query = query.filter(OutcomeLatencySketch.vsa_id == vsa_id)
+    if month_from:
+        query = query.filter(OutcomeLatencySketch.month >= month_from.replace(day=1))
+    if month_to:
+        query = query.filter(OutcomeLatencySketch.month <= month_to.replace(day=1))
+    if program_code:
+        query = query.filter(OutcomeLatencySketch.program_code == program_code)
+
+    merged = {metric: LatencySketch() for metric in LATENCY_METRICS}
+    for metric, data in query:
+        merged[metric].merge(LatencySketch.from_bytes(data))
+    return merged
+
+def rebuild_latency_sketches(db: Session) -> int:
+    """
+    Recompute every sketch from the base tables
+
+    Outcome writes are blocked while the rebuild runs. Returns the number of
+    groups written; the caller commits.
+    """
+    db.execute(text("LOCK TABLE outcomes IN SHARE MODE"))
+    db.execute(text("LOCK TABLE outcome_latency_sketches IN EXCLUSIVE MODE"))
+    rows = db.execute(text("""
+        SELECT r.vsa_id, r.program_code::text AS program_code, r.issued_at, o.first_contact_at, o.closed_at
+        FROM outcomes o
+        JOIN referrals r ON r.referral_token = o.referral_token
+        WHERE o.first_contact_at IS NOT NULL OR o.closed_at IS NOT NULL
+    """))
+
+    sketches = defaultdict(LatencySketch)
+    for row in rows:
+        latencies = outcome_latencies(row.issued_at, row.first_contact_at, row.closed_at)
+        for metric, value in latencies.items():
+            if value is not None:
+                sketches[(row.vsa_id, row.program_code, sketch_month(row.issued_at), metric)].add(value)
+
+    db.query(OutcomeLatencySketch).delete()
+    db.bulk_insert_mappings(OutcomeLatencySketch, [
+        dict(vsa_id=vsa_id, program_code=program_code, month=month, metric=metric,
+             count=sketch.count, sketch=sketch.to_bytes())
+        for (vsa_id, program_code, month, metric), sketch in sketches.items()
+    ])
+    return len(sketches)
+
+def main(argv=None) -> int:
+    """Sketch maintenance entry point"""
+    from app.core.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain outcome_latency_sketches")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every sketch from outcomes")
+    args = parser.parse_args(argv)
+
+    if not args.rebuild:
+        parser.print_help()
+        return 1
+
+    db = SessionLocal()
+    try:
+        groups = rebuild_latency_sketches(db)
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info("Latency sketches rebuilt", groups=groups)
+    print(f"rebuilt={groups}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,15 +3,31 @@ Veteran Referral Portal - FastAPI Application
 Main entry point for the API server
 """
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+import asyncio
+import ipaddress
 import structlog
 import time
 from contextlib import asynccontextmanager
 
 from app.config import settings
 from app.api.v1.api import api_router
+from app.core.analytics import refresh_referral_analytics
+from app.core.audit import audit_writer, render_audit_metrics
+from app.core.audit_archive import archive_audit_log
+from app.core.health import health_prober
+from app.core.metrics import aggregate_metrics, render_request_metrics, request_metrics, write_metrics_snapshot
+from app.core.partitions import maintain_partitions
+from app.core.pool_metrics import render_pool_metrics
+from app.core.query_profiler import render_query_metrics
+from app.core.replicas import pin_reads_to_primary, read_router
+from app.core.request_context import REQUEST_ID_HEADER, RequestContext, current_request
+from app.core.revocations import refresh_token_revocations
+from app.core.scheduler import scheduler
 
 # Configure structured logging
 structlog.configure(
@@ -41,10 +57,66 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Veteran Referral Portal API")
     logger.info("Running in development mode - database will be tested on first request")
     
+    if settings.analytics_refresh_enabled:
+        scheduler.add_job(
+            "refresh_referral_analytics",
+            refresh_referral_analytics,
+            interval_seconds=settings.analytics_refresh_interval_seconds,
+            run_at_startup=True
+        )
+    if settings.partition_maintenance_enabled:
+        scheduler.add_job(
+            "maintain_partitions",
+            maintain_partitions,
+            interval_seconds=settings.partition_maintenance_interval_seconds,
+            run_at_startup=True
+        )
+    if settings.audit_archive_after_days > 0:
+        scheduler.add_job(
+            "archive_audit_log",
+            archive_audit_log,
+            interval_seconds=settings.audit_archive_interval_seconds
+        )
+    # Every worker keeps its own copy, so this runs per process. Claims and
+    # cached token snapshots are only trusted while it is current.
+    scheduler.add_job(
+        "refresh_token_revocations",
+        refresh_token_revocations,
+        interval_seconds=settings.auth_revocation_refresh_seconds,
+        run_at_startup=True
+    )
+    if read_router.replicas:
+        scheduler.add_job(
+            "check_replica_lag",
+            read_router.check_lag,
+            interval_seconds=settings.database_replica_check_seconds,
+            run_at_startup=True
+        )
+    scheduler.add_job(
+        "probe_health",
+        health_prober.probe,
+        interval_seconds=settings.health_probe_interval_seconds,
+        run_at_startup=True
+    )
+    if settings.metrics_multiprocess_dir:
+        scheduler.add_job(
+            "write_metrics_snapshot",
+            lambda: write_metrics_snapshot(render_worker_metrics()),
+            interval_seconds=settings.metrics_flush_seconds,
+            run_at_startup=True
+        )
+    scheduler.start()
+    audit_writer.start()
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Veteran Referral Portal API")
+    await scheduler.stop()
+    await audit_writer.stop()
+    await read_router.dispose()
+    # Keep this worker's final counts in the totals other workers serve
+    write_metrics_snapshot(render_worker_metrics())
 
 # Create FastAPI app
 app = FastAPI(
@@ -70,13 +142,82 @@ app.add_middleware(
     allowed_hosts=settings.allowed_hosts
 )
 
-# Request timing middleware
+# Request timing and metrics
+def _content_length(headers) -> int:
+    try:
+        return int(headers.get("content-length", 0))
+    except ValueError:
+        return 0
+
+class RequestTiming:
+    """
+    Adds X-Process-Time and reports every request to request_metrics
+
+    A plain ASGI middleware so the report sits in one finally around the
+    whole response: it runs exactly once whether the body is sent in full,
+    the app raises, or the client disconnects before the body is read (a
+    wrapped body_iterator would then never start and never report).
+    Streamed bodies (NDJSON exports) have no length up front, so bytes are
+    counted as they go out and the clock stops when the last one is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        # Set by request_context, which wraps this middleware
+        context = current_request.get()
+        status, sent = 500, 0
+
+        async def measured_send(message) -> None:
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)["X-Process-Time"] = str(time.time() - start_time)
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        request_metrics.started()
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            method, _, route = context.route.partition(" ")
+            request_metrics.finished(
+                method, route, status, time.time() - start_time,
+                _content_length(Headers(scope=scope)), sent, context.queries
+            )
+
+app.add_middleware(RequestTiming)
+
+# Read-your-writes: after a successful write, the client's reads skip the
+# replicas until they have had time to catch up
 @app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
+async def pin_reads_after_write(request: Request, call_next):
     response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
+    if read_router.replicas and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        pin_reads_to_primary(response)
+    return response
+
+# Request context: lets pool and query instrumentation attribute work to the
+# route and request id. Added last so it wraps every other middleware.
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    context = RequestContext(method=request.method, scope=request.scope)
+    request_id = request.headers.get(REQUEST_ID_HEADER)
+    if request_id:
+        context.request_id = request_id[:64]
+    token = current_request.set(context)
+    try:
+        response = await call_next(request)
+    finally:
+        current_request.reset(token)
+    response.headers[REQUEST_ID_HEADER] = context.request_id
     return response
 
 # Include API router
@@ -93,6 +234,34 @@ async def health_check():
         "timestamp": time.time()
     }
 
+# Metrics endpoint (Prometheus text format)
+def render_worker_metrics() -> str:
+    """Everything this worker measures, in the Prometheus text exposition format"""
+    return render_pool_metrics() + render_query_metrics() + render_audit_metrics() + render_request_metrics()
+
+def scraper_allowed(request: Request) -> bool:
+    """Whether the connection comes from metrics_allowed_networks (its peer, not X-Forwarded-For)"""
+    try:
+        address = ipaddress.ip_address(request.client.host)
+    except (AttributeError, ValueError):
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.metrics_allowed_networks)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Request, connection pool, query and audit writer metrics
+    Summed over all workers when metrics_multiprocess_dir is set, else this worker's own.
+    Route templates and statement fingerprints are internal, so only
+    metrics_allowed_networks may scrape.
+    """
+    if not scraper_allowed(request):
+        raise HTTPException(status_code=403, detail="Metrics are only served to the monitoring network")
+    return PlainTextResponse(
+        await asyncio.to_thread(aggregate_metrics, render_worker_metrics()),
+        media_type="text/plain; version=0.0.4"
+    )
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -4,8 +4,11 @@ Database models for the Veteran Referral Portal
 
 from .referrals import Referral, ProgramCodeEnum, ReferralTypeEnum, PriorityLevelEnum, CrisisTypeEnum, UrgencyIndicatorEnum
 from .outcomes import Outcome, OutcomeStatusEnum, ReasonCodeEnum
-from .audit_log import AuditLog, AuditActionEnum, AuditResourceEnum
+from .audit_log import AuditLog, AuditArchiveSegment, AuditActionEnum, AuditResourceEnum
 from .users import User, UserRoleEnum
+from .rollups import ReferralMonthlyRollup
+from .sketches import OutcomeLatencySketch
+from .stats_versions import StatsVersion
 
 # Export all models
 __all__ = [
@@ -13,7 +16,11 @@ __all__ = [
     "Referral",
     "Outcome", 
     "AuditLog",
+    "AuditArchiveSegment",
     "User",
+    "ReferralMonthlyRollup",
+    "OutcomeLatencySketch",
+    "StatsVersion",
     
     # Enums
     "ProgramCodeEnum",
@@ -0,0 +1,36 @@
+"""
+Analytics views
+
+referral_analytics is a materialized view and materialized_view_refreshes is
+its refresh bookkeeping; both are defined in database/schema.sql. They are
+declared as lightweight table constructs rather than ORM models so that
+init_db() never tries to create them as plain tables.
+"""
+
+from sqlalchemy import String, DateTime, Integer, BigInteger, Numeric, Enum, table, column
+from app.models.referrals import (
+    ProgramCodeEnum, ReferralTypeEnum, PriorityLevelEnum, CrisisTypeEnum, UrgencyIndicatorEnum
+)
+
+referral_analytics = table(
+    "referral_analytics",
+    column("vsa_id", String),
+    column("program_code", Enum(ProgramCodeEnum, name="program_code_enum")),
+    column("referral_type", Enum(ReferralTypeEnum, name="referral_type_enum")),
+    column("priority_level", Enum(PriorityLevelEnum, name="priority_level_enum")),
+    column("crisis_type", Enum(CrisisTypeEnum, name="crisis_type_enum")),
+    column("urgency_indicator", Enum(UrgencyIndicatorEnum, name="urgency_indicator_enum")),
+    column("month", DateTime(timezone=True)),
+    column("total_referrals", BigInteger),
+    column("engaged_count", BigInteger),
+    column("completed_count", BigInteger),
+    column("unreachable_count", BigInteger),
+    column("avg_hours_to_contact", Numeric),
+)
+
+materialized_view_refreshes = table(
+    "materialized_view_refreshes",
+    column("view_name", String),
+    column("refreshed_at", DateTime(timezone=True)),
+    column("duration_ms", Integer),
+)
@@ -2,17 +2,20 @@
 Audit Log database model for WORM compliance
 """
 
-from sqlalchemy import Column, String, DateTime, Text, Enum, Index, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, JSON, String, Text, Uuid
+from sqlalchemy.dialects.postgresql import INET, JSONB
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
+import uuid
 
 class AuditActionEnum(str, enum.Enum):
     """Audit action enumeration"""
-    CREATE = "CREATE"
+    # Row changes, written by the audit triggers
+    INSERT = "INSERT"
     UPDATE = "UPDATE"
     DELETE = "DELETE"
+    # Application events, written by app.core.audit
     STATUS_CHANGE = "STATUS_CHANGE"
     CSV_IMPORT = "CSV_IMPORT"
     USER_LOGIN = "USER_LOGIN"
@@ -20,62 +23,70 @@ class AuditActionEnum(str, enum.Enum):
     ACCESS_DENIED = "ACCESS_DENIED"
 
 class AuditResourceEnum(str, enum.Enum):
-    """Audit resource enumeration"""
-    REFERRAL = "REFERRAL"
-    OUTCOME = "OUTCOME"
-    USER = "USER"
-    SYSTEM = "SYSTEM"
+    """Audit resource enumeration (the audit_log.table_name values)"""
+    REFERRAL = "referrals"
+    OUTCOME = "outcomes"
+    ORGANIZATION = "organizations"
+    USER = "users"
+    SYSTEM = "system"
 
 class AuditLog(Base):
-    """Audit log table model for WORM compliance"""
-    
-    __tablename__ = "audit_logs"
-    
-    # Primary key
-    id = Column(String(255), primary_key=True, default=lambda: f"audit_{func.now().strftime('%Y%m%d_%H%M%S')}_{func.random()}")
-    
-    # Timestamp (immutable)
-    timestamp = Column(DateTime(timezone=True), nullable=False, default=func.now())
-    
-    # User/actor information
-    user_id = Column(String(100), nullable=False, index=True)
-    vsa_id = Column(String(50), nullable=False, index=True)
-    ip_address = Column(String(45), nullable=True)  # IPv6 compatible
+    """
+    Audit log table model for WORM compliance
+
+    Maps audit_log from database/schema.sql (partitioned by month on
+    changed_at, see database/partitioning.sql), with the application event
+    columns from database/audit.sql.
+    """
+
+    __tablename__ = "audit_log"
+
+    # Primary key (partitioned tables include the partition key)
+    id = Column(Uuid(as_uuid=False), primary_key=True, default=lambda: str(uuid.uuid4()))
+    changed_at = Column(DateTime(timezone=True), primary_key=True, default=func.now())
+
+    # What changed
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(String(100), nullable=False)
+    action = Column(String(20), nullable=False)
+    old_values = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    new_values = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+
+    # Who and where from
+    changed_by = Column(String(100), nullable=False)
+    vsa_id = Column(String(50), nullable=True)
+    ip_address = Column(String(45).with_variant(INET(), "postgresql"), nullable=True)
     user_agent = Column(Text, nullable=True)
-    
-    # Action details
-    action = Column(Enum(AuditActionEnum), nullable=False)
-    resource_type = Column(Enum(AuditResourceEnum), nullable=False)
-    resource_id = Column(String(255), nullable=True, index=True)
-    
-    # Change details
-    old_values = Column(JSON, nullable=True)  # Previous state
-    new_values = Column(JSON, nullable=True)  # New state
-    change_summary = Column(Text, nullable=True)  # Human-readable summary
-    
-    # Context
-    session_id = Column(String(255), nullable=True)
-    request_id = Column(String(255), nullable=True)
-    
-    # Foreign keys (optional, for related records)
-    referral_token = Column(String(255), ForeignKey("referrals.referral_token"), nullable=True, index=True)
-    outcome_id = Column(String(255), ForeignKey("outcomes.id"), nullable=True, index=True)
-    
-    # Relationships
-    referral = relationship("Referral", back_populates="audit_logs")
-    outcome = relationship("Outcome", back_populates="audit_logs")
-    
-    # Indexes for performance and compliance
+    request_id = Column(String(64), nullable=True)
+
+    def __repr__(self):
+        return f"<AuditLog(id={self.id}, action={self.action}, table_name={self.table_name}, changed_at={self.changed_at})>"
+
+class AuditArchiveSegment(Base):
+    """
+    Manifest of the audit log segments archived to files (app/core/audit_archive.py)
+
+    One row per segment, in archive order. hash is the segment's last
+    hash-chain value and the next segment's previous_hash, so the manifest
+    anchors the chain outside the files.
+    """
+
+    __tablename__ = "audit_archive_segments"
+
+    sequence = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False, unique=True)
+    first_changed_at = Column(DateTime(timezone=True), nullable=False)
+    last_changed_at = Column(DateTime(timezone=True), nullable=False)
+    entries = Column(Integer, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    footer_offset = Column(BigInteger, nullable=False)
+    previous_hash = Column(String(64), nullable=False)
+    hash = Column(String(64), nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
     __table_args__ = (
-        Index('idx_audit_logs_timestamp', 'timestamp'),
-        Index('idx_audit_logs_user_id', 'user_id'),
-        Index('idx_audit_logs_vsa_id', 'vsa_id'),
-        Index('idx_audit_logs_action', 'action'),
-        Index('idx_audit_logs_resource_type', 'resource_type'),
-        Index('idx_audit_logs_resource_id', 'resource_id'),
-        Index('idx_audit_logs_referral_token', 'referral_token'),
-        Index('idx_audit_logs_outcome_id', 'outcome_id'),
+        Index("idx_audit_archive_segments_changed_at", "first_changed_at", "last_changed_at"),
     )
-    
+
     def __repr__(self):
-        return f"<AuditLog(id={self.id}, action={self.action}, resource_type={self.resource_type}, timestamp={self.timestamp})>"
+        return f"<AuditArchiveSegment(sequence={self.sequence}, name={self.name}, entries={self.entries})>"
@@ -2,7 +2,7 @@
 Outcomes database model
 """
 
-from sqlalchemy import Column, String, DateTime, Text, Enum, Index, ForeignKey
+from sqlalchemy import Column, String, DateTime, Text, Enum, Index, ForeignKey, Uuid
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -34,17 +34,17 @@ class Outcome(Base):
     __tablename__ = "outcomes"
     
     # Primary key - use UUID to match database schema
-    id = Column(String(50), primary_key=True, index=True)
+    id = Column(Uuid(as_uuid=False), primary_key=True, index=True)
     
     # Foreign key to referral
-    referral_token = Column(String(255), ForeignKey("referrals.referral_token"), nullable=False, index=True)
+    referral_token = Column(Uuid(as_uuid=False), ForeignKey("referrals.referral_token"), nullable=False, index=True)
     
     # VSA that created this outcome
     vsa_id = Column(String(50), nullable=False, index=True)
     
     # Outcome details
-    status = Column(Enum(OutcomeStatusEnum), nullable=False)
-    reason_code = Column(Enum(ReasonCodeEnum), nullable=True)
+    status = Column(Enum(OutcomeStatusEnum, name="outcome_status_enum"), nullable=False)
+    reason_code = Column(Enum(ReasonCodeEnum, name="reason_code_enum"), nullable=True)
     
     # Timestamps
     first_contact_at = Column(DateTime(timezone=True), nullable=True)
@@ -59,7 +59,6 @@ class Outcome(Base):
     
     # Relationships
     referral = relationship("Referral", back_populates="outcomes")
-    audit_logs = relationship("AuditLog", back_populates="outcome", cascade="all, delete-orphan")
     
     # Indexes for performance
     __table_args__ = (
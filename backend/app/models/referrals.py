@@ -2,7 +2,7 @@
 Referrals database model
 """
 
-from sqlalchemy import Column, String, DateTime, Text, Enum, Index, ForeignKey
+from sqlalchemy import Column, String, DateTime, Text, Enum, Index, ForeignKey, Uuid
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -58,30 +58,35 @@ class Referral(Base):
     
     __tablename__ = "referrals"
     
-    # Primary key
-    referral_token = Column(String(255), primary_key=True, index=True)
+    # Primary key. Once partitioned the table is keyed on (referral_token,
+    # issued_at); the token stays unique through referral_tokens
+    # (database/partitioning.sql)
+    referral_token = Column(Uuid(as_uuid=False), primary_key=True, index=True)
     
     # Required fields
     issued_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
     vsa_id = Column(String(50), nullable=False, index=True)
-    program_code = Column(Enum(ProgramCodeEnum), nullable=False)
+    program_code = Column(Enum(ProgramCodeEnum, name="program_code_enum"), nullable=False)
     episode_id = Column(String(100), nullable=True)
-    referral_type = Column(Enum(ReferralTypeEnum), nullable=False)
-    priority_level = Column(Enum(PriorityLevelEnum), nullable=False)
+    referral_type = Column(Enum(ReferralTypeEnum, name="referral_type_enum"), nullable=False)
+    priority_level = Column(Enum(PriorityLevelEnum, name="priority_level_enum"), nullable=False)
     
     # Optional fields
-    crisis_type = Column(Enum(CrisisTypeEnum), nullable=True)
-    urgency_indicator = Column(Enum(UrgencyIndicatorEnum), nullable=True)
+    crisis_type = Column(Enum(CrisisTypeEnum, name="crisis_type_enum"), nullable=True)
+    urgency_indicator = Column(Enum(UrgencyIndicatorEnum, name="urgency_indicator_enum"), nullable=True)
     expected_contact_date = Column(DateTime(timezone=True), nullable=True)
     va_facility_code = Column(String(50), nullable=True)
     
+    # First contact time, copied from the outcome by a database trigger
+    # (database/overdue_contacts.sql)
+    contacted_at = Column(DateTime(timezone=True), nullable=True)
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), default=func.now())
     updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
     
     # Relationships
     outcomes = relationship("Outcome", back_populates="referral", cascade="all, delete-orphan")
-    audit_logs = relationship("AuditLog", back_populates="referral", cascade="all, delete-orphan")
     
     # Indexes for performance
     __table_args__ = (
@@ -89,6 +94,20 @@ class Referral(Base):
         Index('idx_referrals_program_code', 'program_code'),
         Index('idx_referrals_issued_at', 'issued_at'),
         Index('idx_referrals_priority_level', 'priority_level'),
+        Index('idx_referrals_crisis_type', 'crisis_type'),
+        Index('idx_referrals_urgency_indicator', 'urgency_indicator'),
+        Index('idx_referrals_vsa_date', 'vsa_id', 'issued_at', 'referral_token'),
+        # Overdue-contact queue: only uncontacted referrals with an expected date
+        Index(
+            'idx_referrals_overdue',
+            func.coalesce(urgency_indicator, 'STANDARD'), expected_contact_date, referral_token,
+            postgresql_where=(contacted_at.is_(None) & expected_contact_date.isnot(None))
+        ),
+        Index(
+            'idx_referrals_vsa_overdue',
+            vsa_id, func.coalesce(urgency_indicator, 'STANDARD'), expected_contact_date, referral_token,
+            postgresql_where=(contacted_at.is_(None) & expected_contact_date.isnot(None))
+        ),
     )
     
     def __repr__(self):
@@ -0,0 +1,41 @@
+"""
+Referral rollup database model
+
+Maintained by the triggers in database/referral_rollups.sql; the API only reads it.
+"""
+
+from sqlalchemy import Column, String, Date, DateTime, BigInteger, Numeric, Enum, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.models.referrals import ProgramCodeEnum, PriorityLevelEnum
+
+class ReferralMonthlyRollup(Base):
+    """Per (vsa_id, program_code, priority_level, month) referral counters"""
+    
+    __tablename__ = "referral_rollup_monthly"
+    
+    # Group key
+    vsa_id = Column(String(50), primary_key=True)
+    month = Column(Date, primary_key=True)
+    program_code = Column(Enum(ProgramCodeEnum, name="program_code_enum"), primary_key=True)
+    priority_level = Column(Enum(PriorityLevelEnum, name="priority_level_enum"), primary_key=True)
+    
+    # Counters
+    total_referrals = Column(BigInteger, nullable=False, default=0)
+    received_count = Column(BigInteger, nullable=False, default=0)
+    engaged_count = Column(BigInteger, nullable=False, default=0)
+    waitlist_count = Column(BigInteger, nullable=False, default=0)
+    completed_count = Column(BigInteger, nullable=False, default=0)
+    unreachable_count = Column(BigInteger, nullable=False, default=0)
+    declined_count = Column(BigInteger, nullable=False, default=0)
+    contacted_count = Column(BigInteger, nullable=False, default=0)
+    hours_to_contact_sum = Column(Numeric, nullable=False, default=0)
+    
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('idx_referral_rollup_month', 'month'),
+    )
+    
+    def __repr__(self):
+        return f"<ReferralMonthlyRollup(vsa_id={self.vsa_id}, month={self.month}, program_code={self.program_code}, priority_level={self.priority_level})>"
@@ -0,0 +1,35 @@
+"""
+Outcome latency sketch database model
+
+Written by app.core.sketches alongside every outcome write; see
+database/latency_sketches.sql.
+"""
+
+from sqlalchemy import Column, String, Date, DateTime, BigInteger, LargeBinary, Enum, Index
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.models.referrals import ProgramCodeEnum
+
+class OutcomeLatencySketch(Base):
+    """Serialized latency sketch per (vsa_id, program_code, month, metric)"""
+    
+    __tablename__ = "outcome_latency_sketches"
+    
+    # Group key
+    vsa_id = Column(String(50), primary_key=True)
+    program_code = Column(Enum(ProgramCodeEnum, name="program_code_enum"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    metric = Column(String(32), primary_key=True)  # time_to_contact | time_to_close
+    
+    # Number of latencies in the sketch, and the sketch itself (LatencySketch.to_bytes)
+    count = Column(BigInteger, nullable=False, default=0)
+    sketch = Column(LargeBinary, nullable=False)
+    
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('idx_outcome_latency_sketches_month', 'month'),
+    )
+    
+    def __repr__(self):
+        return f"<OutcomeLatencySketch(vsa_id={self.vsa_id}, program_code={self.program_code}, month={self.month}, metric={self.metric})>"
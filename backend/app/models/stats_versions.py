@@ -0,0 +1,22 @@
+"""
+Stats cache version database model
+
+Advanced by app.core.cache.StatsCache.bump() in every referral and outcome
+write transaction; see database/stats_versions.sql.
+"""
+
+from sqlalchemy import Column, String, DateTime, BigInteger
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class StatsVersion(Base):
+    """Per-VSA counter that retires cached stats when the VSA's data changes"""
+    
+    __tablename__ = "stats_versions"
+    
+    vsa_id = Column(String(50), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<StatsVersion(vsa_id={self.vsa_id}, version={self.version})>"
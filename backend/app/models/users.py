@@ -2,7 +2,7 @@
 User database model for authentication and authorization
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, Enum, ForeignKey, Text
+from sqlalchemy import Column, String, Boolean, DateTime, Enum, ForeignKey, Integer, Text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -29,13 +29,16 @@ class User(Base):
     
     # User information
     full_name = Column(String(255), nullable=False)
-    role = Column(Enum(UserRoleEnum), nullable=False)
+    role = Column(Enum(UserRoleEnum, name="user_role_enum"), nullable=False)
     vsa_id = Column(String(50), nullable=True)  # TODO: Add ForeignKey when Organization model is created
     
     # Status
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     
+    # Incremented to revoke every token issued so far (see app/core/revocations.py)
+    token_version = Column(Integer, nullable=False, default=0)
+    
     # Contact information
     phone = Column(String(50), nullable=True)
     position = Column(String(100), nullable=True)
@@ -4,7 +4,8 @@ Pydantic schemas for data validation
 
 from .referrals import (
     ReferralBase, ReferralCreate, ReferralUpdate, ReferralResponse, 
-    ReferralListResponse, ReferralImportRequest, ReferralImportResponse
+    ReferralListResponse, ReferralImportRequest, ReferralImportResponse,
+    OverdueReferralResponse, OverdueReferralListResponse
 )
 from .outcomes import (
     OutcomeBase, OutcomeCreate, OutcomeUpdate, OutcomeResponse,
@@ -14,11 +15,17 @@ from .auth import (
     Token, TokenData, UserLogin, UserCreate, UserUpdate, UserResponse,
     UserListResponse, PasswordChange, PasswordReset, PasswordResetConfirm
 )
+from .analytics import (
+    ReferralAnalyticsRow, ReferralAnalyticsResponse, FunnelPeriod, FunnelResponse,
+    LatencyQuantiles, LatencyResponse
+)
+from .audit import AuditLogEntry, AuditLogListResponse
 
 __all__ = [
     # Referral schemas
     "ReferralBase", "ReferralCreate", "ReferralUpdate", "ReferralResponse",
     "ReferralListResponse", "ReferralImportRequest", "ReferralImportResponse",
+    "OverdueReferralResponse", "OverdueReferralListResponse",
     
     # Outcome schemas
     "OutcomeBase", "OutcomeCreate", "OutcomeUpdate", "OutcomeResponse",
@@ -27,4 +34,11 @@ __all__ = [
     # Auth schemas
     "Token", "TokenData", "UserLogin", "UserCreate", "UserUpdate", "UserResponse",
     "UserListResponse", "PasswordChange", "PasswordReset", "PasswordResetConfirm",
+    
+    # Analytics schemas
+    "ReferralAnalyticsRow", "ReferralAnalyticsResponse", "FunnelPeriod", "FunnelResponse",
+    "LatencyQuantiles", "LatencyResponse",
+    
+    # Audit schemas
+    "AuditLogEntry", "AuditLogListResponse",
 ]
@@ -0,0 +1,69 @@
+"""
+Pydantic schemas for analytics responses
+"""
+
+from pydantic import BaseModel
+from typing import Optional
+from datetime import date, datetime
+from app.models.referrals import (
+    ProgramCodeEnum, ReferralTypeEnum, PriorityLevelEnum, CrisisTypeEnum, UrgencyIndicatorEnum
+)
+
+class ReferralAnalyticsRow(BaseModel):
+    """One referral_analytics group"""
+    vsa_id: str
+    program_code: ProgramCodeEnum
+    referral_type: ReferralTypeEnum
+    priority_level: PriorityLevelEnum
+    crisis_type: Optional[CrisisTypeEnum] = None
+    urgency_indicator: Optional[UrgencyIndicatorEnum] = None
+    month: datetime
+    total_referrals: int
+    engaged_count: int
+    completed_count: int
+    unreachable_count: int
+    avg_hours_to_contact: Optional[float] = None
+    
+    class Config:
+        from_attributes = True
+
+class ReferralAnalyticsResponse(BaseModel):
+    """Referral analytics with the time the underlying view was refreshed"""
+    rows: list[ReferralAnalyticsRow]
+    as_of: Optional[datetime] = None
+    vsa_id: Optional[str] = None
+
+class FunnelPeriod(BaseModel):
+    """Referral funnel counts for one time bucket"""
+    period: datetime
+    issued: int
+    received: int
+    engaged: int
+    completed: int
+    unreachable: int
+
+class FunnelResponse(BaseModel):
+    """Referral funnel time series"""
+    periods: list[FunnelPeriod]
+    bucket: str
+    vsa_id: Optional[str] = None
+    issued_from: Optional[datetime] = None
+    issued_to: Optional[datetime] = None
+    as_of: datetime
+
+class LatencyQuantiles(BaseModel):
+    """Latency percentiles in hours"""
+    count: int
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class LatencyResponse(BaseModel):
+    """Time-to-contact and time-to-close percentiles merged from latency sketches"""
+    time_to_contact: LatencyQuantiles
+    time_to_close: LatencyQuantiles
+    relative_accuracy: float
+    vsa_id: Optional[str] = None
+    program_code: Optional[ProgramCodeEnum] = None
+    month_from: Optional[date] = None
+    month_to: Optional[date] = None
@@ -0,0 +1,32 @@
+"""
+Pydantic schemas for audit log queries
+"""
+
+from pydantic import BaseModel, Field, IPvAnyAddress
+from typing import Any, Optional
+from datetime import datetime
+from uuid import UUID
+
+class AuditLogEntry(BaseModel):
+    """Schema for an audit log entry"""
+    id: UUID
+    changed_at: datetime
+    table_name: str
+    record_id: str
+    action: str
+    old_values: Optional[dict[str, Any]] = None
+    new_values: Optional[dict[str, Any]] = None
+    changed_by: str
+    vsa_id: Optional[str] = None
+    ip_address: Optional[IPvAnyAddress] = None
+    user_agent: Optional[str] = None
+    request_id: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class AuditLogListResponse(BaseModel):
+    """Schema for a page of audit log entries"""
+    entries: list[AuditLogEntry]
+    size: int
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
@@ -53,7 +53,11 @@ class OutcomeStatsResponse(BaseModel):
     by_status: dict[str, int]
     by_reason: dict[str, int]
     avg_time_to_contact: Optional[float] = None
+    median_time_to_contact: Optional[float] = None
+    p90_time_to_contact: Optional[float] = None
     avg_time_to_close: Optional[float] = None
+    median_time_to_close: Optional[float] = None
+    p90_time_to_close: Optional[float] = None
     vsa_id: Optional[str] = None
 
 class OutcomeBulkCreate(BaseModel):
@@ -39,12 +39,23 @@ class ReferralResponse(ReferralBase):
     """Schema for referral response"""
     referral_token: UUID
     issued_at: datetime
+    contacted_at: Optional[datetime] = None
     created_at: datetime
     updated_at: datetime
     
     class Config:
         from_attributes = True
 
+class OverdueReferralResponse(ReferralResponse):
+    """Schema for a referral in the overdue-contact queue"""
+    days_overdue: int
+
+class OverdueReferralListResponse(BaseModel):
+    """Schema for a page of the overdue-contact queue"""
+    referrals: list[OverdueReferralResponse]
+    size: int
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
+
 class ReferralListResponse(BaseModel):
     """Schema for list of referrals"""
     referrals: list[ReferralResponse]
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Audit trigger bulk import benchmark
+
+Inserts a CSV-import-sized batch of referrals the way the import writes them
+(multi-row INSERTs of up to 1000 rows) with the audit triggers set up three
+ways, and reports throughput, audit rows written and WAL generated:
+
+- none: no audit trigger,
+- row: the per-row trigger audit.sql replaced (one function call and one
+  single-row INSERT into audit_log per referral),
+- statement: the statement-level triggers from database/audit.sql.
+
+Each run is one transaction that is rolled back, so nothing is kept; the
+trigger swaps lock referrals for the duration, so don't point this at a
+database in use. Needs database/audit.sql applied.
+
+From backend/:
+
+    python benchmarks/audit_trigger_import.py --rows 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, insert, select, text
+
+from app.core.database import engine
+from app.models.audit_log import AuditLog
+from app.models.referrals import Referral, PriorityLevelEnum, ProgramCodeEnum, ReferralTypeEnum
+
+STATEMENT_TRIGGERS = ("referrals_audit_insert_trigger", "referrals_audit_update_trigger", "referrals_audit_delete_trigger")
+
+ROW_TRIGGER = """
+CREATE FUNCTION pg_temp.referrals_audit_row_trigger() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by, vsa_id)
+    VALUES ('referrals', NEW.referral_token::VARCHAR, 'INSERT', to_jsonb(NEW), audit_changed_by(), NEW.vsa_id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+def drop_statement_triggers(connection):
+    for trigger in STATEMENT_TRIGGERS:
+        connection.execute(text(f"DROP TRIGGER {trigger} ON referrals"))
+
+def setup(connection, mode):
+    if mode == "statement":
+        return
+    drop_statement_triggers(connection)
+    if mode == "row":
+        connection.execute(text(ROW_TRIGGER))
+        connection.execute(text(
+            "CREATE TRIGGER referrals_audit_row_trigger AFTER INSERT ON referrals "
+            "FOR EACH ROW EXECUTE FUNCTION pg_temp.referrals_audit_row_trigger()"
+        ))
+
+def referral_rows(count, vsa_id):
+    issued_at = datetime.now(timezone.utc) - timedelta(minutes=1)
+    return [{
+        "referral_token": uuid.uuid4(),
+        "issued_at": issued_at,
+        "vsa_id": vsa_id,
+        "program_code": ProgramCodeEnum.MENTAL_HEALTH,
+        "referral_type": ReferralTypeEnum.CLINICAL_REFERRAL,
+        "priority_level": PriorityLevelEnum.MEDIUM,
+    } for _ in range(count)]
+
+def run(mode, rows):
+    with engine.connect() as connection:
+        try:
+            setup(connection, mode)
+            audited = connection.scalar(select(func.count()).select_from(AuditLog.__table__))
+            wal = connection.scalar(text("SELECT pg_current_wal_insert_lsn()"))
+            started = time.perf_counter()
+            connection.execute(insert(Referral.__table__), rows)
+            elapsed = time.perf_counter() - started
+            wal_bytes = connection.scalar(
+                text("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), :wal)"), {"wal": wal}
+            )
+            audited = connection.scalar(select(func.count()).select_from(AuditLog.__table__)) - audited
+        finally:
+            connection.rollback()
+    return elapsed, audited, int(wal_bytes)
+
+def main(args):
+    with engine.connect() as connection:
+        vsa_id = connection.scalar(text("SELECT id FROM organizations LIMIT 1"))
+        installed = connection.scalar(
+            text("SELECT count(*) FROM pg_trigger WHERE tgname = ANY(:names)"), {"names": list(STATEMENT_TRIGGERS)}
+        )
+    if not vsa_id:
+        sys.exit("Needs at least one organization in the database")
+    if installed != len(STATEMENT_TRIGGERS):
+        sys.exit("Audit triggers not found - apply database/audit.sql first")
+
+    print(f"{'triggers':<10} {'rows':>8} {'seconds':>8} {'rows/s':>9} {'audit rows':>11} {'WAL MB':>8}")
+    for mode in args.modes:
+        for _ in range(args.repeat):
+            elapsed, audited, wal_bytes = run(mode, referral_rows(args.rows, vsa_id))
+            print(f"{mode:<10} {args.rows:>8} {elapsed:8.2f} {args.rows / elapsed:9.0f} {audited:>11} "
+                  f"{wal_bytes / 1e6:8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", choices=["none", "row", "statement"],
+                        default=["none", "row", "statement"])
+    main(parser.parse_args())
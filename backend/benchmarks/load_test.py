@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Request throughput benchmark
+
+Runs a fixed number of concurrent clients against a mix of read endpoints
+for a set duration and reports requests per second and latency. Pass
+--base-url more than once to compare deployments side by side, e.g. the
+sync-session build against the AsyncSession one:
+
+    python benchmarks/load_test.py --base-url http://localhost:8000 \\
+        --base-url http://localhost:8001 --username vsa_user --password '...' \\
+        --concurrency 50 --duration 20
+
+Each client loops over --path in order; paths under /v1/outcomes or
+/v1/auth are sent with a bearer token from --username/--password.
+"""
+
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/v1/referrals/?size=50",
+    "/v1/referrals/overdue?size=50",
+    "/v1/outcomes/?size=50",
+    "/v1/auth/users/me",
+]
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of latencies"""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def needs_auth(path):
+    return path.startswith(("/v1/outcomes", "/v1/auth"))
+
+async def login(client, username, password):
+    response = await client.post("/v1/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run_client(client, paths, headers, deadline, latencies, errors, offset):
+    """Issue requests back to back until deadline"""
+    for path in itertools.islice(itertools.cycle(paths), offset, None):
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.get(path, headers=headers if needs_auth(path) else None)
+            if response.status_code != 200:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        latencies.append(time.perf_counter() - start)
+
+async def benchmark(base_url, args):
+    """Warm up, then run args.concurrency clients for args.duration seconds"""
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = await login(client, args.username, args.password)
+
+        warmup_deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(
+            run_client(client, args.path, headers, warmup_deadline, [], {}, i)
+            for i in range(args.concurrency)
+        ))
+
+        latencies, errors = [], {}
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            run_client(client, args.path, headers, deadline, latencies, errors, i)
+            for i in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+
+    ms = [s * 1000 for s in latencies]
+    print(f"{base_url}: {len(ms)} requests in {elapsed:.1f}s = {len(ms) / elapsed:.1f} req/s, "
+          f"p50={percentile(ms, 0.5):.1f}ms p90={percentile(ms, 0.9):.1f}ms p99={percentile(ms, 0.99):.1f}ms"
+          f"{f', errors={errors}' if errors else ''}")
+    return len(ms) / elapsed
+
+async def main(args):
+    results = []
+    for base_url in args.base_url:
+        results.append(await benchmark(base_url, args))
+    if len(results) > 1:
+        print("relative throughput: " + ", ".join(f"{rps / results[0]:.2f}x" for rps in results))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure request throughput at fixed concurrency")
+    parser.add_argument("--base-url", action="append", help="API to test; repeat to compare several")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", action="append", help="Endpoint to request; repeat for a mix")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="Measured seconds per base URL")
+    parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before each run")
+    args = parser.parse_args()
+    args.base_url = args.base_url or ["http://localhost:8000"]
+    args.path = args.path or DEFAULT_PATHS
+    asyncio.run(main(args))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Login storm benchmark
+
+Measures latency of an unrelated endpoint while many users log in at once
+(e.g. at shift change). Each bcrypt check costs ~250ms of CPU, so if hashing
+runs on the event loop every other request on the worker queues behind it.
+
+Start the API first, then:
+
+    python benchmarks/login_storm.py --base-url http://localhost:8000 \\
+        --username vsa_user --password '...' --logins 200 --concurrency 50
+
+The probe endpoint is polled before the storm (baseline) and during it, and
+p50/p90/p99 latencies are reported for both.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of latencies"""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def report(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<10} n={len(ms):<5} p50={percentile(ms, 0.5):8.1f}ms "
+          f"p90={percentile(ms, 0.9):8.1f}ms p99={percentile(ms, 0.99):8.1f}ms "
+          f"max={max(ms) if ms else float('nan'):8.1f}ms")
+
+async def probe(client, path, interval, stop):
+    """Poll path every interval seconds until stop is set, returning latencies"""
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get(path)
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+        await asyncio.sleep(interval)
+    return samples
+
+async def login_storm(client, args):
+    """Run args.logins logins with at most args.concurrency in flight"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async def login():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/v1/auth/login", data={
+                "username": args.username, "password": args.password
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                failures += 1
+
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    return latencies, failures
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120) as client:
+        # Baseline: probe alone
+        stop = asyncio.Event()
+        baseline_task = asyncio.create_task(probe(client, args.probe_path, args.probe_interval, stop))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        baseline = await baseline_task
+
+        # Storm: probe while logins run
+        stop = asyncio.Event()
+        storm_probe_task = asyncio.create_task(probe(client, args.probe_path, args.probe_interval, stop))
+        started = time.perf_counter()
+        login_latencies, failures = await login_storm(client, args)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        during_storm = await storm_probe_task
+
+    print(f"{args.logins} logins, concurrency {args.concurrency}: {elapsed:.1f}s "
+          f"({args.logins / elapsed:.1f}/s), {failures} failed")
+    report("login", login_latencies)
+    print(f"probe {args.probe_path}:")
+    report("baseline", baseline)
+    report("storm", during_storm)
+    if baseline and during_storm:
+        print(f"p99 slowdown during storm: {percentile(during_storm, 0.99) / percentile(baseline, 0.99):.1f}x "
+              f"(median {statistics.median(during_storm) * 1000:.1f}ms)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Probe endpoint latency during a login storm")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200, help="Total logins to perform")
+    parser.add_argument("--concurrency", type=int, default=50, help="Logins in flight at once")
+    parser.add_argument("--probe-path", default="/health", help="Unrelated endpoint to measure")
+    parser.add_argument("--probe-interval", type=float, default=0.02, help="Seconds between probes")
+    parser.add_argument("--baseline-seconds", type=float, default=3, help="How long to probe before the storm")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Hot lookup overhead benchmark
+
+Compares the per-call cost of the lookups in app/core/repository.py written
+three ways: built inline with select().where() on every call (as the
+endpoints used to), as a lambda_stmt, and as the pre-built statements the
+repository uses.
+
+Two measurements per lookup:
+
+- statement: building the statement and computing its compiled-cache key,
+  i.e. the client-side overhead before anything is sent (no database),
+- round trip: the whole async lookup against the configured database, with
+  a row that exists, through the same driver the API uses.
+
+From backend/:
+
+    python benchmarks/lookup_overhead.py --iterations 5000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import lambda_stmt, select
+
+from app.core import repository
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.outcomes import Outcome
+from app.models.referrals import Referral
+from app.models.users import User
+
+def inline(name, params):
+    if name == "referral by token":
+        return select(Referral).where(Referral.referral_token == params["referral_token"])
+    if name == "outcome by id":
+        return select(Outcome).where(Outcome.id == params["outcome_id"], Outcome.vsa_id == params["vsa_id"])
+    if name == "user by id":
+        return select(User).where(User.id == params["user_id"])
+    return select(User).where(User.username == params["username"])
+
+def lambda_(name, params):
+    if name == "referral by token":
+        token = params["referral_token"]
+        return lambda_stmt(lambda: select(Referral).where(Referral.referral_token == token))
+    if name == "outcome by id":
+        outcome_id, vsa_id = params["outcome_id"], params["vsa_id"]
+        return lambda_stmt(lambda: select(Outcome).where(Outcome.id == outcome_id, Outcome.vsa_id == vsa_id))
+    if name == "user by id":
+        user_id = params["user_id"]
+        return lambda_stmt(lambda: select(User).where(User.id == user_id))
+    username = params["username"]
+    return lambda_stmt(lambda: select(User).where(User.username == username))
+
+PREBUILT = {
+    "referral by token": repository.REFERRAL_BY_TOKEN,
+    "outcome by id": repository.OUTCOME_BY_ID,
+    "user by id": repository.USER_BY_ID,
+    "user by username": repository.USER_BY_USERNAME,
+}
+
+FORMS = {
+    "inline": lambda name, params: (inline(name, params), None),
+    "lambda": lambda name, params: (lambda_(name, params), None),
+    "prebuilt": lambda name, params: (PREBUILT[name], params),
+}
+
+def cache_key(statement):
+    """What every execution computes to find the compiled SQL"""
+    if hasattr(statement, "_generate_cache_key"):
+        return statement._generate_cache_key()
+    return statement._gen_cache_key  # lambda statements
+
+async def sample_params():
+    """Keys of rows that exist, so every lookup finds one"""
+    async with AsyncSessionLocal() as db:
+        outcome = await db.scalar(select(Outcome).limit(1))
+        referral = await db.scalar(select(Referral).limit(1))
+        user = await db.scalar(select(User).limit(1))
+    if not (outcome and referral and user):
+        sys.exit("Needs at least one referral, outcome and user in the database")
+    return {
+        "referral_token": referral.referral_token,
+        "outcome_id": outcome.id,
+        "vsa_id": outcome.vsa_id,
+        "user_id": user.id,
+        "username": user.username,
+    }
+
+def time_statements(form, name, params, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        statement, _ = form(name, params)
+        cache_key(statement)
+    return (time.perf_counter() - started) / iterations
+
+async def time_round_trips(form, name, params, iterations):
+    latencies = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            statement, bound = form(name, params)
+            await db.scalar(statement, bound)
+            db.expunge_all()  # a request's session starts empty
+            await db.rollback()
+            latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies)
+
+async def main(args):
+    try:
+        params = await sample_params()
+        print(f"{'lookup':<18} {'form':<9} {'statement':>10} {'round trip p50':>15}")
+        for name in PREBUILT:
+            for label, form in FORMS.items():
+                time_statements(form, name, params, args.warmup)
+                await time_round_trips(form, name, params, args.warmup)
+                statement = time_statements(form, name, params, args.iterations)
+                round_trip = await time_round_trips(form, name, params, args.iterations // 10 or 1)
+                print(f"{name:<18} {label:<9} {statement * 1e6:8.1f}us {round_trip * 1e6:13.1f}us")
+    finally:
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Row-level security overhead benchmark
+
+Runs the hot listing queries (built the way the endpoints build them)
+against the configured database three ways: as the login without policies,
+as a VSA user and as a VA admin under the database/rls.sql roles with the
+context the API sets. Reports p50/p95 per query and mode, and checks every
+plan for sequential scans on referrals or outcomes (with seq scans
+disabled, so one only appears when no index can serve the query).
+
+Apply database/rls.sql first, then from backend/:
+
+    python benchmarks/rls_overhead.py --iterations 500 --vsa-id VSA001
+
+Exits non-zero if any plan needs a seq scan.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.api.v1.endpoints.referrals import apply_overdue_filters, apply_referral_filters
+from app.config import settings
+from app.core.database import engine
+from app.core.rls import RLS_CONTEXT_KEY, rls_context_sql
+from app.models.outcomes import Outcome
+from app.models.referrals import PriorityLevelEnum, Referral
+from app.models.users import UserRoleEnum
+
+SCANNED = ("referrals", "outcomes")
+
+def queries(vsa_id):
+    """name -> (who runs it, statement)"""
+    return {
+        "vsa referral page": ("vsa", apply_referral_filters(select(Referral), vsa_id=vsa_id).order_by(
+            Referral.issued_at, Referral.referral_token
+        ).limit(100)),
+        "vsa referral 30d": ("vsa", apply_referral_filters(
+            select(Referral), vsa_id=vsa_id, issued_from=datetime.now(timezone.utc) - timedelta(days=30)
+        ).order_by(Referral.issued_at, Referral.referral_token).limit(100)),
+        "vsa overdue queue": ("vsa", apply_overdue_filters(select(Referral), vsa_id=vsa_id).limit(100)),
+        "vsa outcomes page": ("vsa", select(Outcome).where(Outcome.vsa_id == vsa_id).order_by(
+            Outcome.updated_at.desc()
+        ).limit(100)),
+        "admin high priority": ("va", apply_referral_filters(
+            select(Referral), priority_level=PriorityLevelEnum.HIGH
+        ).order_by(Referral.issued_at, Referral.referral_token).limit(100)),
+        "admin overdue queue": ("va", apply_overdue_filters(select(Referral)).limit(100)),
+    }
+
+def users(vsa_id):
+    return {
+        "vsa": SimpleNamespace(id="benchmark", role=UserRoleEnum.VSA_USER, vsa_id=vsa_id, is_va_admin=False),
+        "va": SimpleNamespace(id="benchmark", role=UserRoleEnum.VA_ADMIN, vsa_id=None, is_va_admin=True),
+    }
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+def seq_scans(session, statement):
+    """Relations (referrals/outcomes or their partitions) the plan seq scans"""
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    session.rollback()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return sorted({
+        node["Relation Name"] for node in plan_nodes(plan[0]["Plan"])
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name", "").startswith(SCANNED)
+    })
+
+def run(session, statement, iterations):
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        session.execute(statement).all()
+        session.rollback()  # a fresh transaction, so each run pays for its context
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def main(args):
+    with engine.connect() as connection:
+        if not connection.execute(text("SELECT to_regrole('vrp_vsa_access')")).scalar():
+            sys.exit("RLS roles not found - apply database/rls.sql first")
+
+    settings.rls_roles_enabled = True
+    people = users(args.vsa_id)
+    failed = False
+    print(f"{'query':<22} {'mode':<8} {'p50':>9} {'p95':>9}  seq scans")
+    for name, (who, statement) in queries(args.vsa_id).items():
+        baseline = None
+        for mode in ("no rls", who):
+            session = Session(bind=engine)
+            try:
+                if mode != "no rls":
+                    session.info[RLS_CONTEXT_KEY] = rls_context_sql(people[who])
+                scans = seq_scans(session, statement)
+                run(session, statement, args.warmup)
+                latencies = [s * 1000 for s in run(session, statement, args.iterations)]
+            finally:
+                session.close()
+
+            p50, p95 = statistics.median(latencies), percentile(latencies, 0.95)
+            overhead = f"  (+{p50 - baseline:.3f}ms p50)" if baseline is not None else ""
+            baseline = p50 if baseline is None else baseline
+            print(f"{name:<22} {mode:<8} {p50:8.3f}ms {p95:8.3f}ms  {', '.join(scans) or '-'}{overhead}")
+            failed = failed or bool(scans)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vsa-id", default="VSA001")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    sys.exit(main(parser.parse_args()))
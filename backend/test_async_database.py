@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test the async database layer
+
+asyncpg sends every parameter with an explicit type, so unlike psycopg2 a
+model column type that doesn't match the schema (enum type names, uuid
+columns) fails at query time. The queries here run through the async
+engine against the configured database to catch that.
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+try:
+    from app.api.v1.endpoints.referrals import apply_referral_filters, apply_overdue_filters
+    from app.core.database import async_database_url, async_engine
+    from app.models.outcomes import Outcome, OutcomeStatusEnum
+    from app.models.referrals import (
+        Referral, ProgramCodeEnum, PriorityLevelEnum, CrisisTypeEnum, UrgencyIndicatorEnum
+    )
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+TOKEN = "00000000-0000-0000-0000-000000000000"
+
+def test_async_url_keeps_connection_options():
+    url = make_url(async_database_url("postgresql+psycopg2://vrp:s3cret@/vrp?host=/tmp&port=5433"))
+    assert url.drivername == "postgresql+asyncpg"
+    assert url.password == "s3cret"
+    assert url.query == {"host": "/tmp", "port": "5433"}
+
+    url = make_url(async_database_url("postgresql://vrp:s3cret@db:5432/vrp"))
+    assert (url.drivername, url.host, url.port, url.database) == ("postgresql+asyncpg", "db", 5432, "vrp")
+
+QUERIES = {
+    "referral_filters": apply_referral_filters(
+        select(func.count(Referral.referral_token)),
+        vsa_id="VSA001",
+        program_code=ProgramCodeEnum.MENTAL_HEALTH,
+        priority_level=PriorityLevelEnum.HIGH,
+        crisis_type=CrisisTypeEnum.SUICIDE_RISK,
+        urgency_indicator=UrgencyIndicatorEnum.IMMEDIATE,
+    ),
+    "overdue_cursor": apply_overdue_filters(
+        select(Referral.referral_token),
+        urgency_indicator=UrgencyIndicatorEnum.WITHIN_24H,
+        after=("WITHIN_24H", date(2025, 6, 1), TOKEN),
+    ).limit(1),
+    "referral_by_token": select(Referral).where(Referral.referral_token == TOKEN),
+    "outcome_filters": select(Outcome.id).where(
+        Outcome.referral_token == TOKEN, Outcome.status == OutcomeStatusEnum.ENGAGED
+    ),
+}
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_queries_bind_under_asyncpg(name):
+    async def run():
+        try:
+            async with async_engine.connect() as conn:
+                await conn.execute(QUERIES[name])
+        finally:
+            await async_engine.dispose()
+
+    try:
+        asyncio.run(run())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Database not available: {e}")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test the audit log archive
+
+Archives a throwaway SQLite audit_log into segment files in a temporary
+directory, then verifies, tampers with and searches them.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import create_engine, func, insert, select
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.api.v1.endpoints.audit import list_audit_log
+    from app.config import settings
+    from app.core.audit_archive import (
+        SEGMENT_MAGIC, TRAILER, LocalArchiveStorage, archive_audit_log, parse_footer, verify_archive
+    )
+    from app.models.audit_log import AuditArchiveSegment, AuditLog
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+NOW = datetime(2026, 3, 10, 12, tzinfo=timezone.utc)
+
+def entries():
+    """Ten entries a day for five days, the last two within the retention period"""
+    return [{
+        "id": str(uuid.uuid4()),
+        "changed_at": NOW - timedelta(days=day, minutes=n + 1),
+        "table_name": "outcomes",
+        "record_id": f"outcome-{n % 3}",
+        "action": "STATUS_CHANGE" if n % 2 else "UPDATE",
+        "new_values": {"status": "ENGAGED", "n": n},
+        "changed_by": f"user-{n % 2}",
+        "ip_address": "10.0.0.1" if n % 2 else None,
+    } for day in range(5) for n in range(10)]
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "audit_archive_after_days", 2)
+    monkeypatch.setattr(settings, "audit_archive_segment_entries", 6)
+    monkeypatch.setattr(settings, "audit_archive_block_entries", 4)
+    monkeypatch.setattr(settings, "audit_archive_location", str(tmp_path / "segments"))
+    monkeypatch.setattr(settings, "audit_query_slice_seconds", 3600)
+    engine = create_engine(f"sqlite:///{tmp_path}/audit.db")
+    AuditLog.__table__.create(engine)
+    AuditArchiveSegment.__table__.create(engine)
+    rows = entries()
+    with engine.begin() as connection:
+        connection.execute(insert(AuditLog.__table__), rows)
+    storage = LocalArchiveStorage(settings.audit_archive_location)
+    names = archive_audit_log(engine, storage, now=NOW)
+    yield engine, storage, names, rows
+    engine.dispose()
+
+def manifest(engine):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(AuditArchiveSegment.__table__).order_by(AuditArchiveSegment.sequence)
+        ).all()
+
+def test_old_entries_move_to_day_segments(archive):
+    engine, storage, names, rows = archive
+    with engine.connect() as connection:
+        left = connection.scalar(select(func.count()).select_from(AuditLog.__table__))
+        oldest_left = connection.scalar(select(func.min(AuditLog.changed_at)))
+
+    # Days 2-4 are past the two-day retention: 10 entries a day, 6 per segment
+    assert left == 20 and oldest_left.replace(tzinfo=timezone.utc) >= NOW - timedelta(days=2)
+    segments = manifest(engine)
+    assert [segment.name for segment in segments] == names == storage.names()
+    assert [segment.entries for segment in segments] == [6, 4, 6, 4, 6, 4]
+    assert [segment.previous_hash for segment in segments[1:]] == [segment.hash for segment in segments[:-1]]
+    assert archive_audit_log(engine, storage, now=NOW) == []
+
+def test_segments_are_self_describing(archive):
+    _, storage, names, _ = archive
+    data = storage.read(names[0])
+    footer, footer_offset = parse_footer(data)
+    assert data.endswith(SEGMENT_MAGIC)
+    assert [block["entries"] for block in footer["blocks"]] == [4, 2]
+    assert footer_offset == sum(block["length"] for block in footer["blocks"])
+    assert footer_offset + len(data[footer_offset:-TRAILER.size]) + TRAILER.size == len(data)
+
+def test_verify_finds_tampering(archive):
+    engine, storage, names, _ = archive
+    assert verify_archive(storage, manifest(engine))["problems"] == []
+    assert verify_archive(storage)["problems"] == []
+
+    path = os.path.join(storage.root, names[2])
+    data = bytearray(storage.read(names[2]))
+    data[10] ^= 0xFF  # inside the first block
+    os.chmod(path, 0o644)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.unlink(os.path.join(storage.root, names[4]))
+
+    problems = verify_archive(storage, manifest(engine))["problems"]
+    assert any(names[2] in problem for problem in problems)
+    assert any(names[4] in problem and "missing" in problem for problem in problems)
+
+def test_search_reads_the_archive_then_the_table(archive):
+    engine, _, _, rows = archive
+    reader = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}", poolclass=NullPool)
+    defaults = dict(
+        table_name=None, record_id=None, changed_by=None, action=None, changed_to=None,
+        cursor=None, format="json", current_user=None
+    )
+
+    async def run():
+        ids, cursor = [], None
+        async with AsyncSession(reader) as db:
+            while True:
+                page = await list_audit_log(
+                    **{**defaults, "changed_from": NOW - timedelta(days=7), "size": 7, "cursor": cursor}, db=db
+                )
+                ids += [str(entry.id) for entry in page.entries]
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            history = await list_audit_log(**{**defaults, "record_id": "outcome-1", "size": 100, "changed_from": None}, db=db)
+            stream = await list_audit_log(
+                **{**defaults, "changed_from": NOW - timedelta(days=7), "changed_by": "user-1",
+                   "size": 100, "format": "ndjson"}, db=db
+            )
+            lines = b"".join([chunk async for chunk in stream.body_iterator]).splitlines()
+        await reader.dispose()
+        return ids, history, lines
+
+    ids, history, lines = asyncio.run(run())
+    ordered = sorted(rows, key=lambda row: (row["changed_at"], row["id"]))
+    assert ids == [row["id"] for row in ordered]
+    assert [str(entry.id) for entry in history.entries] == [
+        row["id"] for row in ordered if row["record_id"] == "outcome-1"
+    ]
+    assert str(history.entries[0].ip_address) == "10.0.0.1"
+    assert len(lines) == len([row for row in rows if row["changed_by"] == "user-1"])
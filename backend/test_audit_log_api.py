@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Test the audit log query API
+
+The endpoint tests page and stream through a throwaway SQLite audit_log
+with sparse history; the last test checks against the configured database
+that a time slice is served by the BRIN index, and skips without it.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select, text
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app import main
+    from app.api.v1.endpoints.audit import apply_audit_filters, list_audit_log
+    from app.config import settings
+    from app.core.auth import AuthenticatedUser, get_current_active_user
+    from app.core.database import engine
+    from app.core.replicas import get_read_db
+    from app.models.users import UserRoleEnum
+    from app.models.audit_log import AuditActionEnum, AuditArchiveSegment, AuditLog, AuditResourceEnum
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def entries():
+    """Bursts of entries a few days apart, some sharing a timestamp"""
+    rows = []
+    for day in (0, 1, 9, 30):
+        for n in range(12):
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "changed_at": START + timedelta(days=day, seconds=n // 3),
+                "table_name": "referrals" if n % 2 else "users",
+                "record_id": f"record-{n % 4}",
+                "action": "INSERT" if n % 2 else "USER_LOGIN",
+                "changed_by": f"user-{n % 3}",
+            })
+    return rows
+
+def expected(rows, **match):
+    rows = [row for row in rows if all(row[key] == value for key, value in match.items())]
+    return [row["id"] for row in sorted(rows, key=lambda row: (row["changed_at"], row["id"]))]
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "audit_query_slice_seconds", 60)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/audit.db", poolclass=NullPool)
+    rows = entries()
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(AuditLog.__table__.create)
+            await conn.run_sync(AuditArchiveSegment.__table__.create)  # empty archive
+            await conn.execute(insert(AuditLog.__table__), rows)
+    asyncio.run(create())
+    yield lambda: AsyncSession(engine), rows
+    asyncio.run(engine.dispose())
+
+def search(db, **params):
+    defaults = dict(
+        table_name=None, record_id=None, changed_by=None, action=None, changed_from=None,
+        changed_to=None, cursor=None, size=100, format="json", current_user=None
+    )
+    return list_audit_log(**{**defaults, **params, "db": db})
+
+def test_pages_walk_the_range_in_order(session_factory):
+    sessions, rows = session_factory
+
+    async def run():
+        ids, pages, cursor = [], 0, None
+        async with sessions() as db:
+            while True:
+                page = await search(db, changed_from=START, size=7, cursor=cursor)
+                ids += [str(entry.id) for entry in page.entries]
+                pages += 1
+                cursor = page.next_cursor
+                if not cursor:
+                    return ids, pages
+
+    ids, pages = asyncio.run(run())
+    assert ids == expected(rows)
+    assert pages == 7
+
+def test_filters_and_bounds(session_factory):
+    sessions, rows = session_factory
+
+    async def run():
+        async with sessions() as db:
+            by_user = await search(db, changed_from=START, changed_by="user-1", action=AuditActionEnum.INSERT)
+            in_range = await search(db, changed_from=START + timedelta(days=1), changed_to=START + timedelta(days=10))
+            record = await search(db, record_id="record-1", table_name=AuditResourceEnum.REFERRAL)
+            return by_user, in_range, record
+
+    by_user, in_range, record = asyncio.run(run())
+    assert [str(e.id) for e in by_user.entries] == expected(rows, changed_by="user-1", action="INSERT")
+    assert [str(e.id) for e in in_range.entries] == expected(
+        [row for row in rows if START + timedelta(days=1) <= row["changed_at"] < START + timedelta(days=10)]
+    )
+    assert [str(e.id) for e in record.entries] == expected(rows, record_id="record-1", table_name="referrals")
+
+def test_a_time_range_is_required(session_factory):
+    sessions, _ = session_factory
+
+    async def run():
+        async with sessions() as db:
+            await search(db, changed_by="user-1")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(run())
+    assert error.value.status_code == 400
+
+def test_ndjson_streams_every_entry(session_factory):
+    sessions, rows = session_factory
+
+    async def run():
+        async with sessions() as db:
+            response = await search(db, changed_from=START, size=5, format="ndjson")
+            return b"".join([chunk async for chunk in response.body_iterator])
+
+    lines = asyncio.run(run()).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == expected(rows)
+
+def test_ndjson_streams_through_the_app_after_the_handler_returns(session_factory, monkeypatch):
+    """The session stays open for every slice of a streamed response"""
+    sessions, rows = session_factory
+    events = []
+
+    async def read_db():
+        async with sessions() as db:
+            event.listen(db.bind.sync_engine, "before_cursor_execute", lambda *args: events.append("query"))
+            yield db
+        events.append("closed")
+
+    async def admin():
+        return AuthenticatedUser(
+            id="admin", username="admin", role=UserRoleEnum.VA_ADMIN, vsa_id=None, is_active=True
+        )
+
+    monkeypatch.setitem(main.app.dependency_overrides, get_read_db, read_db)
+    monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, admin)
+    with TestClient(main.app).stream(
+        "GET", "/v1/audit/", params={"changed_from": START.isoformat(), "format": "ndjson"}
+    ) as response:
+        assert response.status_code == 200
+        lines = response.read().decode().splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == expected(rows)
+    # One query per time slice, all before the session is closed
+    assert events.count("query") > 1
+    assert events[-1] == "closed" and events.count("closed") == 1
+
+def test_time_slices_use_the_brin_index():
+    try:
+        connection = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+    try:
+        if engine.dialect.name != "postgresql" or not connection.execute(text(
+            "SELECT 1 FROM pg_indexes WHERE indexname = 'idx_audit_log_changed_at_brin'"
+        )).scalar():
+            pytest.skip("BRIN index not found - apply database/audit.sql first")
+        query = apply_audit_filters(select(AuditLog.__table__), changed_by="user-1").where(
+            AuditLog.changed_at >= datetime.now(timezone.utc) - timedelta(hours=1),
+            AuditLog.changed_at < datetime.now(timezone.utc)
+        )
+        sql = str(query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = json.dumps(connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar())
+    finally:
+        connection.rollback()
+        connection.close()
+
+    assert '"Seq Scan"' not in plan
+    assert '"Bitmap Index Scan"' in plan
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test the statement-level audit triggers from database/audit.sql
+
+Runs against the configured database inside a transaction that is rolled
+back; skips without the database or the triggers.
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import insert, select, text, update
+
+try:
+    from app.core.database import engine
+    from app.models.audit_log import AuditLog
+    from app.models.outcomes import Outcome, OutcomeStatusEnum
+    from app.models.referrals import Referral, PriorityLevelEnum, ProgramCodeEnum, ReferralTypeEnum
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def connection():
+    try:
+        connection = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+    try:
+        if engine.dialect.name != "postgresql" or not connection.execute(text(
+            "SELECT 1 FROM pg_trigger WHERE tgname = 'referrals_audit_insert_trigger'"
+        )).scalar():
+            pytest.skip("Audit triggers not found - apply database/audit.sql first")
+        yield connection
+        connection.rollback()
+    finally:
+        connection.close()
+
+def referral_rows(count):
+    return [{
+        "referral_token": uuid.uuid4(),
+        "issued_at": datetime.now(timezone.utc) - timedelta(minutes=1),  # valid_issued_date: <= NOW()
+        "vsa_id": "VSA001",
+        "program_code": ProgramCodeEnum.MENTAL_HEALTH,
+        "referral_type": ReferralTypeEnum.CLINICAL_REFERRAL,
+        "priority_level": PriorityLevelEnum.HIGH,
+    } for _ in range(count)]
+
+def audit_rows(connection, table_name, record_ids):
+    return connection.execute(
+        select(AuditLog.__table__)
+        .where(AuditLog.table_name == table_name, AuditLog.record_id.in_([str(r) for r in record_ids]))
+        .order_by(AuditLog.record_id, AuditLog.action)
+    ).all()
+
+def test_multi_row_insert_is_audited_per_row_on_the_parent(connection):
+    connection.execute(text("SET LOCAL app.user_id = 'user-audit-1'"))
+    referrals = referral_rows(3)
+    # One statement, rows landing in partitions
+    connection.execute(insert(Referral.__table__).values(referrals))
+
+    rows = audit_rows(connection, "referrals", [r["referral_token"] for r in referrals])
+    assert len(rows) == 3
+    assert {row.action for row in rows} == {"INSERT"}
+    assert {row.changed_by for row in rows} == {"user-audit-1"}
+    assert {row.vsa_id for row in rows} == {"VSA001"}
+    assert rows[0].new_values["priority_level"] == "HIGH"
+
+def test_outcomes_are_audited_under_their_own_id(connection):
+    referral = referral_rows(1)[0]
+    outcome_id = str(uuid.uuid4())
+    connection.execute(insert(Referral.__table__).values(referral))
+    connection.execute(insert(Outcome.__table__).values(
+        id=outcome_id, referral_token=referral["referral_token"], vsa_id="VSA001",
+        status=OutcomeStatusEnum.RECEIVED, updated_by="user-audit-2"
+    ))
+    connection.execute(
+        update(Outcome.__table__).where(Outcome.id == outcome_id)
+        .values(status=OutcomeStatusEnum.ENGAGED, first_contact_at=datetime.now(timezone.utc))
+    )
+
+    rows = audit_rows(connection, "outcomes", [outcome_id])
+    assert [row.action for row in rows] == ["INSERT", "UPDATE"]
+    assert rows[1].old_values["status"] == "RECEIVED" and rows[1].new_values["status"] == "ENGAGED"
+    assert not audit_rows(connection, "outcomes", [referral["referral_token"]])
+
+def test_changes_without_a_user_are_attributed_to_the_login(connection):
+    connection.execute(text("SET LOCAL app.user_id = ''"))  # as in a script, whatever the database default
+    referral = referral_rows(1)[0]
+    connection.execute(insert(Referral.__table__).values(referral))
+    connection.execute(Referral.__table__.delete().where(Referral.referral_token == referral["referral_token"]))
+
+    rows = audit_rows(connection, "referrals", [referral["referral_token"]])
+    login = connection.execute(text("SELECT session_user")).scalar()
+    assert [row.action for row in rows] == ["DELETE", "INSERT"]
+    assert {row.changed_by for row in rows} == {login}
+    assert rows[0].old_values["referral_token"] == str(referral["referral_token"])
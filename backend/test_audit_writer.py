@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test the batched application audit writer
+
+The writer tests use a throwaway SQLite database; the last test writes
+through asyncpg to the configured database's audit_log and skips without it.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+try:
+    from app.config import settings
+    from app.core.audit import AuditWriter, audit_event
+    from app.core.database import async_engine
+    from app.core.request_context import RequestContext, current_request
+    from app.models.audit_log import AuditActionEnum, AuditLog, AuditResourceEnum
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+def login_event(n=0):
+    return audit_event(AuditActionEnum.USER_LOGIN, AuditResourceEnum.USER, f"user-{n}", changed_by=f"user-{n}")
+
+async def sqlite_writer(path, create_table=True):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}/audit.db")
+    if create_table:
+        async with engine.begin() as conn:
+            await conn.run_sync(AuditLog.__table__.create)
+    return AuditWriter(engine)
+
+async def count_rows(writer):
+    async with writer.engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(AuditLog.__table__))
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(settings, "audit_batch_size", 50)
+    monkeypatch.setattr(settings, "audit_flush_interval_ms", 50)
+    monkeypatch.setattr(settings, "audit_enqueue_timeout_seconds", 0.05)
+    monkeypatch.setattr(settings, "audit_flush_retries", 0)
+
+def test_events_are_written_in_batches_and_drained_on_stop(tmp_path, small_batches):
+    async def run():
+        writer = await sqlite_writer(tmp_path)
+        writer.start()
+        for n in range(120):
+            await writer.record(login_event(n))
+        # Nothing has been written on the callers' time
+        assert writer.written == 0 and writer.pending == 120
+        await writer.stop()
+        rows = await count_rows(writer)
+        await writer.engine.dispose()
+        return writer, rows
+
+    writer, rows = asyncio.run(run())
+    assert rows == writer.written == 120
+    assert writer.batches == 3
+    assert writer.direct == writer.dropped == 0
+
+def test_full_queue_slows_callers_down_without_losing_events(tmp_path, small_batches, monkeypatch):
+    monkeypatch.setattr(settings, "audit_queue_size", 2)
+    monkeypatch.setattr(settings, "audit_batch_size", 1)  # no waiting for a batch to fill
+
+    async def run():
+        writer = await sqlite_writer(tmp_path)
+        released = asyncio.Event()
+        flush = writer._flush
+
+        async def stuck_flush(batch):
+            await released.wait()  # the database stops keeping up
+            await flush(batch)
+
+        writer._flush = stuck_flush
+        writer.start()
+        await writer.record(login_event(0))
+        await asyncio.sleep(0.01)  # the writer takes it and gets stuck
+        await writer.record(login_event(1))
+        await writer.record(login_event(2))
+        started = time.perf_counter()
+        await writer.record(login_event(3))  # queue full
+        waited = time.perf_counter() - started
+        released.set()
+        await writer.stop()
+        rows = await count_rows(writer)
+        await writer.engine.dispose()
+        return writer, rows, waited
+
+    writer, rows, waited = asyncio.run(run())
+    assert waited >= settings.audit_enqueue_timeout_seconds
+    assert writer.direct == 1
+    assert rows == writer.written == 4 and writer.dropped == 0
+
+def test_unwritable_events_are_logged_not_raised(tmp_path, small_batches):
+    async def run():
+        writer = await sqlite_writer(tmp_path, create_table=False)
+        await writer.record(login_event())  # no writer running: written directly
+        writer.start()
+        await writer.record(login_event())
+        await writer.stop()
+        await writer.engine.dispose()
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.dropped == 2 and writer.written == 0
+
+def test_events_carry_the_request():
+    context = RequestContext(
+        method="POST",
+        scope={"client": ("10.1.2.3", 5000), "headers": [(b"user-agent", b"pytest")]},
+        request_id="req-9"
+    )
+    token = current_request.set(context)
+    try:
+        event = audit_event(AuditActionEnum.CSV_IMPORT, AuditResourceEnum.REFERRAL, "import-1", vsa_id="VSA001")
+    finally:
+        current_request.reset(token)
+
+    assert (event["ip_address"], event["user_agent"], event["request_id"]) == ("10.1.2.3", "pytest", "req-9")
+    assert (event["table_name"], event["action"], event["changed_by"]) == ("referrals", "CSV_IMPORT", "anonymous")
+
+def test_batches_bind_under_asyncpg(small_batches):
+    request_id = f"test-{uuid.uuid4().hex}"
+    context = RequestContext(
+        method="POST", scope={"client": ("2001:db8::1", 5000), "headers": []}, request_id=request_id
+    )
+
+    async def run():
+        writer = AuditWriter(async_engine)
+        token = current_request.set(context)
+        try:
+            writer.start()
+            for n in range(3):
+                await writer.record(audit_event(
+                    AuditActionEnum.STATUS_CHANGE, AuditResourceEnum.OUTCOME, str(uuid.uuid4()),
+                    changed_by=f"user-{n}", vsa_id="VSA001",
+                    old_values={"status": "PENDING"}, new_values={"status": "ENGAGED"}
+                ))
+            await writer.stop()
+            async with async_engine.begin() as conn:
+                rows = (await conn.execute(
+                    select(AuditLog.__table__).where(AuditLog.request_id == request_id)
+                )).all()
+                await conn.execute(delete(AuditLog.__table__).where(AuditLog.request_id == request_id))
+            return writer, rows
+        finally:
+            current_request.reset(token)
+            await async_engine.dispose()
+
+    if async_engine.dialect.name != "postgresql":
+        pytest.skip("audit_log lives in PostgreSQL")
+    try:
+        writer, rows = asyncio.run(run())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Database not available: {e}")
+    if writer.dropped:
+        pytest.skip("audit_log not writable - apply database/audit.sql first")
+
+    assert writer.batches == 1 and len(rows) == 3
+    assert {str(row.ip_address) for row in rows} == {"2001:db8::1"}
+    assert rows[0].new_values == {"status": "ENGAGED"}
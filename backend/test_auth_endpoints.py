@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test the auth endpoints against the configured database
+
+Each test calls the endpoint functions with a session joined to an outer
+transaction that is rolled back, so commits inside the endpoints leave
+nothing behind; skips without the database.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from fastapi import HTTPException
+from sqlalchemy import update
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.api.v1.endpoints import auth
+    from app.core import repository
+    from app.core.auth import get_password_hash, verify_password
+    from app.core.database import async_engine
+    from app.models.users import User, UserRoleEnum
+    from app.schemas.auth import PasswordChange
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+PASSWORD = "Current-passw0rd"
+
+def rolled_back(test):
+    """Run test(db, user) with a new user in a session whose commits are undone afterwards"""
+    async def run():
+        try:
+            async with async_engine.connect() as connection:
+                await connection.begin()
+                db = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+                try:
+                    name = f"password-test-{uuid.uuid4().hex[:8]}"
+                    user = User(
+                        id=name, username=name, email=f"{name}@example.org", full_name="Password Test",
+                        hashed_password=get_password_hash(PASSWORD), role=UserRoleEnum.VSA_USER, vsa_id="VSA001"
+                    )
+                    db.add(user)
+                    await db.commit()
+                    return await test(db, user)
+                finally:
+                    await db.close()
+                    await connection.rollback()
+        finally:
+            await async_engine.dispose()
+
+    try:
+        return asyncio.run(run())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Database not available: {e}")
+
+def hashing_outside_transactions(monkeypatch, db_holder, checked):
+    """Record whether the session held a transaction each time bcrypt ran"""
+    for name in ("verify_password_async", "get_password_hash_async"):
+        async def wrapper(*args, hashing=getattr(auth, name)):
+            checked.append(db_holder[0].in_transaction())
+            return await hashing(*args)
+        monkeypatch.setattr(auth, name, wrapper)
+
+def test_password_is_hashed_without_holding_a_connection(monkeypatch):
+    db_holder, checked = [], []
+    hashing_outside_transactions(monkeypatch, db_holder, checked)
+
+    async def test(db, user):
+        db_holder.append(db)
+        token_version = user.token_version
+        # Loaded as get_current_db_user does, which leaves a transaction open
+        current_user = await repository.get_user(db, user.id)
+        await auth.change_password(
+            PasswordChange(current_password=PASSWORD, new_password="New-passw0rd-1"), current_user=current_user, db=db
+        )
+        stored = await db.get(User, user.id)
+        return stored.hashed_password, stored.token_version - token_version
+
+    hashed_password, token_versions = rolled_back(test)
+    assert checked == [False, False]
+    assert verify_password("New-passw0rd-1", hashed_password)
+    assert token_versions == 1
+
+def test_password_changed_meanwhile_is_not_overwritten(monkeypatch):
+    async def test(db, user):
+        hashing = auth.get_password_hash_async
+
+        async def meanwhile(password):
+            # Another request's change lands while this one hashes
+            await db.execute(update(User).where(User.id == user.id).values(hashed_password="changed elsewhere"))
+            await db.commit()
+            return await hashing(password)
+
+        monkeypatch.setattr(auth, "get_password_hash_async", meanwhile)
+        with pytest.raises(HTTPException) as error:
+            await auth.change_password(
+                PasswordChange(current_password=PASSWORD, new_password="New-passw0rd-1"), current_user=user, db=db
+            )
+        await db.rollback()
+        return error.value.status_code, (await db.get(User, user.id, populate_existing=True)).hashed_password
+
+    assert rolled_back(test) == (409, "changed elsewhere")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test the background health prober and the endpoints serving its result
+
+SQLite files stand in for the primary and a replica; a path in a missing
+directory stands in for a database that is down.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.api.v1.endpoints import health
+    from app.core import auth, database
+    from app.core.auth import AuthenticatedUser, get_current_active_user
+    from app.core.health import HealthProber
+    from app.core.replicas import Replica, ReplicaRouter
+    from app.models.users import UserRoleEnum
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+def sqlite_engine(path):
+    return create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+@pytest.fixture
+def prober(tmp_path, monkeypatch):
+    router = ReplicaRouter([Replica(name="replica", engine=sqlite_engine(tmp_path / "replica.db"))])
+    prober = HealthProber(sqlite_engine(tmp_path / "primary.db"), router, interval_seconds=5)
+    monkeypatch.setattr(health, "health_prober", prober)
+    yield prober
+    asyncio.run(prober.engine.dispose())
+    asyncio.run(router.dispose())
+
+def test_endpoints_serve_the_cached_probe(prober, tmp_path):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(health.database_health())
+    assert error.value.status_code == 503
+    assert prober.report()["status"] == "unknown"
+
+    asyncio.run(prober.router.check_lag())
+    asyncio.run(prober.probe())
+    # The endpoints don't connect: a database gone since the probe goes unnoticed
+    prober.engine = sqlite_engine(tmp_path / "missing" / "primary.db")
+    db = asyncio.run(health.database_health())
+    detailed = asyncio.run(health.detailed_health())
+
+    assert db["status"] == "healthy" and db["latency_ms"] >= 0 and 0 <= db["age_seconds"] < 5
+    assert detailed["status"] == "healthy"
+    assert detailed["components"]["replicas"]["replica"]["lag_seconds"] == 0
+    assert detailed["components"]["database"]["status"] == "healthy"
+
+def test_failures_and_lag_are_reported(prober, tmp_path):
+    asyncio.run(prober.probe())
+    # Never checked, so the replica counts as lagging
+    assert prober.report()["status"] == "degraded"
+    assert asyncio.run(health.detailed_health())["status"] == "degraded"
+
+    prober.engine = sqlite_engine(tmp_path / "missing" / "primary.db")
+    asyncio.run(prober.probe())
+    assert prober.report()["status"] == "unhealthy"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(health.database_health())
+    assert error.value.status_code == 503
+
+def test_a_stopped_prober_goes_stale(prober):
+    asyncio.run(prober.router.check_lag())
+    asyncio.run(prober.probe())
+    prober._checked_at = time.monotonic() - 3 * prober.interval_seconds - 1
+
+    assert prober.report()["status"] == "stale"
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(health.database_health())
+    assert error.value.status_code == 503
+    assert asyncio.run(health.detailed_health())["status"] == "degraded"
+
+def test_check_db_connection(monkeypatch, tmp_path):
+    monkeypatch.setattr(database, "engine", create_engine(f"sqlite:///{tmp_path}/db.sqlite"))
+    assert database.check_db_connection()
+    monkeypatch.setattr(database, "engine", create_engine(f"sqlite:///{tmp_path}/missing/db.sqlite"))
+    assert not database.check_db_connection()
+
+def test_diagnostics_are_for_va_admins(monkeypatch):
+    """Liveness checks are open; pool and statement details need a VA admin"""
+    async def audit(*args, **kwargs):
+        pass
+    monkeypatch.setattr(auth, "audit", audit)
+    client = TestClient(main.app)
+    diagnostics = ["/v1/health/pool", "/v1/health/queries"]
+
+    assert client.get("/v1/health").status_code == 200
+    for path in diagnostics:
+        assert client.get(path).status_code == 401
+
+    for role, status in ((UserRoleEnum.VSA_USER, 403), (UserRoleEnum.VA_ADMIN, 200)):
+        async def user(role=role):
+            return AuthenticatedUser(id="user-health", username="health", role=role, vsa_id="VSA001", is_active=True)
+        monkeypatch.setitem(main.app.dependency_overrides, get_current_active_user, user)
+        for path in diagnostics:
+            assert client.get(path).status_code == status
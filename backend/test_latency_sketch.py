@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test the mergeable latency sketch used for time-to-contact/close percentiles
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+try:
+    from app.core.sketches import LatencySketch, RELATIVE_ACCURACY
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+def assert_close(estimate, exact):
+    assert abs(estimate - exact) <= RELATIVE_ACCURACY * exact + 1e-9, (estimate, exact)
+
+@pytest.fixture
+def latencies():
+    rng = random.Random(42)
+    return [rng.lognormvariate(3, 1.5) for _ in range(10000)]
+
+def test_quantiles_within_relative_accuracy(latencies):
+    sketch = LatencySketch()
+    for value in latencies:
+        sketch.add(value)
+
+    assert sketch.count == len(latencies)
+    for q in (0.5, 0.9, 0.99):
+        assert_close(sketch.quantile(q), exact_quantile(latencies, q))
+
+def test_merge_matches_single_sketch(latencies):
+    whole = LatencySketch()
+    parts = [LatencySketch() for _ in range(12)]
+    for i, value in enumerate(latencies):
+        whole.add(value)
+        parts[i % len(parts)].add(value)
+
+    merged = LatencySketch()
+    for part in parts:
+        merged.merge(part)
+
+    assert merged.bins == whole.bins
+    assert merged.quantile(0.9) == whole.quantile(0.9)
+
+def test_remove_undoes_add(latencies):
+    sketch = LatencySketch()
+    for value in latencies:
+        sketch.add(value)
+    for value in latencies[:5000]:
+        sketch.remove(value)
+
+    assert sketch.count == 5000
+    for q in (0.5, 0.99):
+        assert_close(sketch.quantile(q), exact_quantile(latencies[5000:], q))
+
+def test_zero_and_negative_latencies():
+    sketch = LatencySketch()
+    for value in (-0.5, 0, 0.0001, 2, 4):
+        sketch.add(value)
+
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert_close(sketch.quantile(1), 4)
+
+def test_serialization_round_trip(latencies):
+    sketch = LatencySketch()
+    for value in latencies + [0, 0.01]:
+        sketch.add(value)
+
+    data = sketch.to_bytes()
+    restored = LatencySketch.from_bytes(data)
+
+    assert restored.bins == sketch.bins
+    assert restored.zero_count == sketch.zero_count
+    assert len(data) < 4 * len(sketch.bins) + 32
+
+def test_empty_sketch():
+    sketch = LatencySketch.from_bytes(LatencySketch().to_bytes())
+    assert sketch.count == 0
+    assert sketch.quantile(0.5) is None
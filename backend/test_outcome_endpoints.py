@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test the outcome endpoints against the configured database
+
+Each test calls the endpoint functions with a session joined to an outer
+transaction that is rolled back, so commits inside the endpoints leave
+nothing behind; skips without the database. Access checks that refuse a
+request before it reaches the database run without one.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.api.v1.endpoints import analytics, outcomes, referrals
+    from app.core import auth
+    from app.core.auth import AuthenticatedUser
+    from app.core.database import async_engine
+    from app.core.sketches import LatencySketch, sketch_month
+    from app.models.referrals import Referral, PriorityLevelEnum, ProgramCodeEnum, ReferralTypeEnum
+    from app.models.sketches import OutcomeLatencySketch
+    from app.models.users import UserRoleEnum
+    from app.schemas.outcomes import OutcomeBulkCreate, OutcomeCreate, OutcomeUpdate
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+VSA = "VSA001"
+USER = AuthenticatedUser(
+    id="user-outcome-test", username="outcome-test", role=UserRoleEnum.VSA_USER, vsa_id=VSA, is_active=True
+)
+
+@pytest.fixture(autouse=True)
+def no_audit_events(monkeypatch):
+    # Events are written on their own connection, outside the rolled-back transaction
+    async def audit(*args, **kwargs):
+        pass
+    monkeypatch.setattr(outcomes, "audit", audit)
+    monkeypatch.setattr(auth, "audit", audit)
+
+def rolled_back(test):
+    """Run test(db) in a session whose commits are undone afterwards"""
+    async def run():
+        try:
+            async with async_engine.connect() as connection:
+                await connection.begin()
+                db = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+                try:
+                    return await test(db)
+                finally:
+                    await db.close()
+                    await connection.rollback()
+        finally:
+            await async_engine.dispose()
+
+    try:
+        return asyncio.run(run())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Database not available: {e}")
+
+async def add_referrals(db, count, issued_at):
+    tokens = [str(uuid.uuid4()) for _ in range(count)]
+    await db.execute(insert(Referral.__table__), [{
+        "referral_token": token, "issued_at": issued_at, "vsa_id": VSA,
+        "program_code": ProgramCodeEnum.MENTAL_HEALTH, "referral_type": ReferralTypeEnum.CLINICAL_REFERRAL,
+        "priority_level": PriorityLevelEnum.HIGH,
+    } for token in tokens])
+    return tokens
+
+def added(before, after):
+    """The latencies a write put into a sketch, as a sketch"""
+    sketch = LatencySketch()
+    for index in set(before.bins) | set(after.bins):
+        if after.bins.get(index, 0) != before.bins.get(index, 0):
+            sketch.bins[index] = after.bins.get(index, 0) - before.bins.get(index, 0)
+    return sketch
+
+def sketch_of(*values):
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+async def sketch(db, issued_at, metric):
+    data = await db.scalar(select(OutcomeLatencySketch.sketch).where(
+        OutcomeLatencySketch.vsa_id == VSA,
+        OutcomeLatencySketch.program_code == ProgramCodeEnum.MENTAL_HEALTH,
+        OutcomeLatencySketch.month == sketch_month(issued_at),
+        OutcomeLatencySketch.metric == metric
+    ))
+    return LatencySketch.from_bytes(data) if data else LatencySketch()
+
+def test_naive_timestamps_are_taken_as_utc():
+    issued_at = datetime.now(timezone.utc) - timedelta(hours=3)
+    # As a client leaving out the offset sends them
+    contacted = (issued_at + timedelta(hours=1)).replace(tzinfo=None)
+    closed = (issued_at + timedelta(hours=2)).replace(tzinfo=None)
+
+    async def test(db):
+        contact_before = await sketch(db, issued_at, "time_to_contact")
+        close_before = await sketch(db, issued_at, "time_to_close")
+        single, *bulk = await add_referrals(db, 3, issued_at)
+
+        created = await outcomes.create_outcome(
+            OutcomeCreate(referral_token=single, vsa_id=VSA, status="ENGAGED", first_contact_at=contacted),
+            current_user=USER, db=db
+        )
+        updated = await outcomes.update_outcome(
+            str(created.id), OutcomeUpdate(status="COMPLETED", closed_at=closed), current_user=USER, db=db
+        )
+        response = await outcomes.create_bulk_outcomes(OutcomeBulkCreate(outcomes=[
+            OutcomeCreate(referral_token=token, vsa_id=VSA, status="ENGAGED", first_contact_at=contacted)
+            for token in bulk
+        ]), current_user=USER, db=db)
+
+        contacts = added(contact_before, await sketch(db, issued_at, "time_to_contact"))
+        closes = added(close_before, await sketch(db, issued_at, "time_to_close"))
+        return updated, response, contacts, closes
+
+    updated, response, contacts, closes = rolled_back(test)
+    assert updated.closed_at == closed.replace(tzinfo=timezone.utc)
+    assert (response.created, response.failed, response.errors) == (2, 0, [])
+    # An hour to contact for all three, two hours to close for the updated one
+    assert contacts.bins == sketch_of(1, 1, 1).bins
+    assert closes.bins == sketch_of(2).bins
+
+def test_stats_refused_to_accounts_without_a_vsa():
+    """A non-admin without a VSA is refused, not shown every VSA"""
+    unassigned = AuthenticatedUser(
+        id="user-no-vsa", username="no-vsa", role=UserRoleEnum.VSA_USER, vsa_id=None, is_active=True
+    )
+    for endpoint in (
+        outcomes.get_outcome_stats(vsa_id=None, max_staleness=None, current_user=unassigned, db=None),
+        analytics.get_referral_analytics(
+            vsa_id="VSA001", month_from=None, month_to=None, program_code=None, priority_level=None,
+            current_user=unassigned, db=None
+        ),
+        analytics.get_referral_funnel(
+            vsa_id=None, bucket="month", issued_from=None, issued_to=None, max_staleness=None,
+            current_user=unassigned, db=None
+        ),
+        analytics.get_latency_percentiles(
+            vsa_id=None, month_from=None, month_to=None, program_code=None, current_user=unassigned, db=None
+        ),
+        referrals.get_referral_monthly_stats(
+            vsa_id="VSA001", month_from=None, month_to=None, current_user=unassigned, db=None
+        ),
+    ):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(endpoint)
+        assert error.value.status_code == 403
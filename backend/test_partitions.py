@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Tests for monthly partition maintenance (database/partitioning.sql)
+
+Runs against the configured database inside a transaction that is rolled
+back, on a scratch parent/child pair shaped like referrals and outcomes, and
+on referrals itself for the token registry.
+"""
+
+import os
+import sys
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import exc, text
+
+try:
+    from app.core.database import engine
+    from app.core.rollups import retained_from
+    from app.config import settings
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def connection():
+    try:
+        conn = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+
+    if not conn.execute(text("SELECT to_regproc('archive_expired_partitions')")).scalar():
+        conn.close()
+        pytest.skip("partition functions not found - apply database/partitioning.sql first")
+    conn.rollback()
+
+    transaction = conn.begin()
+    conn.execute(text("""
+        CREATE TABLE test_events (
+            id INTEGER NOT NULL,
+            at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (id, at)
+        ) PARTITION BY RANGE (at)
+    """))
+    conn.execute(text("""
+        CREATE TABLE test_event_notes (
+            event_id INTEGER NOT NULL,
+            event_at TIMESTAMPTZ NOT NULL,
+            FOREIGN KEY (event_id, event_at) REFERENCES test_events (id, at) ON DELETE CASCADE
+        )
+    """))
+    yield conn
+    transaction.rollback()
+    conn.close()
+
+def _partitions(connection, schema="public"):
+    return set(connection.execute(text("""
+        SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname LIKE 'test_event%'
+    """), {"schema": schema}).scalars())
+
+def test_create_monthly_partitions_is_idempotent(connection):
+    """Partitions are created once per month in the range"""
+    created = connection.execute(text(
+        "SELECT create_monthly_partitions('test_events', DATE '2025-01-15', DATE '2025-03-01')"
+    )).scalar()
+    assert created == 3
+    assert {"test_events_p2025_01", "test_events_p2025_02", "test_events_p2025_03"} <= _partitions(connection)
+
+    again = connection.execute(text(
+        "SELECT create_monthly_partitions('test_events', DATE '2025-01-01', DATE '2025-03-31')"
+    )).scalar()
+    assert again == 0
+
+def test_archive_moves_partition_and_referencing_rows(connection):
+    """Expired months are detached into the archive schema with their referencing rows"""
+    now = datetime.now(timezone.utc)
+    old = datetime(now.year - 2, now.month, 1, 12, tzinfo=timezone.utc)
+    connection.execute(
+        text("SELECT create_monthly_partitions('test_events', CAST(:old AS date), CAST(:now AS date))"),
+        {"old": old.date(), "now": now.date()}
+    )
+    connection.execute(
+        text("INSERT INTO test_events VALUES (1, :old), (2, :now)"), {"old": old, "now": now}
+    )
+    connection.execute(
+        text("INSERT INTO test_event_notes VALUES (1, :old), (2, :now)"), {"old": old, "now": now}
+    )
+
+    archived = connection.execute(text("SELECT archive_expired_partitions('test_events', 12)")).scalars().all()
+
+    month = old.strftime("%Y_%m")
+    assert f"archive.test_events_p{month}" in archived
+    assert f"archive.test_event_notes_p{month}" in archived
+    assert f"test_events_p{month}" not in _partitions(connection)
+    assert connection.execute(text("SELECT id FROM test_events")).scalars().all() == [2]
+    assert connection.execute(text("SELECT event_id FROM test_event_notes")).scalars().all() == [2]
+    assert connection.execute(text(f"SELECT id FROM archive.test_events_p{month}")).scalars().all() == [1]
+    assert connection.execute(text(f"SELECT event_id FROM archive.test_event_notes_p{month}")).scalars().all() == [1]
+
+def test_archive_leaves_triggers_enabled(connection):
+    """Referencing rows are moved under app.archiving, not with the table's triggers disabled"""
+    now = datetime.now(timezone.utc)
+    old = datetime(now.year - 2, now.month, 1, 12, tzinfo=timezone.utc)
+    connection.execute(
+        text("SELECT create_monthly_partitions('test_events', CAST(:old AS date), CAST(:now AS date))"),
+        {"old": old.date(), "now": now.date()}
+    )
+    connection.execute(text("INSERT INTO test_events VALUES (1, :old), (2, :now)"), {"old": old, "now": now})
+    connection.execute(text("INSERT INTO test_event_notes VALUES (1, :old), (2, :now)"), {"old": old, "now": now})
+    connection.execute(text("CREATE TABLE test_event_deletes (event_id INTEGER, archiving TEXT)"))
+    connection.execute(text("""
+        CREATE FUNCTION test_event_notes_deleted() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO test_event_deletes VALUES (OLD.event_id, current_setting('app.archiving', true));
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+    connection.execute(text("""
+        CREATE TRIGGER test_event_notes_deleted AFTER DELETE ON test_event_notes
+        FOR EACH ROW EXECUTE FUNCTION test_event_notes_deleted()
+    """))
+
+    connection.execute(text("SELECT archive_expired_partitions('test_events', 12)"))
+    connection.execute(text("DELETE FROM test_event_notes"))
+
+    deletes = connection.execute(text("SELECT event_id, archiving FROM test_event_deletes ORDER BY 1")).all()
+    assert [tuple(row) for row in deletes] == [(1, "on"), (2, "")]
+    assert connection.execute(text("""
+        SELECT count(*) FROM pg_trigger WHERE tgrelid = 'test_event_notes'::regclass AND tgenabled = 'D'
+    """)).scalar() == 0
+
+def test_retained_from(monkeypatch):
+    """Reconciliation only looks at months still inside the retention window"""
+    monkeypatch.setattr(settings, "referral_retention_months", 0)
+    assert retained_from() is None
+
+    monkeypatch.setattr(settings, "referral_retention_months", 12)
+    today = datetime.now(timezone.utc).date()
+    assert retained_from() == date(today.year - 1, today.month, 1)
+
+@pytest.fixture
+def referrals():
+    try:
+        conn = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+    try:
+        if not conn.execute(text("SELECT to_regclass('referral_tokens')")).scalar():
+            pytest.skip("referral_tokens not found - apply database/partitioning.sql first")
+        yield conn
+        conn.rollback()
+    finally:
+        conn.close()
+
+def _insert_referral(connection, token, issued_at):
+    connection.execute(text("""
+        INSERT INTO referrals (referral_token, issued_at, vsa_id, program_code, referral_type, priority_level)
+        VALUES (:token, :issued_at, 'VSA001', 'MENTAL_HEALTH', 'CLINICAL_REFERRAL', 'HIGH')
+    """), {"token": token, "issued_at": issued_at})
+
+def _registered(connection, token):
+    return connection.execute(
+        text("SELECT issued_at FROM referral_tokens WHERE referral_token = :token"), {"token": token}
+    ).scalar()
+
+def test_tokens_stay_unique_across_partitions(referrals):
+    """A token already issued in one month can't be issued again in another"""
+    token = str(uuid.uuid4())
+    now = datetime.now(timezone.utc) - timedelta(minutes=1)
+    _insert_referral(referrals, token, now)
+
+    savepoint = referrals.begin_nested()
+    with pytest.raises(exc.IntegrityError, match="already exists"):
+        _insert_referral(referrals, token, now - timedelta(days=62))
+    savepoint.rollback()
+    assert referrals.execute(
+        text("SELECT count(*) FROM referrals WHERE referral_token = :token"), {"token": token}
+    ).scalar() == 1
+
+def test_registry_follows_the_referral(referrals):
+    """Moving a referral, within or to another month, its outcome and deleting it keep the registry in step"""
+    token = str(uuid.uuid4())
+    now = datetime.now(timezone.utc) - timedelta(minutes=1)
+    earlier = now - timedelta(days=62)
+    _insert_referral(referrals, token, now)
+    assert _registered(referrals, token) == now
+
+    referrals.execute(
+        text("UPDATE referrals SET issued_at = :earlier WHERE referral_token = :token"),
+        {"earlier": earlier, "token": token}
+    )
+    assert _registered(referrals, token) == earlier
+    referrals.execute(text("""
+        INSERT INTO outcomes (id, referral_token, vsa_id, status, updated_by)
+        VALUES (:id, :token, 'VSA001', 'RECEIVED', 'test')
+    """), {"id": str(uuid.uuid4()), "token": token})
+    assert referrals.execute(
+        text("SELECT referral_issued_at FROM outcomes WHERE referral_token = :token"), {"token": token}
+    ).scalar() == earlier
+
+    # Within the month, so in place: the outcome follows through the foreign key's cascade
+    moved = earlier - timedelta(seconds=1)
+    referrals.execute(
+        text("UPDATE referrals SET issued_at = :moved WHERE referral_token = :token"), {"moved": moved, "token": token}
+    )
+    assert _registered(referrals, token) == moved
+    assert referrals.execute(
+        text("SELECT referral_issued_at FROM outcomes WHERE referral_token = :token"), {"token": token}
+    ).scalar() == moved
+
+    referrals.execute(text("DELETE FROM referrals WHERE referral_token = :token"), {"token": token})
+    assert _registered(referrals, token) is None
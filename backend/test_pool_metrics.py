@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test connection pool instrumentation
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import create_engine, exc, text
+
+try:
+    from app.core.pool_metrics import Histogram, TimedQueuePool, instrument_engine, pool_metrics, render_pool_metrics
+    from app.core.request_context import RequestContext, current_request
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def metrics(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    metrics = instrument_engine("test", engine)
+    yield metrics
+    pool_metrics.pop("test", None)
+    engine.dispose()
+
+def request_context(path, route_path):
+    return RequestContext(method="GET", scope={"path": path, "route": SimpleNamespace(path=route_path)})
+
+def test_route_templates_include_router_prefixes():
+    assert request_context("/v1/referrals/abc", "/{referral_token}").route == "GET /v1/referrals/{referral_token}"
+    assert request_context("/v1/referrals/summary/stats", "/summary/stats").route == "GET /v1/referrals/summary/stats"
+    assert request_context("/v1/health", "").route == "GET /v1/health"
+    assert RequestContext(method="GET", scope={"path": "/nope"}).route == "GET unmatched"
+
+def test_histogram_buckets():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [2, 3, 4]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1) == 5
+
+def test_holds_are_attributed_to_the_request_route(metrics):
+    token = current_request.set(request_context("/v1/referrals/", "/"))
+    try:
+        with metrics.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            assert metrics.snapshot()["checked_out"] == 1
+    finally:
+        current_request.reset(token)
+    with metrics.engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+    snapshot = metrics.snapshot()
+    assert (snapshot["connects"], snapshot["checkouts"], snapshot["checkins"]) == (1, 2, 2)
+    assert snapshot["checked_out"] == 0
+    assert snapshot["checkout_wait"]["count"] == 2
+    assert snapshot["hold_by_route"]["GET /v1/referrals/"]["count"] == 1
+    assert snapshot["hold_by_route"]["background"]["count"] == 1
+    assert 'route="GET /v1/referrals/"' in render_pool_metrics()
+
+def test_checkout_timeouts_are_counted(metrics):
+    with metrics.engine.connect():
+        with pytest.raises(exc.TimeoutError):
+            metrics.engine.connect()
+
+    assert metrics.snapshot()["checkout_timeouts"] == 1
+
+def test_pre_ping_failures_are_told_apart(metrics):
+    metrics.on_invalidate(None, None, exc.DisconnectionError("pre-ping failed"))
+    metrics.on_invalidate(None, None, ConnectionResetError("server closed the connection"))
+
+    assert (metrics.invalidations, metrics.pre_ping_failures) == (2, 1)
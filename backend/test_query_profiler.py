@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test query fingerprints, statistics and sampled slow-query plans
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import create_engine, event, text
+
+try:
+    from app.config import settings
+    from app.core.database import engine as primary_engine
+    from app.core.query_profiler import (
+        QueryProfiler, explainable, fingerprint, query_profiler, render_query_metrics
+    )
+    from app.core.request_context import RequestContext, current_request
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def profiled_engine(tmp_path):
+    """A SQLite engine reporting to a fresh profiler"""
+    profiler = QueryProfiler()
+    engine = create_engine(f"sqlite:///{tmp_path}/queries.db")
+    event.listen(engine, "before_cursor_execute", profiler.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", profiler.after_cursor_execute)
+    event.listen(engine, "handle_error", profiler.handle_error)
+    yield engine, profiler
+    engine.dispose()
+
+def test_fingerprints_ignore_values():
+    same = [
+        "SELECT * FROM referrals WHERE vsa_id = %(vsa_id_1)s AND priority_level IN (%(p_1)s, %(p_2)s) LIMIT 50",
+        "SELECT *  FROM referrals\n WHERE vsa_id = 'VSA001' AND priority_level IN ('HIGH') LIMIT 10",
+        "SELECT * FROM referrals WHERE vsa_id = $1 AND priority_level IN ($2, $3, $4) LIMIT $5",
+    ]
+    assert len({fingerprint(statement)[0] for statement in same}) == 1
+    assert fingerprint(same[0])[1] == "SELECT * FROM referrals WHERE vsa_id = ? AND priority_level IN (?) LIMIT ?"
+    # Digits inside identifiers are part of the name
+    assert "referrals_p2026_07" in fingerprint("SELECT 1 FROM referrals_p2026_07")[1]
+    assert fingerprint("SELECT * FROM outcomes")[0] != fingerprint("SELECT * FROM referrals")[0]
+
+def test_only_plain_reads_are_explained():
+    assert explainable("SELECT * FROM referrals WHERE vsa_id = ?")
+    assert explainable("WITH recent AS (SELECT * FROM referrals) SELECT count(*) FROM recent")
+    assert not explainable("SELECT archive_expired_partitions(?, ?)")
+    assert not explainable("SELECT * FROM referrals WHERE referral_token = ? FOR UPDATE")
+    assert not explainable("WITH moved AS (DELETE FROM outcomes RETURNING *) SELECT * FROM moved")
+    assert not explainable("UPDATE outcomes SET status = ? WHERE id = ?")
+
+def test_statements_are_counted_per_fingerprint(profiled_engine):
+    engine, profiler = profiled_engine
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE t (id INTEGER)"))
+        for value in range(3):
+            connection.execute(text(f"SELECT * FROM t WHERE id = {value}"))
+        with pytest.raises(Exception):
+            connection.execute(text("SELECT * FROM missing WHERE id = 1"))
+
+    stats = {summary["statement"]: summary for summary in profiler.top(10)}
+    assert stats["SELECT * FROM t WHERE id = ?"]["count"] == 3
+    assert stats["SELECT * FROM t WHERE id = ?"]["errors"] == 0
+    assert stats["SELECT * FROM missing WHERE id = ?"]["errors"] == 1
+    assert stats["SELECT * FROM missing WHERE id = ?"]["count"] == 0
+
+def test_fingerprints_are_bounded(profiled_engine, monkeypatch):
+    engine, profiler = profiled_engine
+    monkeypatch.setattr(settings, "query_max_fingerprints", 2)
+    with engine.connect() as connection:
+        for column in ("1", "2 AS a", "3 AS b", "4 AS c"):
+            connection.execute(text(f"SELECT {column}"))
+
+    assert len(profiler.stats) == 3
+    assert profiler.stats["other"].count == 2
+
+def test_slow_reads_are_explained_without_disturbing_the_transaction(monkeypatch, tmp_path):
+    try:
+        connection = primary_engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+    if primary_engine.dialect.name != "postgresql":
+        connection.close()
+        pytest.skip("EXPLAIN sampling needs PostgreSQL")
+
+    plan_path = tmp_path / "slow.log"
+    monkeypatch.setattr(settings, "query_slow_threshold_ms", 0)
+    monkeypatch.setattr(settings, "query_explain_sample_rate", 1.0)
+    monkeypatch.setattr(settings, "query_explain_max_per_minute", 1)
+    monkeypatch.setattr(settings, "query_explain_log_path", str(plan_path))
+    monkeypatch.setattr(query_profiler, "_plan_log", None)
+    monkeypatch.setattr(query_profiler, "_explained_at", type(query_profiler._explained_at)())
+
+    context = RequestContext(
+        method="GET", scope={"path": "/v1/referrals/", "route": SimpleNamespace(path="/")}, request_id="req-1"
+    )
+    token = current_request.set(context)
+    try:
+        with connection.begin():
+            connection.execute(text("CREATE TEMPORARY TABLE profiled (id INTEGER)"))
+            connection.execute(text("INSERT INTO profiled VALUES (1), (2)"))
+            rows = connection.execute(text("SELECT id FROM profiled WHERE id > :id ORDER BY id"), {"id": 0}).all()
+            # Capped at one explain per minute: this one runs without a re-run
+            connection.execute(text("SELECT id FROM profiled WHERE id > :id ORDER BY id"), {"id": 1}).all()
+            assert connection.execute(text("SELECT count(*) FROM profiled")).scalar() == 2
+    finally:
+        current_request.reset(token)
+        connection.close()
+
+    assert [row.id for row in rows] == [1, 2]
+    entries = [json.loads(line) for line in plan_path.read_text().splitlines()]
+    assert len(entries) == 1
+    entry = entries[0]
+    assert (entry["route"], entry["request_id"]) == ("GET /v1/referrals/", "req-1")
+    assert entry["statement"] == "SELECT id FROM profiled WHERE id > ? ORDER BY id"
+    assert entry["plan"][0]["Plan"]["Actual Rows"] == 2
+    assert f'vrp_db_query_explained_total{{fingerprint="{entry["fingerprint"]}"}} 1' in render_query_metrics()
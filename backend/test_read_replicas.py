@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test read replica routing
+
+Two SQLite files stand in for the replicas; each holds a marker row naming
+itself so a test can tell which database served a read.
+"""
+
+import asyncio
+import math
+import os
+import sys
+import time
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import text
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+    from starlette.requests import Request
+
+    from app.core import replicas
+    from app.core.cache import StatsCache
+    from app.core.replicas import READ_PRIMARY_COOKIE, Replica, ReplicaRouter, get_read_db
+    from app.models.stats_versions import StatsVersion
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+def sqlite_engine(path):
+    # Each test step runs its own event loop, so connections can't be pooled across them
+    return create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+def make_replica(path, name):
+    async def create():
+        engine = sqlite_engine(path)
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE marker (name TEXT)"))
+            await connection.execute(text("INSERT INTO marker VALUES (:name)"), {"name": name})
+        return Replica(name=name, engine=engine)
+    return asyncio.run(create())
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    router = ReplicaRouter(
+        [make_replica(tmp_path / "a.db", "a"), make_replica(tmp_path / "b.db", "b")],
+        strategy="round_robin", max_lag_seconds=5, check_interval_seconds=2
+    )
+    monkeypatch.setattr(replicas, "read_router", router)
+    yield router
+    asyncio.run(router.dispose())
+
+def make_request(cookies=None):
+    cookie = "; ".join(f"{name}={value}" for name, value in (cookies or {}).items())
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+async def read_marker(request):
+    """Open a read session the way an endpoint would; returns which database served it"""
+    sessions = get_read_db(request)
+    db = await sessions.__anext__()
+    try:
+        if db.info["replica"] is None:
+            return None
+        return await db.scalar(text("SELECT name FROM marker"))
+    finally:
+        await sessions.aclose()
+
+def test_unchecked_replicas_are_not_used(router):
+    assert router.choose() is None
+    assert asyncio.run(read_marker(make_request())) is None
+
+def test_round_robin(router):
+    asyncio.run(router.check_lag())
+
+    async def reads():
+        return [await read_marker(make_request()) for _ in range(4)]
+
+    assert sorted(asyncio.run(reads())) == ["a", "a", "b", "b"]
+
+def test_least_connections(router):
+    asyncio.run(router.check_lag())
+    router.strategy = "least_connections"
+    router.replicas[0].in_flight = 3
+
+    assert router.choose().name == "b"
+    router.replicas[1].in_flight = 4
+    assert router.choose().name == "a"
+
+def test_lagging_or_unreachable_replicas_fall_back(router):
+    asyncio.run(router.check_lag())
+    router.replicas[0].lag_seconds = 30
+    assert {router.choose().name for _ in range(4)} == {"b"}
+
+    async def unreachable():
+        raise ConnectionRefusedError("replica down")
+    router.replicas[1].engine = create_async_engine("sqlite+aiosqlite://", async_creator=unreachable)
+    asyncio.run(router.check_lag())
+    assert router.choose() is not None and router.choose().name == "a"
+    router.replicas[0].lag_seconds = 30
+    assert router.choose() is None
+
+def test_stale_checks_fall_back(router):
+    asyncio.run(router.check_lag())
+    for replica in router.replicas:
+        replica.checked_at -= 10
+    assert router.choose() is None
+
+def test_recent_write_pins_reads_to_primary(router):
+    asyncio.run(router.check_lag())
+
+    pinned = make_request({READ_PRIMARY_COOKIE: int(time.time()) + 10})
+    assert asyncio.run(read_marker(pinned)) is None
+
+    expired = make_request({READ_PRIMARY_COOKIE: int(time.time()) - 1})
+    assert asyncio.run(read_marker(expired)) in ("a", "b")
+
+def test_lag_is_measured_against_the_primary():
+    """A replica is as far behind as the newest primary WAL position it has replayed"""
+    router = ReplicaRouter([])
+    now = time.monotonic()
+    router._primary_wal.extend([(now - 10, 100), (now - 4, 200), (now, 300)])
+
+    assert router._lag_behind_primary(300) < 1
+    assert 4 <= router._lag_behind_primary(250) < 5
+    # However caught up with what it received, it hasn't seen anything the
+    # primary wrote in the last ten seconds
+    assert router._lag_behind_primary(50) == math.inf
+
+def test_replica_results_are_cached_under_the_version_they_saw(tmp_path):
+    """A replica that hasn't replayed a write reports the old version with the old numbers"""
+    cache = StatsCache()
+    primary, replica = sqlite_engine(tmp_path / "primary.db"), sqlite_engine(tmp_path / "replica.db")
+
+    async def steps():
+        for engine in (primary, replica):
+            async with engine.begin() as connection:
+                await connection.run_sync(StatsVersion.__table__.create)
+
+        async def get(engine, computed):
+            async def compute():
+                return computed
+            async with AsyncSession(engine) as db:
+                return await cache.get_or_compute(db, "stats", "VSA001", {}, compute)
+
+        async def write(engine):
+            async with AsyncSession(engine) as db:
+                await cache.bump(db, "VSA001")
+                await db.commit()
+
+        await write(primary)
+        results = [await get(primary, "primary")]
+        # Behind the write, so its numbers are kept under the version before it
+        results.append(await get(replica, "replica behind"))
+        results.append(await get(primary, "primary again"))
+        await write(replica)  # replayed
+        results.append(await get(replica, "replica caught up"))
+        await primary.dispose()
+        await replica.dispose()
+        return results
+
+    assert asyncio.run(steps()) == ["primary", "replica behind", "primary again", "primary again"]
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Verify that the common referral listing filters are index-backed
+
+Runs EXPLAIN against the configured database for the same query the
+list_referrals endpoint builds. Sequential scans are disabled for the
+transaction so the planner only falls back to one when no index can
+serve the filter, which is exactly what we want to catch.
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    from app.api.v1.endpoints.referrals import apply_referral_filters, apply_overdue_filters
+    from app.core.database import engine
+    from app.models.referrals import (
+        Referral, ProgramCodeEnum, PriorityLevelEnum, CrisisTypeEnum, UrgencyIndicatorEnum
+    )
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+NOW = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+FILTER_COMBINATIONS = {
+    "vsa": dict(vsa_id="VSA001"),
+    "vsa+date_range": dict(vsa_id="VSA001", issued_from=NOW - timedelta(days=30), issued_to=NOW),
+    "vsa+date_from": dict(vsa_id="VSA001", issued_from=NOW - timedelta(days=7)),
+    "date_range": dict(issued_from=NOW - timedelta(days=30), issued_to=NOW),
+    "vsa+priority": dict(vsa_id="VSA001", priority_level=PriorityLevelEnum.HIGH),
+    "vsa+date_range+program": dict(
+        vsa_id="VSA001", issued_from=NOW - timedelta(days=30), issued_to=NOW,
+        program_code=ProgramCodeEnum.MENTAL_HEALTH
+    ),
+    "priority": dict(priority_level=PriorityLevelEnum.HIGH),
+    "crisis_type": dict(crisis_type=CrisisTypeEnum.SUICIDE_RISK),
+    "urgency": dict(urgency_indicator=UrgencyIndicatorEnum.IMMEDIATE),
+}
+
+OVERDUE_COMBINATIONS = {
+    "all": dict(),
+    "vsa": dict(vsa_id="VSA001"),
+    "vsa+cursor": dict(vsa_id="VSA001", after=("WITHIN_24H", NOW.date(), "00000000-0000-0000-0000-000000000000")),
+    "urgency": dict(urgency_indicator=UrgencyIndicatorEnum.IMMEDIATE),
+}
+
+def _plan_nodes(plan):
+    """Yield every node of an EXPLAIN (FORMAT JSON) plan tree"""
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+def _partition_roots(connection, *roots):
+    """Map each root relation and its partitions (tables or indexes) to the root"""
+    mapping = {}
+    for root in roots:
+        rows = connection.execute(
+            text("SELECT relid::regclass::text FROM pg_partition_tree(CAST(:root AS regclass))"),
+            {"root": root}
+        ).scalars().all()
+        mapping.update({relation: root for relation in rows})
+        mapping[root] = root
+    connection.rollback()
+    return mapping
+
+def _assert_index_backed(name, plan, relations):
+    # referrals may be partitioned (database/partitioning.sql); its partitions count as referrals
+    scans = [
+        node for node in _plan_nodes(plan[0]["Plan"])
+        if relations.get(node.get("Relation Name")) == "referrals"
+    ]
+    assert scans, f"{name}: referrals not scanned at all?"
+    for node in scans:
+        # A full index scan (no Index Cond) is a seq scan in disguise
+        assert node["Node Type"] != "Seq Scan", f"{name}: seq scan on referrals\n{json.dumps(plan, indent=2)}"
+        if node["Node Type"] in ("Index Scan", "Index Only Scan"):
+            assert "Index Cond" in node, f"{name}: full index scan on referrals\n{json.dumps(plan, indent=2)}"
+
+@pytest.fixture(scope="module")
+def connection():
+    try:
+        conn = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+
+    if not conn.execute(text("SELECT to_regclass('referrals')")).scalar():
+        conn.close()
+        pytest.skip("referrals table not found - apply database/schema.sql first")
+    conn.rollback()
+
+    yield conn
+    conn.close()
+
+@pytest.mark.parametrize("name", sorted(FILTER_COMBINATIONS))
+def test_listing_filters_use_index(connection, name):
+    """Listing filter combinations should never need a seq scan on referrals"""
+    session = Session(bind=connection)
+    # Filter only, as in the endpoint's count(): with ORDER BY ... LIMIT a
+    # low-selectivity filter may legitimately be served by walking the
+    # issued_at index, which would mask a missing filter index
+    query = apply_referral_filters(session.query(Referral), **FILTER_COMBINATIONS[name])
+    sql = str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+    transaction = connection.begin()
+    try:
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    finally:
+        transaction.rollback()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    _assert_index_backed(name, plan, _partition_roots(connection, "referrals"))
+
+@pytest.mark.parametrize("name", sorted(OVERDUE_COMBINATIONS))
+def test_overdue_queue_uses_index(connection, name):
+    """The overdue-contact queue should be served from its partial indexes"""
+    if not connection.execute(text(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'idx_referrals_overdue'"
+    )).scalar():
+        connection.rollback()
+        pytest.skip("overdue queue indexes not found - apply database/overdue_contacts.sql first")
+    connection.rollback()
+
+    session = Session(bind=connection)
+    query = apply_overdue_filters(session.query(Referral), **OVERDUE_COMBINATIONS[name]).limit(100)
+    sql = str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+    transaction = connection.begin()
+    try:
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    finally:
+        transaction.rollback()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    overdue_indexes = _partition_roots(connection, "idx_referrals_overdue", "idx_referrals_vsa_overdue")
+    _assert_index_backed(name, plan, _partition_roots(connection, "referrals"))
+    index_names = {overdue_indexes.get(node.get("Index Name")) for node in _plan_nodes(plan[0]["Plan"])}
+    assert index_names & {"idx_referrals_overdue", "idx_referrals_vsa_overdue"}, \
+        f"{name}: overdue indexes not used\n{json.dumps(plan, indent=2)}"
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Test the monthly referral rollup (database/referral_rollups.sql) and its
+reconciliation job (app/core/rollups.py)
+
+Runs against the configured database inside a transaction that is rolled
+back; after every write the rollup must equal referral_rollup_recomputed.
+"""
+
+import json
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    from app.core.database import engine
+    from app.core.rollups import find_rollup_mismatches, reconcile_referral_rollup
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+NOW = datetime.now(timezone.utc) - timedelta(hours=1)
+EARLIER = NOW - timedelta(days=40)
+
+@pytest.fixture
+def db():
+    try:
+        connection = engine.connect()
+    except Exception as e:
+        pytest.skip(f"Database not available: {e}")
+    try:
+        if not connection.execute(text("SELECT to_regclass('referral_rollup_monthly')")).scalar():
+            pytest.skip("referral_rollup_monthly not found - apply database/referral_rollups.sql first")
+        connection.rollback()
+        transaction = connection.begin()
+        session = Session(bind=connection, join_transaction_mode="create_savepoint")
+        yield session
+        session.close()
+        transaction.rollback()
+    finally:
+        connection.close()
+
+def add_referrals(db, *groups):
+    """Insert (vsa_id, program_code, priority_level, issued_at) referrals in one statement"""
+    tokens = [str(uuid.uuid4()) for _ in groups]
+    rows = [
+        {"token": token, "vsa_id": vsa_id, "program": program, "priority": priority, "issued_at": issued_at}
+        for token, (vsa_id, program, priority, issued_at) in zip(tokens, groups)
+    ]
+    db.execute(text("""
+        INSERT INTO referrals (referral_token, vsa_id, program_code, priority_level, issued_at, referral_type)
+        SELECT CAST(r->>'token' AS uuid), r->>'vsa_id', CAST(r->>'program' AS program_code_enum),
+               CAST(r->>'priority' AS priority_level_enum), CAST(r->>'issued_at' AS timestamptz), 'CLINICAL_REFERRAL'
+        FROM jsonb_array_elements(CAST(:rows AS jsonb)) AS r
+    """), {"rows": json.dumps(rows, default=str)})
+    return tokens
+
+def add_outcomes(db, *outcomes):
+    """Insert (referral_token, status, first_contact_at) outcomes in one statement"""
+    rows = [
+        {"id": str(uuid.uuid4()), "token": token, "status": status, "contacted": contacted}
+        for token, status, contacted in outcomes
+    ]
+    db.execute(text("""
+        INSERT INTO outcomes (id, referral_token, vsa_id, status, first_contact_at, updated_by)
+        SELECT CAST(o->>'id' AS uuid), CAST(o->>'token' AS uuid), r.vsa_id,
+               CAST(o->>'status' AS outcome_status_enum), CAST(o->>'contacted' AS timestamptz), 'test'
+        FROM jsonb_array_elements(CAST(:rows AS jsonb)) AS o
+        JOIN referrals r ON r.referral_token = CAST(o->>'token' AS uuid)
+    """), {"rows": json.dumps(rows, default=str)})
+
+def totals(db):
+    """Referrals and engaged outcomes counted by the rollup"""
+    return tuple(db.execute(text(
+        "SELECT COALESCE(SUM(total_referrals), 0), COALESCE(SUM(engaged_count), 0) FROM referral_rollup_monthly"
+    )).one())
+
+def assert_exact(db):
+    assert find_rollup_mismatches(db) == []
+
+def test_writes_keep_the_rollup_exact(db):
+    """Inserts, updates and deletes of referrals and outcomes land in the right groups"""
+    assert_exact(db)
+    referrals_before, engaged_before = totals(db)
+
+    # A bulk insert spanning groups, then outcomes for most of them
+    a, b, c, d, e, f = add_referrals(
+        db,
+        ("VSA001", "MENTAL_HEALTH", "HIGH", NOW),
+        ("VSA001", "MENTAL_HEALTH", "HIGH", NOW),
+        ("VSA001", "HOUSING_ASSISTANCE", "MEDIUM", NOW),
+        ("VSA001", "MENTAL_HEALTH", "HIGH", EARLIER),
+        ("VSA002", "MENTAL_HEALTH", "LOW", NOW),
+        ("VSA002", "EMPLOYMENT", "HIGH", EARLIER),
+    )
+    assert_exact(db)
+    add_outcomes(
+        db,
+        (a, "ENGAGED", NOW + timedelta(minutes=30)),
+        (b, "RECEIVED", None),
+        (c, "ENGAGED", NOW + timedelta(minutes=10)),
+        (d, "WAITLIST", EARLIER + timedelta(hours=5)),
+        (e, "RECEIVED", None),
+    )
+    assert_exact(db)
+    assert totals(db) == (referrals_before + 6, engaged_before + 2)
+
+    # Outcome changes, in one statement and one at a time
+    db.execute(text("""
+        UPDATE outcomes SET status = 'ENGAGED', first_contact_at = CAST(:contacted AS timestamptz)
+        WHERE referral_token IN (CAST(:b AS uuid), CAST(:d AS uuid))
+    """), {"b": b, "d": d, "contacted": NOW + timedelta(minutes=45)})
+    db.execute(text("UPDATE outcomes SET status = 'COMPLETED' WHERE referral_token = CAST(:a AS uuid)"), {"a": a})
+    db.execute(text("UPDATE outcomes SET updated_by = 'someone else' WHERE referral_token = CAST(:c AS uuid)"), {"c": c})
+    assert_exact(db)
+
+    # Referrals moving group, with and without an outcome going with them; a
+    # new month moves the row to another partition once referrals is partitioned
+    db.execute(text("""
+        UPDATE referrals SET program_code = 'SUBSTANCE_ABUSE' WHERE referral_token IN (CAST(:a AS uuid), CAST(:f AS uuid))
+    """), {"a": a, "f": f})
+    db.execute(text("""
+        UPDATE referrals SET issued_at = CAST(:earlier AS timestamptz) WHERE referral_token = CAST(:c AS uuid)
+    """), {"c": c, "earlier": EARLIER})
+    assert_exact(db)
+    # Same month and group, but a longer time to contact
+    db.execute(text("""
+        UPDATE referrals SET issued_at = issued_at - INTERVAL '1 second' WHERE referral_token = CAST(:b AS uuid)
+    """), {"b": b})
+    assert_exact(db)
+
+    # An outcome deleted on its own, a referral deleted with its outcome, several at once
+    db.execute(text("DELETE FROM outcomes WHERE referral_token = CAST(:e AS uuid)"), {"e": e})
+    assert_exact(db)
+    db.execute(text("DELETE FROM referrals WHERE referral_token = CAST(:a AS uuid)"), {"a": a})
+    assert_exact(db)
+    db.execute(text("""
+        DELETE FROM referrals WHERE referral_token IN (CAST(:b AS uuid), CAST(:c AS uuid), CAST(:f AS uuid))
+    """), {"b": b, "c": c, "f": f})
+    assert_exact(db)
+    assert totals(db) == (referrals_before + 2, engaged_before + 1)
+
+def test_reconcile_reports_and_repairs_drift(db):
+    """A corrupted group is reported, then rewritten from the base tables"""
+    token, = add_referrals(db, ("VSA001", "MENTAL_HEALTH", "HIGH", NOW))
+    add_outcomes(db, (token, "ENGAGED", NOW + timedelta(minutes=30)))
+    db.execute(text("""
+        UPDATE referral_rollup_monthly SET engaged_count = engaged_count + 5, contacted_count = 0
+        WHERE vsa_id = 'VSA001' AND program_code = 'MENTAL_HEALTH' AND priority_level = 'HIGH'
+          AND month = referral_rollup_month(CAST(:now AS timestamptz))
+    """), {"now": NOW})
+
+    report = reconcile_referral_rollup(db)
+    assert not report["consistent"] and report["repaired_groups"] == 0
+    [group] = report["mismatched_groups"]
+    assert (group["vsa_id"], group["program_code"], group["priority_level"]) == ("VSA001", "MENTAL_HEALTH", "HIGH")
+    assert group["rollup_engaged_count"] == group["actual_engaged_count"] + 5
+    assert find_rollup_mismatches(db) != []
+
+    report = reconcile_referral_rollup(db, repair=True)
+    assert report["repaired_groups"] == 1
+    assert_exact(db)
+    assert reconcile_referral_rollup(db)["consistent"]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Test request metrics and their aggregation across workers
+
+Requests go through the real app's middleware with no database behind it;
+worker processes are simulated by snapshot files in a temporary directory.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import create_engine, text
+
+try:
+    from fastapi.testclient import TestClient
+    from starlette.responses import StreamingResponse
+
+    from app import main
+    from app.core import metrics
+    from app.core.metrics import (
+        RequestMetrics, aggregate_metrics, count_queries, merge_expositions, render_request_metrics
+    )
+    from app.core.request_context import RequestContext, current_request
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    fresh = RequestMetrics()
+    monkeypatch.setattr(metrics, "request_metrics", fresh)
+    monkeypatch.setattr(main, "request_metrics", fresh)
+    return fresh
+
+def test_requests_are_measured_by_route_template(fresh_metrics):
+    client = TestClient(main.app)
+    body = b""
+    for _ in range(3):
+        response = client.get("/v1/health")
+        assert response.status_code == 200
+        body += response.content
+    assert client.get("/v1/nowhere/42").status_code == 404
+    client.post("/v1/auth/login", content=b"x" * 1500, headers={"content-type": "text/plain"})
+
+    assert fresh_metrics.in_flight == 0
+    assert fresh_metrics.latency[("GET", "/v1/health", "200")].count == 3
+    assert fresh_metrics.latency[("GET", "unmatched", "404")].count == 1
+    assert fresh_metrics.response_size[("GET", "/v1/health")].sum == len(body)
+    assert fresh_metrics.request_size[("POST", "/v1/auth/login")].sum == 1500
+
+    exposition = render_request_metrics()
+    assert 'vrp_http_request_duration_seconds_count{method="GET",route="/v1/health",status="200"} 3' in exposition
+    assert "vrp_http_requests_in_flight 0" in exposition
+
+def test_clients_gone_before_the_body_are_measured(fresh_metrics):
+    """A client that disconnects before the body is read still ends its request"""
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+             "method": "GET", "path": "/v1/export", "raw_path": b"/v1/export", "query_string": b"",
+             "root_path": "", "headers": [(b"content-length", b"0")]}
+    started = []
+
+    async def body():
+        started.append(True)
+        yield b"never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    async def request():
+        current_request.set(RequestContext(method="GET", scope=scope))
+        await main.RequestTiming(StreamingResponse(body()))(scope, receive, send)
+
+    with pytest.raises(Exception):
+        asyncio.run(request())
+    assert not started
+    assert fresh_metrics.in_flight == 0
+    assert fresh_metrics.latency[("GET", "unmatched", "200")].count == 1
+    assert fresh_metrics.response_size[("GET", "unmatched")].sum == 0
+
+def test_statements_count_against_the_request(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/db.sqlite")
+    count_queries(engine)
+    context = RequestContext(method="GET", scope={"path": "/"})
+    token = current_request.set(context)
+    try:
+        with engine.connect() as connection:
+            for _ in range(3):
+                connection.execute(text("SELECT 1"))
+    finally:
+        current_request.reset(token)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))  # outside a request
+    assert context.queries == 3
+
+def test_imports_count_rows(fresh_metrics):
+    fresh_metrics.record_import("csv", imported=90, failed=10, seconds=2)
+    fresh_metrics.record_import("csv", imported=50, failed=0, seconds=1)
+    exposition = render_request_metrics()
+    assert 'vrp_import_rows_total{source="csv",result="imported"} 140' in exposition
+    assert 'vrp_import_rows_total{source="csv",result="failed"} 10' in exposition
+    assert 'vrp_import_duration_seconds_sum{source="csv"} 3' in exposition
+
+def worker(in_flight, requests, seconds):
+    return "\n".join([
+        "# TYPE vrp_http_requests_in_flight gauge",
+        f"vrp_http_requests_in_flight {in_flight}",
+        "# TYPE vrp_http_request_duration_seconds histogram",
+        f'vrp_http_request_duration_seconds_bucket{{route="/a",le="+Inf"}} {requests}',
+        f'vrp_http_request_duration_seconds_sum{{route="/a"}} {seconds}',
+        f'vrp_http_request_duration_seconds_count{{route="/a"}} {requests}',
+    ]) + "\n"
+
+def test_workers_are_summed_and_exited_gauges_dropped():
+    merged = merge_expositions([(worker(2, 5, 0.5), True), (worker(1, 3, 0.25), True), (worker(7, 4, 1), False)])
+    assert "vrp_http_requests_in_flight 3\n" in merged
+    assert 'vrp_http_request_duration_seconds_count{route="/a"} 12\n' in merged
+    assert 'vrp_http_request_duration_seconds_sum{route="/a"} 1.75\n' in merged
+    assert merged.count("# TYPE vrp_http_requests_in_flight gauge") == 1
+
+def test_scrapes_read_every_worker_snapshot(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", ""])
+    exited.wait()
+    (tmp_path / f"{exited.pid}-1.prom").write_text(worker(7, 4, 1))
+    (tmp_path / ".tmp-partial").write_text("garbage")
+
+    merged = aggregate_metrics(worker(1, 3, 0.25), str(tmp_path))
+    assert (tmp_path / f"{metrics._worker_key()}.prom").read_text() == worker(1, 3, 0.25)
+    assert "vrp_http_requests_in_flight 1\n" in merged
+    assert 'vrp_http_request_duration_seconds_count{route="/a"} 7\n' in merged
+    # Without a directory each worker serves its own
+    assert aggregate_metrics(worker(1, 3, 0.25), None) == worker(1, 3, 0.25)
+
+def test_exited_workers_are_kept_when_their_pid_is_reused(tmp_path):
+    """A snapshot with this process's pid but another start time is an exited worker's"""
+    (tmp_path / f"{os.getpid()}-1.prom").write_text(worker(7, 4, 1))
+
+    merged = aggregate_metrics(worker(1, 3, 0.25), str(tmp_path))
+    assert 'vrp_http_request_duration_seconds_count{route="/a"} 7\n' in merged
+    assert "vrp_http_requests_in_flight 1\n" in merged
+    # Folded into the retained totals, and still counted on the next scrape
+    assert not (tmp_path / f"{os.getpid()}-1.prom").exists()
+    merged = aggregate_metrics(worker(0, 5, 0.5), str(tmp_path))
+    assert 'vrp_http_request_duration_seconds_count{route="/a"} 9\n' in merged
+    assert 'vrp_http_request_duration_seconds_sum{route="/a"} 1.5\n' in merged
+
+def test_a_folded_snapshot_left_behind_is_not_counted_twice(tmp_path):
+    """A scrape that died between writing dead.prom and removing the files"""
+    (tmp_path / "1-1.prom").write_text(worker(7, 4, 1))
+    (tmp_path / metrics.DEAD_SNAPSHOT).write_text("# folded 1-1.prom\n" + worker(0, 4, 1))
+
+    merged = aggregate_metrics(worker(1, 3, 0.25), str(tmp_path))
+    assert 'vrp_http_request_duration_seconds_count{route="/a"} 7\n' in merged
+    assert not (tmp_path / "1-1.prom").exists()
+
+def test_metrics_are_served_to_the_monitoring_network_only():
+    assert TestClient(main.app).get("/metrics").status_code == 403
+    assert TestClient(main.app, client=("10.1.2.3", 50000)).get("/metrics").status_code == 403
+    response = TestClient(main.app, client=("127.0.0.1", 50000)).get("/metrics")
+    assert response.status_code == 200
+    assert "vrp_http_requests_in_flight" in response.text
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test write-driven invalidation of the stats result cache
+
+A SQLite file stands in for the database holding stats_versions; separate
+StatsCache instances stand in for separate API workers.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+try:
+    import aiosqlite  # noqa: F401
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from app.core.cache import StatsCache
+    from app.models.stats_versions import StatsVersion
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+class Counter:
+    """Stand-in aggregate that counts how often it was computed"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.calls
+
+def stats_database(path):
+    """An engine on a fresh database with the stats_versions table"""
+    # Each test step runs its own event loop, so connections can't be pooled across them
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool)
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(StatsVersion.__table__.create)
+    asyncio.run(create())
+    return engine
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = stats_database(tmp_path / "stats.db")
+    yield engine
+    asyncio.run(engine.dispose())
+
+def get(engine, cache, endpoint, vsa_id, filters, compute, **kwargs):
+    async def run():
+        async with AsyncSession(engine) as db:
+            return await cache.get_or_compute(db, endpoint, vsa_id, filters, compute, **kwargs)
+    return asyncio.run(run())
+
+def write(engine, cache, *vsa_ids, commit=True):
+    async def run():
+        async with AsyncSession(engine) as db:
+            await cache.bump(db, *vsa_ids)
+            if commit:
+                await db.commit()
+    asyncio.run(run())
+
+def test_cached_until_vsa_write(engine):
+    cache = StatsCache()
+    compute = Counter()
+
+    assert get(engine, cache, "stats", "VSA001", {}, compute) == 1
+    assert get(engine, cache, "stats", "VSA001", {}, compute) == 1
+
+    write(engine, cache, "VSA002")
+    assert get(engine, cache, "stats", "VSA001", {}, compute) == 1
+
+    write(engine, cache, "VSA001")
+    assert get(engine, cache, "stats", "VSA001", {}, compute) == 2
+
+def test_writes_through_other_workers_invalidate(engine):
+    worker, other_worker = StatsCache(), StatsCache()
+    compute = Counter()
+
+    get(engine, worker, "stats", "VSA001", {}, compute)
+    get(engine, worker, "stats", None, {}, compute)
+    write(engine, other_worker, "VSA001")
+    assert get(engine, worker, "stats", "VSA001", {}, compute) == 3
+    assert get(engine, worker, "stats", None, {}, compute) == 4
+
+def test_rolled_back_writes_keep_the_cache(engine):
+    cache = StatsCache()
+    compute = Counter()
+
+    get(engine, cache, "stats", "VSA001", {}, compute)
+    write(engine, cache, "VSA001", commit=False)
+    assert get(engine, cache, "stats", "VSA001", {}, compute) == 1
+
+def test_filters_and_endpoints_are_separate_entries(engine):
+    cache = StatsCache()
+    compute = Counter()
+
+    get(engine, cache, "stats", "VSA001", {"bucket": "month"}, compute)
+    get(engine, cache, "stats", "VSA001", {"bucket": "week"}, compute)
+    get(engine, cache, "funnel", "VSA001", {"bucket": "month"}, compute)
+    assert compute.calls == 3
+
+def test_all_vsa_view_invalidated_by_any_write(engine):
+    cache = StatsCache()
+    compute = Counter()
+
+    get(engine, cache, "stats", None, {}, compute)
+    write(engine, cache, "VSA002")
+    assert get(engine, cache, "stats", None, {}, compute) == 2
+
+def test_max_staleness_accepts_outdated_all_vsa_view(engine):
+    cache = StatsCache()
+    compute = Counter()
+
+    get(engine, cache, "stats", None, {}, compute)
+    write(engine, cache, "VSA001")
+    assert get(engine, cache, "stats", None, {}, compute, max_staleness=60) == 1
+    assert get(engine, cache, "stats", None, {}, compute, max_staleness=0) == 2
+
+def test_ttl_bounds_entry_lifetime(engine):
+    cache = StatsCache(ttl_seconds=0)
+    compute = Counter()
+
+    get(engine, cache, "stats", "VSA001", {}, compute)
+    get(engine, cache, "stats", "VSA001", {}, compute)
+    assert compute.calls == 2
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Test the aggregate stats endpoints against the per-group queries they replaced
+
+Referral stats (GROUPING SETS), outcome stats (FILTER aggregates and
+percentile_cont) and the analytics funnel (date_trunc buckets) are each
+checked against one query per group on a small fixture, inside a
+transaction that is rolled back; skips without the database.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from sqlalchemy import func, insert, select, text
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    from app.api.v1.endpoints import analytics, outcomes, referrals
+    from app.core.auth import AuthenticatedUser
+    from app.core.cache import stats_cache
+    from app.core.database import async_engine
+    from app.models.outcomes import Outcome
+    from app.models.referrals import Referral
+    from app.models.users import UserRoleEnum
+except Exception as e:  # e.g. database driver not installed
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+VSA = "VSA001"
+USER = AuthenticatedUser(
+    id="user-stats-test", username="stats-test", role=UserRoleEnum.VSA_USER, vsa_id=VSA, is_active=True
+)
+# Before any real data, so the fixture is all a date range sees
+ISSUED_FROM = datetime(2021, 1, 1, tzinfo=timezone.utc)
+ISSUED_TO = datetime(2021, 4, 1, tzinfo=timezone.utc)
+
+@pytest.fixture(autouse=True)
+def fresh_stats_cache():
+    # Raw inserts don't bump stats_versions, and nothing here should outlive the test
+    stats_cache.clear()
+    yield
+    stats_cache.clear()
+
+def rolled_back(test):
+    """Run test(db) on the fixture in a session whose commits are undone afterwards"""
+    async def run():
+        try:
+            async with async_engine.connect() as connection:
+                await connection.begin()
+                db = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+                try:
+                    await add_fixture(db)
+                    return await test(db)
+                finally:
+                    await db.close()
+                    await connection.rollback()
+        finally:
+            await async_engine.dispose()
+
+    try:
+        return asyncio.run(run())
+    except (OSError, ConnectionError) as e:
+        pytest.skip(f"Database not available: {e}")
+
+def at(month, day, hour=12):
+    return datetime(2021, month, day, hour, tzinfo=timezone.utc)
+
+async def add_fixture(db):
+    """
+    Referrals across three months and several groups, some without a crisis
+    type, and outcomes in most statuses. One VSA001 outcome belongs to a
+    VSA002 referral, which RLS hides from VSA001 users.
+    """
+    referrals = [
+        # (vsa_id, program_code, priority_level, crisis_type, issued_at)
+        (VSA, "MENTAL_HEALTH", "HIGH", "PTSD", at(1, 4)),
+        (VSA, "MENTAL_HEALTH", "HIGH", None, at(1, 31, 23)),
+        (VSA, "MENTAL_HEALTH", "LOW", None, at(2, 1, 0)),
+        (VSA, "HOUSING_ASSISTANCE", "MEDIUM", "HOMELESSNESS", at(2, 14)),
+        (VSA, "EMPLOYMENT", "LOW", None, at(3, 2)),
+        (VSA, "EMPLOYMENT", "HIGH", "DEPRESSION", at(3, 30)),
+        (VSA, "SUBSTANCE_ABUSE", "MEDIUM", "SUBSTANCE_ABUSE", at(3, 31, 23)),
+        ("VSA002", "MENTAL_HEALTH", "HIGH", None, at(2, 20)),
+    ]
+    tokens = [str(uuid.uuid4()) for _ in referrals]
+    await db.execute(insert(Referral.__table__), [{
+        "referral_token": token, "vsa_id": vsa_id, "program_code": program, "priority_level": priority,
+        "crisis_type": crisis_type, "issued_at": issued_at, "referral_type": "CLINICAL_REFERRAL",
+    } for token, (vsa_id, program, priority, crisis_type, issued_at) in zip(tokens, referrals)])
+
+    issued = dict(zip(tokens, (issued_at for *_, issued_at in referrals)))
+    outcomes = [
+        # (referral, status, reason_code, hours to first contact, hours to close)
+        (tokens[0], "COMPLETED", None, 2, 50),
+        (tokens[1], "ENGAGED", None, 5, None),
+        (tokens[2], "RECEIVED", None, None, None),
+        (tokens[3], "UNREACHABLE", "CONTACT_FAILED", 30, 72),
+        (tokens[4], "WAITLIST", "CAPACITY", 1.5, None),
+        (tokens[5], "DECLINED", "WITHDREW", 9, 10),
+        (tokens[7], "ENGAGED", None, 4, None),
+    ]
+    await db.execute(insert(Outcome.__table__), [{
+        "id": str(uuid.uuid4()), "referral_token": token, "vsa_id": VSA, "status": status,
+        "reason_code": reason,
+        "first_contact_at": issued[token] + timedelta(hours=contact) if contact is not None else None,
+        "closed_at": issued[token] + timedelta(hours=close) if close is not None else None,
+        "updated_by": USER.id,
+    } for token, status, reason, contact, close in outcomes])
+
+def key(value):
+    if value is None:
+        return "UNSPECIFIED"
+    return value.isoformat() if isinstance(value, datetime) else value.value
+
+async def referral_stats_per_group(db, vsa_id=None, issued_from=None, issued_to=None, bucket=None):
+    """A count and a GROUP BY per breakdown, as get_referral_stats used to run"""
+    def filtered(query):
+        if vsa_id:
+            query = query.where(Referral.vsa_id == vsa_id)
+        if issued_from:
+            query = query.where(Referral.issued_at >= issued_from)
+        if issued_to:
+            query = query.where(Referral.issued_at < issued_to)
+        return query
+
+    breakdowns = {
+        "by_program": Referral.program_code,
+        "by_priority": Referral.priority_level,
+        "by_crisis_type": Referral.crisis_type,
+    }
+    if bucket:
+        breakdowns["by_period"] = func.date_trunc(bucket, Referral.issued_at)
+
+    stats = {"total_referrals": await db.scalar(filtered(select(func.count(Referral.referral_token))))}
+    for name, column in breakdowns.items():
+        rows = await db.execute(filtered(select(column, func.count(Referral.referral_token))).group_by(column))
+        stats[name] = {key(value): count for value, count in rows.all()}
+    return stats
+
+def test_referral_stats_match_the_per_group_queries():
+    async def test(db):
+        results = []
+        for filters in (
+            dict(vsa_id=VSA, issued_from=ISSUED_FROM, issued_to=ISSUED_TO, bucket="month"),
+            dict(vsa_id=None, issued_from=ISSUED_FROM, issued_to=ISSUED_TO, bucket="week"),
+            dict(vsa_id=VSA, issued_from=None, issued_to=None, bucket=None),
+        ):
+            stats = await referrals.get_referral_stats(**filters, db=db)
+            results.append((stats, await referral_stats_per_group(db, **filters)))
+        return results
+
+    results = rolled_back(test)
+    for stats, expected in results:
+        assert {name: stats[name] for name in expected} == expected
+
+    # A NULL crisis type is a group of its own, not mistaken for the total
+    in_range, _, _ = results
+    stats = in_range[0]
+    assert stats["total_referrals"] == 7
+    assert stats["by_crisis_type"]["UNSPECIFIED"] == 3
+    assert sum(stats["by_crisis_type"].values()) == 7
+
+async def outcome_stats_per_group(db, vsa_id):
+    """The queries get_outcome_stats used to run, plus the raw timings for percentiles"""
+    status_rows = await db.execute(
+        select(Outcome.status, func.count(Outcome.id)).where(Outcome.vsa_id == vsa_id).group_by(Outcome.status)
+    )
+    reason_rows = await db.execute(
+        select(Outcome.reason_code, func.count(Outcome.id))
+        .where(Outcome.vsa_id == vsa_id, Outcome.reason_code.isnot(None))
+        .group_by(Outcome.reason_code)
+    )
+    total = await db.scalar(select(func.count(Outcome.id)).where(Outcome.vsa_id == vsa_id))
+
+    async def hours(column):
+        rows = await db.scalars(
+            select(func.extract('epoch', column - Referral.issued_at) / 3600)
+            .join(Referral, Outcome.referral_token == Referral.referral_token)
+            .where(Outcome.vsa_id == vsa_id, column.isnot(None))
+        )
+        return [float(value) for value in rows.all()]
+
+    return {
+        "total_outcomes": total,
+        "by_status": {status.value: count for status, count in status_rows.all()},
+        "by_reason": {reason.value: count for reason, count in reason_rows.all()},
+    }, await hours(Outcome.first_contact_at), await hours(Outcome.closed_at)
+
+def assert_timings(stats, name, values):
+    if not values:
+        assert stats[f"avg_{name}"] is None
+        return
+    # percentile_cont interpolates between the closest ranks, as method="inclusive" does
+    deciles = statistics.quantiles(values, n=10, method="inclusive") if len(values) > 1 else [values[0]] * 9
+    assert stats[f"avg_{name}"] == pytest.approx(statistics.fmean(values))
+    assert stats[f"median_{name}"] == pytest.approx(statistics.median(values))
+    assert stats[f"p90_{name}"] == pytest.approx(deciles[8])
+
+def test_outcome_stats_match_the_per_group_queries():
+    async def test(db):
+        # As a VSA user sees them, with the policies enforced
+        await db.execute(text("SELECT set_config('app.vsa_id', :vsa_id, true)"), {"vsa_id": VSA})
+        await db.execute(text("SET LOCAL ROLE vrp_vsa_access"))
+        stats = await outcomes.get_outcome_stats(vsa_id=None, max_staleness=None, current_user=USER, db=db)
+        return stats.model_dump(), await outcome_stats_per_group(db, VSA)
+
+    stats, (expected, contact_hours, close_hours) = rolled_back(test)
+    # Every outcome is counted, including the one whose referral is hidden
+    assert {name: stats[name] for name in expected} == expected
+    assert_timings(stats, "time_to_contact", contact_hours)
+    assert_timings(stats, "time_to_close", close_hours)
+
+async def funnel_per_period(db, vsa_id, bucket, issued_from, issued_to):
+    """One query per bucket, each over that bucket's range of issue dates"""
+    def in_range(query):
+        return query.where(
+            Referral.vsa_id == vsa_id, Referral.issued_at >= issued_from, Referral.issued_at < issued_to
+        )
+
+    periods = (await db.scalars(
+        in_range(select(func.date_trunc(bucket, Referral.issued_at)).distinct())
+    )).all()
+    funnel = []
+    for period in sorted(periods):
+        end = await db.scalar(select(text(f"CAST(:period AS timestamptz) + INTERVAL '1 {bucket}'")), {"period": period})
+
+        def counted(query, *conditions):
+            return in_range(query).where(Referral.issued_at >= period, Referral.issued_at < end, *conditions)
+
+        async def outcomes_with(*statuses):
+            query = counted(
+                select(func.count(Outcome.id)).join(Referral, Outcome.referral_token == Referral.referral_token)
+            )
+            if statuses:
+                query = query.where(Outcome.status.in_(statuses))
+            return await db.scalar(query)
+
+        funnel.append({
+            "period": period,
+            "issued": await db.scalar(counted(select(func.count(Referral.referral_token)))),
+            "received": await outcomes_with(),
+            "engaged": await outcomes_with("ENGAGED", "WAITLIST", "COMPLETED"),
+            "completed": await outcomes_with("COMPLETED"),
+            "unreachable": await outcomes_with("UNREACHABLE"),
+        })
+    return funnel
+
+def test_funnel_matches_the_per_period_queries():
+    async def test(db):
+        results = []
+        for bucket in ("month", "week"):
+            funnel = await analytics.get_referral_funnel(
+                vsa_id=None, bucket=bucket, issued_from=ISSUED_FROM, issued_to=ISSUED_TO,
+                max_staleness=None, current_user=USER, db=db
+            )
+            expected = await funnel_per_period(db, VSA, bucket, ISSUED_FROM, ISSUED_TO)
+            results.append((funnel, expected))
+        return results
+
+    (by_month, expected_by_month), (by_week, expected_by_week) = rolled_back(test)
+    assert [period.model_dump() for period in by_month.periods] == expected_by_month
+    assert [period.model_dump() for period in by_week.periods] == expected_by_week
+    assert sum(period["issued"] for period in expected_by_month) == 7
+    assert sum(period["received"] for period in expected_by_month) == 6
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test claims-based tokens and the in-memory revocation set
+"""
+
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Add the app directory to the Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+try:
+    from fastapi import HTTPException
+
+    from app.config import settings
+    from app.core import auth
+    from app.core.auth import (
+        AuthenticatedUser, changes_token_claims, create_access_token, get_current_active_user,
+        get_current_user, token_claims, verify_token
+    )
+    from app.core.revocations import TokenRevocations
+    from app.models.users import UserRoleEnum
+except Exception as e:
+    pytest.skip(f"Application modules not importable: {e}", allow_module_level=True)
+
+def make_user(**overrides):
+    fields = dict(id="u1", username="vsa_user", role=UserRoleEnum.VSA_USER, vsa_id="VSA001",
+                  is_active=True, token_version=2)
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+def test_claims_round_trip():
+    payload = verify_token(create_access_token(token_claims(make_user())))
+    user = AuthenticatedUser.from_claims(payload)
+
+    assert user == AuthenticatedUser(
+        id="u1", username="vsa_user", role=UserRoleEnum.VSA_USER, vsa_id="VSA001",
+        is_active=True, token_version=2
+    )
+
+def test_claim_fields_changes():
+    user = make_user()
+    assert not changes_token_claims(user, {"full_name": "New Name", "vsa_id": "VSA001"})
+    assert changes_token_claims(user, {"vsa_id": "VSA002"})
+    assert changes_token_claims(user, {"is_active": False})
+
+def test_older_token_versions_are_revoked():
+    revocations = TokenRevocations()
+    assert not revocations.is_revoked("u1", 0)
+
+    revocations.record("u1", 3, True)
+    assert revocations.is_revoked("u1", 2)
+    assert not revocations.is_revoked("u1", 3)
+    # Unversioned tokens are only revoked by deactivation
+    assert not revocations.is_revoked("u1", None)
+
+def test_inactive_users_are_revoked():
+    revocations = TokenRevocations()
+    revocations.replace([("u1", 0, False)], time.monotonic())
+
+    assert revocations.is_revoked("u1", 0)
+    assert revocations.is_revoked("u1", None)
+    assert not revocations.is_revoked("u2", 0)
+
+def test_reload_keeps_newer_local_changes():
+    revocations = TokenRevocations()
+    started_at = time.monotonic()
+    revocations.record("u1", 1, False)
+
+    # A reload that started before the change may not include it
+    revocations.replace([], started_at)
+    assert revocations.is_revoked("u1", 0)
+
+    # A later reload is authoritative
+    revocations.replace([], time.monotonic())
+    assert not revocations.is_revoked("u1", 0)
+
+def test_is_current_tracks_reload_age():
+    revocations = TokenRevocations()
+    assert not revocations.is_current(60)
+
+    revocations.replace([], time.monotonic())
+    assert revocations.is_current(60)
+    assert not revocations.is_current(-1)
+
+@pytest.fixture
+def other_worker(monkeypatch):
+    """A worker with an empty token cache and a current revocation set"""
+    revocations = TokenRevocations()
+    revocations.replace([], time.monotonic())
+    monkeypatch.setattr(auth, "token_revocations", revocations)
+    auth.invalidate_user_cache("u1")
+    yield revocations
+    auth.invalidate_user_cache("u1")
+
+def authenticate(token):
+    async def run():
+        return await get_current_active_user(await get_current_user(token, db=None))
+    return asyncio.run(run())
+
+def test_cached_users_see_changes_made_by_another_worker(other_worker, monkeypatch):
+    monkeypatch.setattr(settings, "auth_token_claims", False)
+    stored = make_user(token_version=0)
+    loads = []
+
+    async def get_user(db, user_id):
+        loads.append(user_id)
+        return stored
+    monkeypatch.setattr(auth.repository, "get_user", get_user)
+    token = create_access_token({"sub": "u1"})
+
+    assert authenticate(token).is_active
+    assert authenticate(token).is_active
+    assert loads == ["u1"]
+
+    # Another worker moves the user to a new VSA; the refresh brings the new version
+    stored = make_user(token_version=1, vsa_id="VSA002")
+    other_worker.replace([("u1", 1, True)], time.monotonic())
+    assert authenticate(token).vsa_id == "VSA002"
+    assert loads == ["u1", "u1"]
+
+    # ...then deactivates them
+    stored = make_user(token_version=2, is_active=False)
+    other_worker.replace([("u1", 2, False)], time.monotonic())
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 400
+
+def test_cached_claims_are_rejected_once_revoked(other_worker, monkeypatch):
+    monkeypatch.setattr(settings, "auth_token_claims", True)
+    token = create_access_token(token_claims(make_user()))
+    assert authenticate(token).id == "u1"
+
+    other_worker.replace([("u1", 3, True)], time.monotonic())
+    with pytest.raises(HTTPException) as error:
+        authenticate(token)
+    assert error.value.status_code == 401
+
+def test_nothing_is_cached_while_revocations_are_stale(monkeypatch):
+    monkeypatch.setattr(auth, "token_revocations", TokenRevocations())
+    monkeypatch.setattr(settings, "auth_token_claims", False)
+    loads = []
+
+    async def get_user(db, user_id):
+        loads.append(user_id)
+        return make_user(token_version=0)
+    monkeypatch.setattr(auth.repository, "get_user", get_user)
+    token = create_access_token({"sub": "u1"})
+
+    authenticate(token)
+    authenticate(token)
+    assert loads == ["u1", "u1"]
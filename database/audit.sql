@@ -0,0 +1,150 @@
+-- Veteran Referral Portal - Audit triggers and application audit events
+-- Apply after schema.sql and partitioning.sql. Safe to re-run.
+--
+-- audit_log holds the row changes recorded by the audit triggers below. The API
+-- also writes its own events to it (app/core/audit.py): logins, CSV imports,
+-- outcome status changes and access denials, which a trigger can't see or
+-- can't attribute to a request. They use the same columns, plus:
+--
+-- - vsa_id: the VSA the actor belongs to,
+-- - request_id: the X-Request-ID of the request, to join with the API logs,
+--
+-- and their own action values and table_name 'users' / 'system' (events
+-- without a row, e.g. an access denial is recorded against the route).
+
+ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS vsa_id VARCHAR(50);
+ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS request_id VARCHAR(64);
+
+ALTER TABLE audit_log DROP CONSTRAINT IF EXISTS valid_action;
+ALTER TABLE audit_log ADD CONSTRAINT valid_action CHECK (action IN (
+    'INSERT', 'UPDATE', 'DELETE',
+    'STATUS_CHANGE', 'CSV_IMPORT', 'USER_LOGIN', 'USER_LOGOUT', 'ACCESS_DENIED'
+));
+
+ALTER TABLE audit_log DROP CONSTRAINT IF EXISTS valid_table;
+ALTER TABLE audit_log ADD CONSTRAINT valid_table CHECK (table_name IN (
+    'referrals', 'outcomes', 'organizations', 'users', 'system'
+));
+
+-- changed_at is indexed with BRIN rather than a B-tree: rows arrive in
+-- changed_at order and are never updated, so each block range covers a narrow
+-- time span and the index stays a few pages per partition. pages_per_range
+-- 32 (about a thousand entries) keeps a range scan's overfetch small;
+-- autosummarize indexes new ranges as they fill instead of at the next
+-- vacuum. BRIN can't return rows in order, so GET /v1/audit reads long ranges
+-- in bounded slices (app/api/v1/endpoints/audit.py).
+DROP INDEX IF EXISTS idx_audit_log_changed_at;
+CREATE INDEX IF NOT EXISTS idx_audit_log_changed_at_brin ON audit_log USING brin (changed_at)
+    WITH (pages_per_range = 32, autosummarize = on);
+
+-- Row changes to referrals and outcomes are audited by statement-level
+-- triggers: each INSERT/UPDATE/DELETE statement writes its audit rows in one
+-- set-based INSERT from its transition table, instead of a trigger call and a
+-- single-row INSERT per row (a 100k-row CSV import is ~100 statements, not
+-- 100k trigger calls). benchmarks/audit_trigger_import.py compares the two.
+--
+-- The row-level audit_trigger_function they replace recorded referral_token
+-- as the record id for outcomes too, and on the partitioned referrals table it
+-- ran per partition, logging the partition's name (rejected by valid_table).
+-- Statement triggers on a partitioned table fire once, on the parent.
+--
+-- changed_by is app.user_id (set per transaction by the API, app/core/rls.py),
+-- or the database login when it isn't set (scripts, unauthenticated imports).
+
+CREATE OR REPLACE FUNCTION audit_changed_by()
+RETURNS VARCHAR AS $$
+    SELECT COALESCE(NULLIF(current_setting('app.user_id', true), ''), session_user)::VARCHAR;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION referrals_audit_statement_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_changed_by VARCHAR := audit_changed_by();
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by, vsa_id)
+        SELECT 'referrals', n.referral_token::VARCHAR, 'INSERT', to_jsonb(n), v_changed_by, n.vsa_id
+        FROM new_referrals n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, changed_by, vsa_id)
+        SELECT 'referrals', n.referral_token::VARCHAR, 'UPDATE', to_jsonb(o), to_jsonb(n), v_changed_by, n.vsa_id
+        FROM old_referrals o
+        JOIN new_referrals n ON n.referral_token = o.referral_token;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO audit_log (table_name, record_id, action, old_values, changed_by, vsa_id)
+        SELECT 'referrals', o.referral_token::VARCHAR, 'DELETE', to_jsonb(o), v_changed_by, o.vsa_id
+        FROM old_referrals o;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION outcomes_audit_statement_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_changed_by VARCHAR := audit_changed_by();
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by, vsa_id)
+        SELECT 'outcomes', n.id::VARCHAR, 'INSERT', to_jsonb(n), v_changed_by, n.vsa_id
+        FROM new_outcomes n;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, changed_by, vsa_id)
+        SELECT 'outcomes', n.id::VARCHAR, 'UPDATE', to_jsonb(o), to_jsonb(n), v_changed_by, n.vsa_id
+        FROM old_outcomes o
+        JOIN new_outcomes n ON n.id = o.id;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO audit_log (table_name, record_id, action, old_values, changed_by, vsa_id)
+        SELECT 'outcomes', o.id::VARCHAR, 'DELETE', to_jsonb(o), v_changed_by, o.vsa_id
+        FROM old_outcomes o;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Swap the triggers under one lock so no write goes unaudited in between.
+-- Transition tables need one trigger per event.
+BEGIN;
+LOCK TABLE referrals, outcomes IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS referrals_audit_trigger ON referrals;
+DROP TRIGGER IF EXISTS outcomes_audit_trigger ON outcomes;
+DROP FUNCTION IF EXISTS audit_trigger_function();
+
+DROP TRIGGER IF EXISTS referrals_audit_insert_trigger ON referrals;
+CREATE TRIGGER referrals_audit_insert_trigger
+    AFTER INSERT ON referrals
+    REFERENCING NEW TABLE AS new_referrals
+    FOR EACH STATEMENT EXECUTE FUNCTION referrals_audit_statement_trigger();
+
+DROP TRIGGER IF EXISTS referrals_audit_update_trigger ON referrals;
+CREATE TRIGGER referrals_audit_update_trigger
+    AFTER UPDATE ON referrals
+    REFERENCING OLD TABLE AS old_referrals NEW TABLE AS new_referrals
+    FOR EACH STATEMENT EXECUTE FUNCTION referrals_audit_statement_trigger();
+
+DROP TRIGGER IF EXISTS referrals_audit_delete_trigger ON referrals;
+CREATE TRIGGER referrals_audit_delete_trigger
+    AFTER DELETE ON referrals
+    REFERENCING OLD TABLE AS old_referrals
+    FOR EACH STATEMENT EXECUTE FUNCTION referrals_audit_statement_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_audit_insert_trigger ON outcomes;
+CREATE TRIGGER outcomes_audit_insert_trigger
+    AFTER INSERT ON outcomes
+    REFERENCING NEW TABLE AS new_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_audit_statement_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_audit_update_trigger ON outcomes;
+CREATE TRIGGER outcomes_audit_update_trigger
+    AFTER UPDATE ON outcomes
+    REFERENCING OLD TABLE AS old_outcomes NEW TABLE AS new_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_audit_statement_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_audit_delete_trigger ON outcomes;
+CREATE TRIGGER outcomes_audit_delete_trigger
+    AFTER DELETE ON outcomes
+    REFERENCING OLD TABLE AS old_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_audit_statement_trigger();
+
+COMMIT;
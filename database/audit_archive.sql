@@ -0,0 +1,42 @@
+-- Veteran Referral Portal - Audit log archive manifest
+-- Apply after audit.sql. Safe to re-run.
+--
+-- app/core/audit_archive.py moves audit_log entries older than
+-- audit_archive_after_days into write-once segment files (local disk or
+-- S3). This table lists the segments in archive order with the time range
+-- each covers, which GET /v1/audit uses to find the segments for a search,
+-- and each segment's final hash-chain value, which anchors the chain the
+-- files carry: the next segment continues from it, and
+-- `python -m app.core.audit_archive verify` checks the files against it.
+
+CREATE TABLE IF NOT EXISTS audit_archive_segments (
+    sequence INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    first_changed_at TIMESTAMPTZ NOT NULL,
+    last_changed_at TIMESTAMPTZ NOT NULL,
+    entries INTEGER NOT NULL,
+    size_bytes BIGINT NOT NULL,
+    footer_offset BIGINT NOT NULL,
+    previous_hash CHAR(64) NOT NULL,
+    hash CHAR(64) NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+
+    CONSTRAINT valid_segment_range CHECK (first_changed_at <= last_changed_at),
+    CONSTRAINT valid_segment_entries CHECK (entries > 0)
+);
+
+CREATE INDEX IF NOT EXISTS idx_audit_archive_segments_changed_at
+    ON audit_archive_segments(first_changed_at, last_changed_at);
+
+-- The manifest is append-only like the segments it describes
+CREATE OR REPLACE FUNCTION audit_archive_segments_append_only()
+RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'audit_archive_segments is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS audit_archive_segments_append_only ON audit_archive_segments;
+CREATE TRIGGER audit_archive_segments_append_only
+    BEFORE UPDATE OR DELETE ON audit_archive_segments
+    FOR EACH ROW EXECUTE FUNCTION audit_archive_segments_append_only();
@@ -0,0 +1,21 @@
+-- Veteran Referral Portal - Outcome latency sketches
+-- Apply after schema.sql. One serialized quantile sketch per
+-- (vsa_id, program_code, month, metric), maintained by the API on every outcome
+-- write (app/core/sketches.py) and merged on read for p50/p90/p99 queries.
+-- Months are the UTC month the referral was issued in.
+--
+-- Backfill or repair with:  python -m app.core.sketches --rebuild
+
+CREATE TABLE IF NOT EXISTS outcome_latency_sketches (
+    vsa_id VARCHAR(50) NOT NULL,
+    program_code program_code_enum NOT NULL,
+    month DATE NOT NULL,
+    metric VARCHAR(32) NOT NULL CHECK (metric IN ('time_to_contact', 'time_to_close')),
+    count BIGINT NOT NULL DEFAULT 0,
+    sketch BYTEA NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+
+    PRIMARY KEY (vsa_id, program_code, month, metric)
+);
+
+CREATE INDEX IF NOT EXISTS idx_outcome_latency_sketches_month ON outcome_latency_sketches(month);
@@ -0,0 +1,64 @@
+-- Veteran Referral Portal - Overdue-contact queue
+-- Apply after schema.sql. Denormalizes the first contact time onto referrals so
+-- "open and past expected_contact_date" can be served from small partial
+-- indexes that only contain referrals nobody has contacted yet, however many
+-- contacted referrals pile up in the table.
+--
+-- Assumes one outcome per referral (enforced by the API).
+
+ALTER TABLE referrals ADD COLUMN IF NOT EXISTS contacted_at TIMESTAMPTZ;
+
+-- expected_contact_date >= CURRENT_DATE is re-checked on every UPDATE, which
+-- would reject any change to a referral once it becomes overdue (including
+-- recording contact). Anchor the check to the issue date instead.
+ALTER TABLE referrals DROP CONSTRAINT IF EXISTS valid_expected_date;
+ALTER TABLE referrals ADD CONSTRAINT valid_expected_date
+    CHECK (expected_contact_date >= (issued_at AT TIME ZONE 'UTC')::DATE) NOT VALID;
+
+CREATE OR REPLACE FUNCTION referrals_sync_contacted_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Outcomes moved out by archive_expired_partitions() leave their
+    -- referral, about to be detached too, as it was
+    IF TG_OP = 'DELETE' AND current_setting('app.archiving', true) = 'on' THEN
+        RETURN OLD;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE referrals SET contacted_at = NULL
+        WHERE referral_token = OLD.referral_token
+          AND contacted_at IS NOT NULL
+          AND (TG_OP = 'DELETE' OR OLD.referral_token <> NEW.referral_token);
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE referrals SET contacted_at = NEW.first_contact_at
+        WHERE referral_token = NEW.referral_token
+          AND contacted_at IS DISTINCT FROM NEW.first_contact_at;
+        RETURN NEW;
+    END IF;
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS outcomes_contacted_at_trigger ON outcomes;
+CREATE TRIGGER outcomes_contacted_at_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF referral_token, first_contact_at ON outcomes
+    FOR EACH ROW EXECUTE FUNCTION referrals_sync_contacted_at();
+
+-- Backfill
+UPDATE referrals r SET contacted_at = o.first_contact_at
+FROM outcomes o
+WHERE o.referral_token = r.referral_token
+  AND r.contacted_at IS DISTINCT FROM o.first_contact_at;
+
+-- Queue order: most urgent first (enum order, unset counts as STANDARD), then
+-- longest overdue. Only uncontacted referrals with an expected date are indexed.
+CREATE INDEX IF NOT EXISTS idx_referrals_overdue ON referrals (
+    (COALESCE(urgency_indicator, 'STANDARD')), expected_contact_date, referral_token
+) WHERE contacted_at IS NULL AND expected_contact_date IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_referrals_vsa_overdue ON referrals (
+    vsa_id, (COALESCE(urgency_indicator, 'STANDARD')), expected_contact_date, referral_token
+) WHERE contacted_at IS NULL AND expected_contact_date IS NOT NULL;
@@ -0,0 +1,412 @@
+-- Veteran Referral Portal - Monthly range partitioning for referrals and audit_log
+-- Apply after schema.sql, referral_rollups.sql and overdue_contacts.sql: the
+-- conversion carries over every index, constraint, trigger, policy, grant and
+-- dependent view those files created. Safe to re-run; tables that are already
+-- partitioned are left alone.
+--
+-- referrals is partitioned on issued_at and audit_log on changed_at, one
+-- partition per UTC month (<table>_pYYYY_MM) plus a <table>_default catch-all.
+-- Queries bounded on those columns only touch the matching partitions.
+-- The API's partition maintenance job (app/core/partitions.py) keeps
+-- partitions created ahead of time and, when retention is configured, archives
+-- expired months by detaching them into the archive schema instead of running
+-- row-by-row DELETEs.
+--
+-- Primary keys must include the partition key, so referrals is keyed on
+-- (referral_token, issued_at) and audit_log on (id, changed_at). outcomes
+-- carries its referral's issued_at (filled in by trigger) so its foreign key
+-- can reference the partitioned table.
+--
+-- That key alone would let the same referral_token exist once per issued_at.
+-- Tokens stay globally unique through referral_tokens, a registry of
+-- (referral_token, issued_at) kept by row triggers on referrals in the
+-- writing transaction: a second referral with a known token fails with a
+-- unique violation, as it did before partitioning. Detaching a partition
+-- deletes no rows, so archived tokens stay registered and can't be reused.
+-- Limitation: lookups by token alone (the ORM's get, repository lookups)
+-- can't be pruned and probe the primary key index of every partition; the
+-- outcomes trigger resolves issued_at through the registry instead.
+
+CREATE SCHEMA IF NOT EXISTS archive;
+
+-- Partition bounds are UTC months, matching referral_rollup_month()
+CREATE OR REPLACE FUNCTION partition_month_start(p_month DATE)
+RETURNS TIMESTAMPTZ AS $$
+    SELECT date_trunc('month', p_month)::TIMESTAMP AT TIME ZONE 'UTC';
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION partition_month(p_partition REGCLASS)
+RETURNS DATE AS $$
+    SELECT to_date(substring(relname FROM '_p(\d{4}_\d{2})$'), 'YYYY_MM')
+    FROM pg_class WHERE oid = p_partition;
+$$ LANGUAGE sql STABLE;
+
+-- Create any missing monthly partitions of p_parent for the months p_from..p_to.
+-- Returns the number created; 0 if p_parent is not partitioned.
+CREATE OR REPLACE FUNCTION create_monthly_partitions(p_parent REGCLASS, p_from DATE, p_to DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    v_schema TEXT;
+    v_name TEXT;
+    v_month DATE := date_trunc('month', p_from)::DATE;
+    v_partition TEXT;
+    v_created INTEGER := 0;
+BEGIN
+    SELECT n.nspname, c.relname INTO v_schema, v_name
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = p_parent AND c.relkind = 'p';
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    WHILE v_month <= p_to LOOP
+        v_partition := format('%s_p%s', v_name, to_char(v_month, 'YYYY_MM'));
+        IF to_regclass(format('%I.%I', v_schema, v_partition)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I.%I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)',
+                v_schema, v_partition, p_parent,
+                partition_month_start(v_month), partition_month_start((v_month + INTERVAL '1 month')::DATE)
+            );
+            v_created := v_created + 1;
+        END IF;
+        v_month := (v_month + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rebuild p_table as a table partitioned by month on p_column, keeping its
+-- rows, indexes, constraints, triggers, row level security, grants and the
+-- views built on it. Foreign keys from other tables can't survive the change
+-- of primary key; the caller drops and recreates them. Returns false if
+-- p_table is already partitioned.
+CREATE OR REPLACE FUNCTION convert_to_monthly_partitions(p_table REGCLASS, p_column TEXT, p_months_ahead INTEGER)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_schema TEXT;
+    v_name TEXT;
+    v_staging TEXT;
+    v_relkind "char";
+    v_rls BOOLEAN;
+    v_force_rls BOOLEAN;
+    v_pk TEXT;
+    v_first DATE;
+    v_indexes TEXT[];
+    v_constraints TEXT[];
+    v_triggers TEXT[];
+    v_policies TEXT[];
+    v_grants TEXT[];
+    v_views RECORD;
+    v_view_defs TEXT[] := '{}';
+    v_statement TEXT;
+BEGIN
+    SELECT n.nspname, c.relname, c.relkind, c.relrowsecurity, c.relforcerowsecurity
+    INTO v_schema, v_name, v_relkind, v_rls, v_force_rls
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = p_table;
+    IF v_relkind = 'p' THEN
+        RETURN false;
+    END IF;
+    v_staging := v_name || '_partitioned';
+
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE confrelid = p_table AND contype = 'f') THEN
+        RAISE EXCEPTION '% is referenced by foreign keys; drop them before partitioning', p_table;
+    END IF;
+    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s WHERE %I IS NULL)', p_table, p_column) INTO STRICT v_statement;
+    IF v_statement::BOOLEAN THEN
+        RAISE EXCEPTION '%.% has NULL values and cannot be a partition key', p_table, p_column;
+    END IF;
+
+    -- Capture everything the rebuilt table needs. Definitions name the table
+    -- as <schema>.<name>, so they apply unchanged once the new table takes
+    -- over the name.
+    SELECT format('ALTER TABLE %s ADD PRIMARY KEY (%s)', p_table, string_agg(
+        quote_ident(a.attname), ', ' ORDER BY k.ordinality
+    ) || CASE WHEN bool_or(a.attname = p_column) THEN '' ELSE ', ' || quote_ident(p_column) END)
+    INTO v_pk
+    FROM pg_constraint con
+    CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ordinality)
+    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+    WHERE con.conrelid = p_table AND con.contype = 'p';
+
+    SELECT array_agg(pg_get_indexdef(i.indexrelid) ORDER BY i.indexrelid) INTO v_indexes
+    FROM pg_index i
+    WHERE i.indrelid = p_table
+      AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid);
+
+    SELECT array_agg(format('ALTER TABLE %s ADD CONSTRAINT %I %s', p_table, conname, pg_get_constraintdef(oid)) ORDER BY oid)
+    INTO v_constraints
+    FROM pg_constraint
+    WHERE conrelid = p_table AND contype IN ('c', 'f', 'x');
+
+    SELECT array_agg(pg_get_triggerdef(oid) ORDER BY tgname) INTO v_triggers
+    FROM pg_trigger
+    WHERE tgrelid = p_table AND NOT tgisinternal;
+
+    SELECT array_agg(format(
+        'CREATE POLICY %I ON %s AS %s FOR %s TO %s%s%s',
+        policyname, p_table, permissive, cmd,
+        (SELECT string_agg(CASE WHEN role = 'public' THEN 'PUBLIC' ELSE quote_ident(role) END, ', ') FROM unnest(roles) AS role),
+        CASE WHEN qual IS NOT NULL THEN format(' USING (%s)', qual) ELSE '' END,
+        CASE WHEN with_check IS NOT NULL THEN format(' WITH CHECK (%s)', with_check) ELSE '' END
+    ) ORDER BY policyname) INTO v_policies
+    FROM pg_policies
+    WHERE schemaname = v_schema AND tablename = v_name;
+
+    SELECT array_agg(format(
+        'GRANT %s ON %s TO %s', acl.privilege_type, p_table,
+        CASE WHEN acl.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(acl.grantee)) END
+    )) INTO v_grants
+    FROM pg_class c, aclexplode(c.relacl) AS acl
+    WHERE c.oid = p_table AND acl.grantee <> c.relowner;
+
+    -- Views and materialized views built on the table, and views built on
+    -- those, are dropped and recreated in dependency order
+    FOR v_views IN
+        WITH RECURSIVE dependents(oid, depth) AS (
+            SELECT DISTINCT r.ev_class, 1
+            FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::REGCLASS AND d.refobjid = p_table AND r.ev_class <> p_table
+            UNION
+            SELECT r.ev_class, dependents.depth + 1
+            FROM dependents
+            JOIN pg_depend d ON d.refobjid = dependents.oid
+            JOIN pg_rewrite r ON r.oid = d.objid
+            WHERE d.classid = 'pg_rewrite'::REGCLASS AND r.ev_class <> dependents.oid
+        )
+        SELECT c.oid, c.relkind, n.nspname, c.relname, max(dependents.depth) AS depth
+        FROM dependents
+        JOIN pg_class c ON c.oid = dependents.oid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        GROUP BY c.oid, c.relkind, n.nspname, c.relname
+        ORDER BY max(dependents.depth), c.oid
+    LOOP
+        v_view_defs := v_view_defs || format(
+            'CREATE %s %I.%I AS %s',
+            CASE v_views.relkind WHEN 'm' THEN 'MATERIALIZED VIEW' ELSE 'VIEW' END,
+            v_views.nspname, v_views.relname, rtrim(pg_get_viewdef(v_views.oid), ';')
+        );
+        v_view_defs := v_view_defs || ARRAY(
+            SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = v_views.oid ORDER BY indexrelid
+        );
+        v_view_defs := v_view_defs || ARRAY(
+            SELECT format(
+                'GRANT %s ON %I.%I TO %s', acl.privilege_type, v_views.nspname, v_views.relname,
+                CASE WHEN acl.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(pg_get_userbyid(acl.grantee)) END
+            )
+            FROM pg_class c, aclexplode(c.relacl) AS acl
+            WHERE c.oid = v_views.oid AND acl.grantee <> c.relowner
+        );
+    END LOOP;
+
+    -- Build the partitioned copy: a partition per month from the oldest row
+    -- through p_months_ahead months from now
+    EXECUTE format(
+        'CREATE TABLE %I.%I (LIKE %s INCLUDING DEFAULTS INCLUDING GENERATED INCLUDING IDENTITY INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE (%I)',
+        v_schema, v_staging, p_table, p_column
+    );
+    EXECUTE format('ALTER TABLE %I.%I ALTER COLUMN %I SET NOT NULL', v_schema, v_staging, p_column);
+    EXECUTE format(
+        'SELECT (min(%I) AT TIME ZONE ''UTC'')::DATE FROM %s', p_column, p_table
+    ) INTO v_first;
+    -- Partitions are named after the final table
+    EXECUTE format('ALTER TABLE %I.%I RENAME TO %I', v_schema, v_name, v_name || '_unpartitioned');
+    EXECUTE format('ALTER TABLE %I.%I RENAME TO %I', v_schema, v_staging, v_name);
+    PERFORM create_monthly_partitions(
+        format('%I.%I', v_schema, v_name)::REGCLASS,
+        COALESCE(v_first, (now() AT TIME ZONE 'UTC')::DATE),
+        ((now() AT TIME ZONE 'UTC') + make_interval(months => p_months_ahead))::DATE
+    );
+    EXECUTE format('CREATE TABLE %I.%I PARTITION OF %I.%I DEFAULT', v_schema, v_name || '_default', v_schema, v_name);
+    EXECUTE format('INSERT INTO %I.%I SELECT * FROM %I.%I', v_schema, v_name, v_schema, v_name || '_unpartitioned');
+
+    -- Swap: the old table takes its triggers, policies and views with it
+    FOR v_views IN
+        SELECT DISTINCT c.oid, c.relkind, n.nspname, c.relname
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class c ON c.oid = r.ev_class
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE d.classid = 'pg_rewrite'::REGCLASS
+          AND d.refobjid = format('%I.%I', v_schema, v_name || '_unpartitioned')::REGCLASS
+          AND c.relname <> v_name || '_unpartitioned'
+    LOOP
+        EXECUTE format(
+            'DROP %s IF EXISTS %I.%I CASCADE',
+            CASE v_views.relkind WHEN 'm' THEN 'MATERIALIZED VIEW' ELSE 'VIEW' END,
+            v_views.nspname, v_views.relname
+        );
+    END LOOP;
+    EXECUTE format('DROP TABLE %I.%I', v_schema, v_name || '_unpartitioned');
+
+    p_table := format('%I.%I', v_schema, v_name)::REGCLASS;
+    IF v_pk IS NOT NULL THEN
+        EXECUTE v_pk;
+    END IF;
+    FOREACH v_statement IN ARRAY COALESCE(v_constraints, '{}') || COALESCE(v_indexes, '{}')
+                                || COALESCE(v_triggers, '{}') || COALESCE(v_policies, '{}')
+                                || COALESCE(v_grants, '{}') || v_view_defs LOOP
+        EXECUTE v_statement;
+    END LOOP;
+    IF v_rls THEN
+        EXECUTE format('ALTER TABLE %s ENABLE ROW LEVEL SECURITY', p_table);
+    END IF;
+    IF v_force_rls THEN
+        EXECUTE format('ALTER TABLE %s FORCE ROW LEVEL SECURITY', p_table);
+    END IF;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detach the partitions of p_parent whose month ended more than p_keep_months
+-- months ago and move them into the archive schema, where they can be dumped
+-- to cold storage and dropped. Rows in tables with a foreign key to p_parent
+-- are moved alongside into archive.<table>_pYYYY_MM. The move sets
+-- app.archiving for its own statement only, which the rollup and contacted_at
+-- triggers check, so derived data such as the monthly rollups keeps the
+-- archived history while concurrent writers' triggers keep firing; the audit
+-- triggers still record the rows leaving the live tables. Returns the
+-- archived tables.
+CREATE OR REPLACE FUNCTION archive_expired_partitions(p_parent REGCLASS, p_keep_months INTEGER)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    v_partition RECORD;
+    v_reference RECORD;
+    v_cutoff DATE := (date_trunc('month', now() AT TIME ZONE 'UTC') - make_interval(months => p_keep_months))::DATE;
+    v_archived TEXT;
+BEGIN
+    FOR v_partition IN
+        SELECT c.oid::REGCLASS AS partition, c.relname, partition_month(c.oid) AS month
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = p_parent
+          AND partition_month(c.oid) IS NOT NULL
+          AND partition_month(c.oid) < v_cutoff
+        ORDER BY 3
+    LOOP
+        -- Referencing rows would block the detach
+        FOR v_reference IN
+            SELECT con.conrelid::REGCLASS AS referencing, rc.relname, ra.attname AS column_name
+            FROM pg_constraint con
+            JOIN pg_class rc ON rc.oid = con.conrelid
+            CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(attnum, refattnum)
+            JOIN pg_attribute ra ON ra.attrelid = con.conrelid AND ra.attnum = k.attnum
+            JOIN pg_partitioned_table pt ON pt.partrelid = p_parent AND k.refattnum = pt.partattrs[0]
+            WHERE con.confrelid = p_parent AND con.contype = 'f'
+        LOOP
+            v_archived := format('%s_p%s', v_reference.relname, to_char(v_partition.month, 'YYYY_MM'));
+            EXECUTE format('CREATE TABLE IF NOT EXISTS archive.%I (LIKE %s INCLUDING DEFAULTS)', v_archived, v_reference.referencing);
+            PERFORM set_config('app.archiving', 'on', true);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %s WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO archive.%I SELECT * FROM moved',
+                v_reference.referencing,
+                v_reference.column_name, partition_month_start(v_partition.month),
+                v_reference.column_name, partition_month_start((v_partition.month + INTERVAL '1 month')::DATE),
+                v_archived
+            );
+            PERFORM set_config('app.archiving', '', true);
+            RETURN NEXT 'archive.' || v_archived;
+        END LOOP;
+
+        EXECUTE format('ALTER TABLE %s DETACH PARTITION %s', p_parent, v_partition.partition);
+        EXECUTE format('ALTER TABLE %s SET SCHEMA archive', v_partition.partition);
+        RETURN NEXT 'archive.' || v_partition.relname;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+BEGIN;
+LOCK TABLE referrals, outcomes, audit_log IN ACCESS EXCLUSIVE MODE;
+
+-- outcomes reference referrals by (referral_token, issued_at)
+ALTER TABLE outcomes ADD COLUMN IF NOT EXISTS referral_issued_at TIMESTAMPTZ;
+UPDATE outcomes o SET referral_issued_at = r.issued_at
+FROM referrals r
+WHERE r.referral_token = o.referral_token
+  AND o.referral_issued_at IS DISTINCT FROM r.issued_at;
+ALTER TABLE outcomes ALTER COLUMN referral_issued_at SET NOT NULL;
+
+-- Global referral_token uniqueness (see the header)
+CREATE TABLE IF NOT EXISTS referral_tokens (
+    referral_token UUID PRIMARY KEY,
+    issued_at TIMESTAMPTZ NOT NULL
+);
+
+-- Definer rights: the registry isn't granted to the API's row-level
+-- security roles (rls.sql), only written through this trigger
+CREATE OR REPLACE FUNCTION referral_tokens_sync()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- A row moving partitions (issued_at changed to another month) fires
+    -- the DELETE and INSERT triggers instead of UPDATE
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM referral_tokens WHERE referral_token = OLD.referral_token;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        BEGIN
+            INSERT INTO referral_tokens (referral_token, issued_at) VALUES (NEW.referral_token, NEW.issued_at);
+        EXCEPTION WHEN unique_violation THEN
+            RAISE unique_violation USING
+                MESSAGE = format('referral_token %s already exists', NEW.referral_token),
+                CONSTRAINT = 'referral_tokens_pkey';
+        END;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- The registry finds the referral's partition without probing them all.
+-- A new issued_at cascading from the referral is kept: the cascade runs
+-- before the registry trigger has caught up, and the foreign key checks it.
+CREATE OR REPLACE FUNCTION outcomes_set_referral_issued_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NEW.referral_issued_at IS DISTINCT FROM OLD.referral_issued_at THEN
+        RETURN NEW;
+    END IF;
+    SELECT issued_at INTO NEW.referral_issued_at
+    FROM referral_tokens WHERE referral_token = NEW.referral_token;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS outcomes_referral_issued_at_trigger ON outcomes;
+CREATE TRIGGER outcomes_referral_issued_at_trigger
+    BEFORE INSERT OR UPDATE OF referral_token ON outcomes
+    FOR EACH ROW EXECUTE FUNCTION outcomes_set_referral_issued_at();
+
+ALTER TABLE outcomes DROP CONSTRAINT IF EXISTS outcomes_referral_token_fkey;
+SELECT convert_to_monthly_partitions('referrals', 'issued_at', 3);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'outcomes_referral_fkey') THEN
+        ALTER TABLE outcomes ADD CONSTRAINT outcomes_referral_fkey
+            FOREIGN KEY (referral_token, referral_issued_at)
+            REFERENCES referrals (referral_token, issued_at)
+            ON DELETE CASCADE ON UPDATE CASCADE;
+    END IF;
+END $$;
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM referrals GROUP BY referral_token HAVING count(*) > 1) THEN
+        RAISE EXCEPTION 'referrals has duplicate referral_token values; resolve them before registering tokens';
+    END IF;
+END $$;
+INSERT INTO referral_tokens (referral_token, issued_at)
+SELECT referral_token, issued_at FROM referrals
+ON CONFLICT (referral_token) DO NOTHING;
+
+DROP TRIGGER IF EXISTS referrals_token_registry_trigger ON referrals;
+CREATE TRIGGER referrals_token_registry_trigger
+    AFTER INSERT OR DELETE OR UPDATE OF referral_token, issued_at ON referrals
+    FOR EACH ROW EXECUTE FUNCTION referral_tokens_sync();
+
+-- Archiving a month of referrals moves its outcomes by this column
+CREATE INDEX IF NOT EXISTS idx_outcomes_referral_issued_at ON outcomes(referral_issued_at);
+
+SELECT convert_to_monthly_partitions('audit_log', 'changed_at', 3);
+
+COMMIT;
+
+ANALYZE referrals;
+ANALYZE audit_log;
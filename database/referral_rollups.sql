@@ -0,0 +1,275 @@
+-- Veteran Referral Portal - Incrementally maintained referral rollups
+-- Apply after schema.sql. Keeps per (vsa_id, program_code, priority_level, month)
+-- counters current in the same transaction as every referral/outcome write, so
+-- stats can be read in O(groups) instead of re-aggregating all history.
+--
+-- Assumes one outcome per referral (enforced by the API). Months are UTC.
+
+CREATE TABLE IF NOT EXISTS referral_rollup_monthly (
+    vsa_id VARCHAR(50) NOT NULL,
+    program_code program_code_enum NOT NULL,
+    priority_level priority_level_enum NOT NULL,
+    month DATE NOT NULL,
+    total_referrals BIGINT NOT NULL DEFAULT 0,
+    received_count BIGINT NOT NULL DEFAULT 0,
+    engaged_count BIGINT NOT NULL DEFAULT 0,
+    waitlist_count BIGINT NOT NULL DEFAULT 0,
+    completed_count BIGINT NOT NULL DEFAULT 0,
+    unreachable_count BIGINT NOT NULL DEFAULT 0,
+    declined_count BIGINT NOT NULL DEFAULT 0,
+    contacted_count BIGINT NOT NULL DEFAULT 0,
+    hours_to_contact_sum NUMERIC NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+
+    PRIMARY KEY (vsa_id, month, program_code, priority_level)
+);
+
+CREATE INDEX IF NOT EXISTS idx_referral_rollup_month ON referral_rollup_monthly(month);
+
+-- One signed contribution to the rollup. referral_delta moves total_referrals;
+-- outcome_delta moves the status/contact counters for (status, first_contact_at).
+DO $$ BEGIN
+    CREATE TYPE referral_rollup_delta AS (
+        vsa_id VARCHAR(50),
+        program_code program_code_enum,
+        priority_level priority_level_enum,
+        issued_at TIMESTAMPTZ,
+        referral_delta INTEGER,
+        status outcome_status_enum,
+        first_contact_at TIMESTAMPTZ,
+        outcome_delta INTEGER
+    );
+EXCEPTION
+    WHEN duplicate_object THEN null;
+END $$;
+
+CREATE OR REPLACE FUNCTION referral_rollup_month(p_issued_at TIMESTAMPTZ)
+RETURNS DATE AS $$
+    SELECT DATE_TRUNC('month', p_issued_at AT TIME ZONE 'UTC')::DATE;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Fold a batch of deltas into the rollup with one grouped upsert. Rows are
+-- upserted in primary key order so concurrent writers touching the same
+-- groups lock them in the same order and can't deadlock.
+CREATE OR REPLACE FUNCTION referral_rollup_apply(p_deltas referral_rollup_delta[])
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO referral_rollup_monthly AS rollup (
+        vsa_id, program_code, priority_level, month,
+        total_referrals, received_count, engaged_count, waitlist_count,
+        completed_count, unreachable_count, declined_count,
+        contacted_count, hours_to_contact_sum
+    )
+    SELECT
+        d.vsa_id,
+        d.program_code,
+        d.priority_level,
+        referral_rollup_month(d.issued_at),
+        COALESCE(SUM(d.referral_delta), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'RECEIVED'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'ENGAGED'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'WAITLIST'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'COMPLETED'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'UNREACHABLE'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.status = 'DECLINED'), 0),
+        COALESCE(SUM(d.outcome_delta) FILTER (WHERE d.first_contact_at IS NOT NULL), 0),
+        COALESCE(SUM(d.outcome_delta * EXTRACT(EPOCH FROM (d.first_contact_at - d.issued_at)) / 3600)
+                 FILTER (WHERE d.first_contact_at IS NOT NULL), 0)
+    FROM unnest(p_deltas) AS d
+    GROUP BY d.vsa_id, d.program_code, d.priority_level, referral_rollup_month(d.issued_at)
+    ORDER BY d.vsa_id, referral_rollup_month(d.issued_at), d.program_code, d.priority_level
+    ON CONFLICT (vsa_id, month, program_code, priority_level) DO UPDATE SET
+        total_referrals = rollup.total_referrals + EXCLUDED.total_referrals,
+        received_count = rollup.received_count + EXCLUDED.received_count,
+        engaged_count = rollup.engaged_count + EXCLUDED.engaged_count,
+        waitlist_count = rollup.waitlist_count + EXCLUDED.waitlist_count,
+        completed_count = rollup.completed_count + EXCLUDED.completed_count,
+        unreachable_count = rollup.unreachable_count + EXCLUDED.unreachable_count,
+        declined_count = rollup.declined_count + EXCLUDED.declined_count,
+        contacted_count = rollup.contacted_count + EXCLUDED.contacted_count,
+        hours_to_contact_sum = rollup.hours_to_contact_sum + EXCLUDED.hours_to_contact_sum,
+        updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Referral inserts and key changes are handled per statement, so a CSV import
+-- costs one upsert per touched group rather than one per row
+CREATE OR REPLACE FUNCTION referrals_rollup_statement_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM referral_rollup_apply(ARRAY(
+            SELECT ROW(n.vsa_id, n.program_code, n.priority_level, n.issued_at, 1, NULL, NULL, 0)::referral_rollup_delta
+            FROM new_referrals n
+        ));
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Move the referral and its outcome from the old group to the new one.
+        -- Any new issued_at counts, even within the month: it changes the time to contact.
+        PERFORM referral_rollup_apply(ARRAY(
+            SELECT ROW(o.vsa_id, o.program_code, o.priority_level, o.issued_at, -1, out.status, out.first_contact_at,
+                       CASE WHEN out.id IS NULL THEN 0 ELSE -1 END)::referral_rollup_delta
+            FROM old_referrals o
+            JOIN new_referrals n ON n.referral_token = o.referral_token
+            LEFT JOIN outcomes out ON out.referral_token = o.referral_token
+            WHERE (o.vsa_id, o.program_code, o.priority_level, o.issued_at)
+                IS DISTINCT FROM (n.vsa_id, n.program_code, n.priority_level, n.issued_at)
+            UNION ALL
+            SELECT ROW(n.vsa_id, n.program_code, n.priority_level, n.issued_at, 1, out.status, out.first_contact_at,
+                       CASE WHEN out.id IS NULL THEN 0 ELSE 1 END)::referral_rollup_delta
+            FROM old_referrals o
+            JOIN new_referrals n ON n.referral_token = o.referral_token
+            LEFT JOIN outcomes out ON out.referral_token = n.referral_token
+            WHERE (o.vsa_id, o.program_code, o.priority_level, o.issued_at)
+                IS DISTINCT FROM (n.vsa_id, n.program_code, n.priority_level, n.issued_at)
+        ));
+        PERFORM set_config('app.rollup_moving_referral', '', true);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Once referrals is partitioned by month (partitioning.sql), a new issued_at
+-- can move the row to another partition, which Postgres runs as a DELETE
+-- firing the row delete trigger below. The update trigger above already
+-- moves the referral between groups, so mark it for the delete trigger to skip.
+CREATE OR REPLACE FUNCTION referrals_rollup_move_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM set_config('app.rollup_moving_referral', OLD.referral_token::TEXT, true);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deletes run BEFORE the row goes away so the outcome (removed by ON DELETE
+-- CASCADE, after which it can no longer be joined to its group) is still visible
+CREATE OR REPLACE FUNCTION referrals_rollup_delete_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('app.rollup_moving_referral', true) = OLD.referral_token::TEXT THEN
+        RETURN OLD;
+    END IF;
+    PERFORM referral_rollup_apply(ARRAY(
+        SELECT ROW(OLD.vsa_id, OLD.program_code, OLD.priority_level, OLD.issued_at, -1, NULL, NULL, 0)::referral_rollup_delta
+        UNION ALL
+        SELECT ROW(OLD.vsa_id, OLD.program_code, OLD.priority_level, OLD.issued_at, 0, out.status, out.first_contact_at, -1)::referral_rollup_delta
+        FROM outcomes out
+        WHERE out.referral_token = OLD.referral_token
+    ));
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION outcomes_rollup_statement_trigger()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM referral_rollup_apply(ARRAY(
+            SELECT ROW(r.vsa_id, r.program_code, r.priority_level, r.issued_at, 0, n.status, n.first_contact_at, 1)::referral_rollup_delta
+            FROM new_outcomes n
+            JOIN referrals r ON r.referral_token = n.referral_token
+        ));
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- Only rows whose rollup contribution actually changed
+        PERFORM referral_rollup_apply(ARRAY(
+            SELECT ROW(r.vsa_id, r.program_code, r.priority_level, r.issued_at, 0, d.status, d.first_contact_at, d.sign)::referral_rollup_delta
+            FROM (
+                SELECT o.referral_token, o.status, o.first_contact_at, -1 AS sign
+                FROM old_outcomes o JOIN new_outcomes n ON n.id = o.id
+                WHERE (o.referral_token, o.status, o.first_contact_at) IS DISTINCT FROM (n.referral_token, n.status, n.first_contact_at)
+                UNION ALL
+                SELECT n.referral_token, n.status, n.first_contact_at, 1 AS sign
+                FROM old_outcomes o JOIN new_outcomes n ON n.id = o.id
+                WHERE (o.referral_token, o.status, o.first_contact_at) IS DISTINCT FROM (n.referral_token, n.status, n.first_contact_at)
+            ) d
+            JOIN referrals r ON r.referral_token = d.referral_token
+        ));
+    ELSIF TG_OP = 'DELETE' AND current_setting('app.archiving', true) IS DISTINCT FROM 'on' THEN
+        -- Cascaded deletes find no referral and were already handled by its delete trigger.
+        -- Outcomes moved out by archive_expired_partitions() stay counted.
+        PERFORM referral_rollup_apply(ARRAY(
+            SELECT ROW(r.vsa_id, r.program_code, r.priority_level, r.issued_at, 0, o.status, o.first_contact_at, -1)::referral_rollup_delta
+            FROM old_outcomes o
+            JOIN referrals r ON r.referral_token = o.referral_token
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Install the triggers and backfill under one lock so no write slips between them
+BEGIN;
+LOCK TABLE referrals, outcomes IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS referrals_rollup_insert_trigger ON referrals;
+CREATE TRIGGER referrals_rollup_insert_trigger
+    AFTER INSERT ON referrals
+    REFERENCING NEW TABLE AS new_referrals
+    FOR EACH STATEMENT EXECUTE FUNCTION referrals_rollup_statement_trigger();
+
+DROP TRIGGER IF EXISTS referrals_rollup_update_trigger ON referrals;
+CREATE TRIGGER referrals_rollup_update_trigger
+    AFTER UPDATE ON referrals
+    REFERENCING OLD TABLE AS old_referrals NEW TABLE AS new_referrals
+    FOR EACH STATEMENT EXECUTE FUNCTION referrals_rollup_statement_trigger();
+
+DROP TRIGGER IF EXISTS referrals_rollup_move_trigger ON referrals;
+CREATE TRIGGER referrals_rollup_move_trigger
+    BEFORE UPDATE OF issued_at ON referrals
+    FOR EACH ROW WHEN (OLD.issued_at IS DISTINCT FROM NEW.issued_at)
+    EXECUTE FUNCTION referrals_rollup_move_trigger();
+
+DROP TRIGGER IF EXISTS referrals_rollup_delete_trigger ON referrals;
+CREATE TRIGGER referrals_rollup_delete_trigger
+    BEFORE DELETE ON referrals
+    FOR EACH ROW EXECUTE FUNCTION referrals_rollup_delete_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_rollup_insert_trigger ON outcomes;
+CREATE TRIGGER outcomes_rollup_insert_trigger
+    AFTER INSERT ON outcomes
+    REFERENCING NEW TABLE AS new_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_rollup_statement_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_rollup_update_trigger ON outcomes;
+CREATE TRIGGER outcomes_rollup_update_trigger
+    AFTER UPDATE ON outcomes
+    REFERENCING OLD TABLE AS old_outcomes NEW TABLE AS new_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_rollup_statement_trigger();
+
+DROP TRIGGER IF EXISTS outcomes_rollup_delete_trigger ON outcomes;
+CREATE TRIGGER outcomes_rollup_delete_trigger
+    AFTER DELETE ON outcomes
+    REFERENCING OLD TABLE AS old_outcomes
+    FOR EACH STATEMENT EXECUTE FUNCTION outcomes_rollup_statement_trigger();
+
+-- Full recompute from base tables, used by the backfill and the reconciliation job
+CREATE OR REPLACE VIEW referral_rollup_recomputed AS
+SELECT
+    r.vsa_id,
+    r.program_code,
+    r.priority_level,
+    referral_rollup_month(r.issued_at) AS month,
+    COUNT(DISTINCT r.referral_token) AS total_referrals,
+    COUNT(out.id) FILTER (WHERE out.status = 'RECEIVED') AS received_count,
+    COUNT(out.id) FILTER (WHERE out.status = 'ENGAGED') AS engaged_count,
+    COUNT(out.id) FILTER (WHERE out.status = 'WAITLIST') AS waitlist_count,
+    COUNT(out.id) FILTER (WHERE out.status = 'COMPLETED') AS completed_count,
+    COUNT(out.id) FILTER (WHERE out.status = 'UNREACHABLE') AS unreachable_count,
+    COUNT(out.id) FILTER (WHERE out.status = 'DECLINED') AS declined_count,
+    COUNT(out.id) FILTER (WHERE out.first_contact_at IS NOT NULL) AS contacted_count,
+    COALESCE(SUM(EXTRACT(EPOCH FROM (out.first_contact_at - r.issued_at)) / 3600)
+             FILTER (WHERE out.first_contact_at IS NOT NULL), 0) AS hours_to_contact_sum
+FROM referrals r
+LEFT JOIN outcomes out ON out.referral_token = r.referral_token
+GROUP BY r.vsa_id, r.program_code, r.priority_level, referral_rollup_month(r.issued_at);
+
+-- Backfill existing history
+DELETE FROM referral_rollup_monthly;
+INSERT INTO referral_rollup_monthly (
+    vsa_id, program_code, priority_level, month,
+    total_referrals, received_count, engaged_count, waitlist_count,
+    completed_count, unreachable_count, declined_count,
+    contacted_count, hours_to_contact_sum
+)
+SELECT * FROM referral_rollup_recomputed;
+
+COMMIT;
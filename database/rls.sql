@@ -0,0 +1,115 @@
+-- Veteran Referral Portal - Row-level security roles and policy fixes
+-- Apply after schema.sql and partitioning.sql. Safe to re-run; re-run it after
+-- adding tables so the access roles are granted on them.
+--
+-- The API sets app.vsa_id, app.user_id and app.user_role with SET LOCAL at
+-- the start of each request transaction (app/core/rls.py). This file makes
+-- the policies that read them usable:
+--
+-- - The va_access policies compared app.user_role to 'va_admin', but the API's
+--   roles are upper case (VA_ADMIN), so VA admins matched no rows.
+-- - Policies never apply to a table's owner, which is what the API normally
+--   logs in as. vrp_vsa_access and vrp_va_access are non-owner roles the API
+--   switches to per transaction (rls_roles_enabled), so the policies hold
+--   whatever the login.
+--
+-- Plan review. Permissive policies are OR'ed into one filter no index can
+-- serve, and a query's own conditions may only be evaluated before it (i.e.
+-- used as index conditions) if they are leakproof. Text, uuid and timestamp
+-- comparisons are; enum comparisons are not. So under the policies:
+--
+-- - VSA users' queries stay index-backed because the API still filters on
+--   vsa_id itself (text equality, leakproof): the vsa_id indexes serve that
+--   condition and the policy is a cheap recheck of the rows found. Keep those
+--   filters in the endpoints.
+-- - Without a role, a VA admin's enum-only filters (priority, crisis type,
+--   urgency, program) fall back to seq scans. vrp_va_access therefore gets a
+--   USING (true) policy: OR'ed with the others it folds to true at plan time
+--   and the policy filter disappears, so VA admin queries plan exactly as
+--   without RLS.
+--
+-- benchmarks/rls_overhead.py measures the hot listing queries with and without
+-- the policies and fails on any seq scan.
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'vrp_vsa_access') THEN
+        CREATE ROLE vrp_vsa_access NOLOGIN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'vrp_va_access') THEN
+        CREATE ROLE vrp_va_access NOLOGIN;
+    END IF;
+END $$;
+
+-- The API's login must be a member to SET ROLE; grant it as well if the API
+-- logs in as someone other than whoever runs this file
+GRANT vrp_vsa_access, vrp_va_access TO CURRENT_USER;
+
+GRANT USAGE ON SCHEMA public TO vrp_vsa_access, vrp_va_access;
+GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA public TO vrp_vsa_access, vrp_va_access;
+
+-- Tables and views, but not partitions: those are reached through their parent,
+-- whose policies don't apply to a partition queried directly
+DO $$
+DECLARE
+    v_table REGCLASS;
+BEGIN
+    FOR v_table IN
+        SELECT c.oid::REGCLASS
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public'
+          AND c.relkind IN ('r', 'p', 'v', 'm')
+          AND NOT c.relispartition
+    LOOP
+        EXECUTE format('GRANT SELECT, INSERT, UPDATE, DELETE ON %s TO vrp_vsa_access, vrp_va_access', v_table);
+    END LOOP;
+
+    FOR v_table IN
+        SELECT c.oid::REGCLASS
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND c.relispartition
+    LOOP
+        EXECUTE format('REVOKE ALL ON %s FROM vrp_vsa_access, vrp_va_access', v_table);
+    END LOOP;
+
+    -- Every VSA's tokens; maintained by definer-rights triggers (partitioning.sql)
+    IF to_regclass('referral_tokens') IS NOT NULL THEN
+        REVOKE ALL ON referral_tokens FROM vrp_vsa_access, vrp_va_access;
+    END IF;
+END $$;
+
+DROP POLICY IF EXISTS referrals_va_access ON referrals;
+CREATE POLICY referrals_va_access ON referrals
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
+DROP POLICY IF EXISTS referrals_va_role ON referrals;
+CREATE POLICY referrals_va_role ON referrals
+    FOR ALL TO vrp_va_access USING (true);
+
+DROP POLICY IF EXISTS outcomes_va_access ON outcomes;
+CREATE POLICY outcomes_va_access ON outcomes
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
+DROP POLICY IF EXISTS outcomes_va_role ON outcomes;
+CREATE POLICY outcomes_va_role ON outcomes
+    FOR ALL TO vrp_va_access USING (true);
+
+DROP POLICY IF EXISTS organizations_va_access ON organizations;
+CREATE POLICY organizations_va_access ON organizations
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
+DROP POLICY IF EXISTS organizations_va_role ON organizations;
+CREATE POLICY organizations_va_role ON organizations
+    FOR ALL TO vrp_va_access USING (true);
+
+-- Session-level settings outlive the transaction and would follow a pooled
+-- connection to its next user; scope them to the transaction like the API does
+CREATE OR REPLACE FUNCTION set_app_context(
+    p_vsa_id VARCHAR(50),
+    p_user_id VARCHAR(100),
+    p_user_role VARCHAR(50)
+)
+RETURNS VOID AS $$
+BEGIN
+    PERFORM set_config('app.vsa_id', p_vsa_id, true);
+    PERFORM set_config('app.user_id', p_user_id, true);
+    PERFORM set_config('app.user_role', p_user_role, true);
+END;
+$$ LANGUAGE plpgsql;
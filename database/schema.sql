@@ -166,6 +166,7 @@ CREATE INDEX idx_referrals_program_code ON referrals(program_code);
 CREATE INDEX idx_referrals_issued_at ON referrals(issued_at);
 CREATE INDEX idx_referrals_priority_level ON referrals(priority_level);
 CREATE INDEX idx_referrals_crisis_type ON referrals(crisis_type);
+CREATE INDEX idx_referrals_urgency_indicator ON referrals(urgency_indicator);
 
 CREATE INDEX idx_outcomes_referral_token ON outcomes(referral_token);
 CREATE INDEX idx_outcomes_vsa_id ON outcomes(vsa_id);
@@ -173,11 +174,15 @@ CREATE INDEX idx_outcomes_status ON outcomes(status);
 CREATE INDEX idx_outcomes_updated_at ON outcomes(updated_at);
 
 CREATE INDEX idx_audit_log_table_record ON audit_log(table_name, record_id);
-CREATE INDEX idx_audit_log_changed_at ON audit_log(changed_at);
+-- audit_log is append-only and written in time order, so a BRIN index keeps
+-- changed_at ranges cheap at a fraction of a B-tree's size (see audit.sql)
+CREATE INDEX idx_audit_log_changed_at_brin ON audit_log USING brin (changed_at)
+    WITH (pages_per_range = 32, autosummarize = on);
 CREATE INDEX idx_audit_log_action ON audit_log(action);
 
 -- Create composite indexes for common queries
-CREATE INDEX idx_referrals_vsa_date ON referrals(vsa_id, issued_at);
+-- referral_token is the listing tie-breaker, so (vsa_id, issued_at range) pages come straight off the index
+CREATE INDEX idx_referrals_vsa_date ON referrals(vsa_id, issued_at, referral_token);
 CREATE INDEX idx_outcomes_vsa_status ON outcomes(vsa_id, status);
 
 -- Enable Row Level Security
@@ -190,51 +195,23 @@ CREATE POLICY referrals_vsa_isolation ON referrals
     FOR ALL USING (vsa_id = current_setting('app.vsa_id', true));
 
 CREATE POLICY referrals_va_access ON referrals
-    FOR ALL USING (current_setting('app.user_role', true) = 'va_admin');
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
 
 -- RLS Policies for outcomes table
 CREATE POLICY outcomes_vsa_isolation ON outcomes
     FOR ALL USING (vsa_id = current_setting('app.vsa_id', true));
 
 CREATE POLICY outcomes_va_access ON outcomes
-    FOR ALL USING (current_setting('app.user_role', true) = 'va_admin');
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
 
 -- RLS Policies for organizations table
 CREATE POLICY organizations_vsa_own ON organizations
     FOR ALL USING (id = current_setting('app.vsa_id', true));
 
 CREATE POLICY organizations_va_access ON organizations
-    FOR ALL USING (current_setting('app.user_role', true) = 'va_admin');
+    FOR ALL USING (current_setting('app.user_role', true) = 'VA_ADMIN');
 
--- Create functions for audit logging
-CREATE OR REPLACE FUNCTION audit_trigger_function()
-RETURNS TRIGGER AS $$
-BEGIN
-    IF TG_OP = 'INSERT' THEN
-        INSERT INTO audit_log (table_name, record_id, action, new_values, changed_by)
-        VALUES (TG_TABLE_NAME, NEW.referral_token::VARCHAR, 'INSERT', to_jsonb(NEW), current_setting('app.user_id', true));
-        RETURN NEW;
-    ELSIF TG_OP = 'UPDATE' THEN
-        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, changed_by)
-        VALUES (TG_TABLE_NAME, NEW.referral_token::VARCHAR, 'UPDATE', to_jsonb(OLD), to_jsonb(NEW), current_setting('app.user_id', true));
-        RETURN NEW;
-    ELSIF TG_OP = 'DELETE' THEN
-        INSERT INTO audit_log (table_name, record_id, action, old_values, changed_by)
-        VALUES (TG_TABLE_NAME, OLD.referral_token::VARCHAR, 'DELETE', to_jsonb(OLD), current_setting('app.user_id', true));
-        RETURN OLD;
-    END IF;
-    RETURN NULL;
-END;
-$$ LANGUAGE plpgsql;
-
--- Create audit triggers
-CREATE TRIGGER referrals_audit_trigger
-    AFTER INSERT OR UPDATE OR DELETE ON referrals
-    FOR EACH ROW EXECUTE FUNCTION audit_trigger_function();
-
-CREATE TRIGGER outcomes_audit_trigger
-    AFTER INSERT OR UPDATE OR DELETE ON outcomes
-    FOR EACH ROW EXECUTE FUNCTION audit_trigger_function();
+-- Audit triggers (statement-level, writing audit_log): see audit.sql
 
 -- Create function to set application context
 CREATE OR REPLACE FUNCTION set_app_context(
@@ -244,9 +221,9 @@ CREATE OR REPLACE FUNCTION set_app_context(
 )
 RETURNS VOID AS $$
 BEGIN
-    PERFORM set_config('app.vsa_id', p_vsa_id, false);
-    PERFORM set_config('app.user_id', p_user_id, false);
-    PERFORM set_config('app.user_role', p_user_role, false);
+    PERFORM set_config('app.vsa_id', p_vsa_id, true);
+    PERFORM set_config('app.user_id', p_user_id, true);
+    PERFORM set_config('app.user_role', p_user_role, true);
 END;
 $$ LANGUAGE plpgsql;
 
@@ -279,16 +256,16 @@ LEFT JOIN LATERAL (
     ORDER BY referral_token, updated_at DESC
 ) out ON true;
 
--- Create materialized view for reporting (refresh as needed)
+-- Create materialized view for reporting (refreshed on a schedule by the API)
 CREATE MATERIALIZED VIEW referral_analytics AS
 SELECT 
-    vsa_id,
-    program_code,
-    referral_type,
-    priority_level,
-    crisis_type,
-    urgency_indicator,
-    DATE_TRUNC('month', issued_at) as month,
+    r.vsa_id,
+    r.program_code,
+    r.referral_type,
+    r.priority_level,
+    r.crisis_type,
+    r.urgency_indicator,
+    DATE_TRUNC('month', r.issued_at) as month,
     COUNT(*) as total_referrals,
     COUNT(CASE WHEN out.status = 'ENGAGED' THEN 1 END) as engaged_count,
     COUNT(CASE WHEN out.status = 'COMPLETED' THEN 1 END) as completed_count,
@@ -301,11 +278,24 @@ LEFT JOIN LATERAL (
     WHERE referral_token = r.referral_token
     ORDER BY referral_token, updated_at DESC
 ) out ON true
-GROUP BY vsa_id, program_code, referral_type, priority_level, crisis_type, urgency_indicator, DATE_TRUNC('month', issued_at);
+GROUP BY r.vsa_id, r.program_code, r.referral_type, r.priority_level, r.crisis_type, r.urgency_indicator, DATE_TRUNC('month', r.issued_at);
 
 -- Create index on materialized view
 CREATE INDEX idx_referral_analytics_lookup ON referral_analytics(vsa_id, month, program_code);
 
+-- REFRESH ... CONCURRENTLY needs a unique index over the full group key
+-- (crisis_type/urgency_indicator are nullable, hence NULLS NOT DISTINCT)
+CREATE UNIQUE INDEX idx_referral_analytics_group ON referral_analytics(
+    vsa_id, month, program_code, referral_type, priority_level, crisis_type, urgency_indicator
+) NULLS NOT DISTINCT;
+
+-- Track when each materialized view was last refreshed (served as "as_of")
+CREATE TABLE materialized_view_refreshes (
+    view_name VARCHAR(100) PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    duration_ms INTEGER
+);
+
 -- Grant permissions (adjust based on your user setup)
 -- GRANT USAGE ON SCHEMA public TO vrp_app_user;
 -- GRANT SELECT, INSERT, UPDATE ON ALL TABLES IN SCHEMA public TO vrp_app_user;
@@ -319,10 +309,27 @@ INSERT INTO organizations (id, name, organization_type, contact_email, contact_p
 ('VSA004', 'Georgia Veterans Employment Network', 'NONPROFIT', 'jobs@gavetsjobs.org', '+15551234570', '321 Career Drive', 'Atlanta', 'GA', '30304', 'Fulton', ARRAY['Fulton', 'DeKalb', 'Cobb'], ARRAY['EMPLOYMENT', 'BENEFITS_NAVIGATION'], 25, 500);
 
 -- Create function to refresh materialized view
-CREATE OR REPLACE FUNCTION refresh_referral_analytics()
-RETURNS VOID AS $$
+-- CONCURRENTLY keeps the view readable during the refresh; the plain form
+-- is needed only for the very first population of an empty view
+CREATE OR REPLACE FUNCTION refresh_referral_analytics(p_concurrently BOOLEAN DEFAULT TRUE)
+RETURNS TIMESTAMPTZ AS $$
+DECLARE
+    v_started TIMESTAMPTZ := clock_timestamp();
 BEGIN
-    REFRESH MATERIALIZED VIEW referral_analytics;
+    IF p_concurrently THEN
+        REFRESH MATERIALIZED VIEW CONCURRENTLY referral_analytics;
+    ELSE
+        REFRESH MATERIALIZED VIEW referral_analytics;
+    END IF;
+
+    -- The refresh reads the base tables as of the transaction snapshot
+    INSERT INTO materialized_view_refreshes (view_name, refreshed_at, duration_ms)
+    VALUES ('referral_analytics', NOW(), EXTRACT(EPOCH FROM clock_timestamp() - v_started) * 1000)
+    ON CONFLICT (view_name) DO UPDATE SET
+        refreshed_at = EXCLUDED.refreshed_at,
+        duration_ms = EXCLUDED.duration_ms;
+
+    RETURN NOW();
 END;
 $$ LANGUAGE plpgsql;
 
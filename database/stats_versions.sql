@@ -0,0 +1,16 @@
+-- Veteran Referral Portal - Stats cache versions
+-- Apply after schema.sql. Safe to re-run.
+--
+-- One counter per VSA, advanced by the API in the same transaction as every
+-- referral or outcome write (app/core/cache.py). Cached stats remember the
+-- version they were computed against, so a write made through any worker
+-- retires every worker's cached results for that VSA; results spanning all
+-- VSAs compare against the sum of the counters. Reads take the version from
+-- the database that serves the stats, so a replica that hasn't replayed a
+-- write yet reports the old version along with the old numbers.
+
+CREATE TABLE IF NOT EXISTS stats_versions (
+    vsa_id VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
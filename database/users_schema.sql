@@ -9,6 +9,7 @@ CREATE TABLE IF NOT EXISTS users (
     vsa_id VARCHAR(50) REFERENCES organizations(id),
     is_active BOOLEAN DEFAULT TRUE,
     is_verified BOOLEAN DEFAULT FALSE,
+    token_version INTEGER NOT NULL DEFAULT 0,
     phone VARCHAR(50),
     position VARCHAR(100),
     department VARCHAR(100),
@@ -24,6 +25,9 @@ EXCEPTION
     WHEN duplicate_object THEN null;
 END $$;
 
+-- Access tokens carry this version; bumping it revokes the user's existing tokens
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+
 -- Create indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
@@ -85,6 +85,30 @@ print_status "Database connection successful!"
 print_status "Initializing database schema..."
 psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -f database/schema.sql
 
+print_status "Installing referral rollup triggers..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/referral_rollups.sql
+
+print_status "Creating outcome latency sketches..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/latency_sketches.sql
+
+print_status "Creating stats cache versions..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/stats_versions.sql
+
+print_status "Installing overdue-contact queue..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/overdue_contacts.sql
+
+print_status "Partitioning referrals and audit_log by month..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/partitioning.sql
+
+print_status "Installing audit triggers and application audit event columns..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/audit.sql
+
+print_status "Creating audit log archive manifest..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/audit_archive.sql
+
+print_status "Setting up row-level security roles..."
+psql -h "$DB_ENDPOINT" -U "$DB_USERNAME" -d "$DB_NAME" -p "$DB_PORT" -v ON_ERROR_STOP=1 -f database/rls.sql
+
 print_status "Database schema initialized successfully!"
 
 # Verify tables were created